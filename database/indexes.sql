@@ -25,6 +25,10 @@ CREATE SPATIAL INDEX idx_positions_location
 ON agv_positions(location);
 
 -- Covering indexes for common queries
+CREATE INDEX idx_positions_covering_zone_occupancy
+ON agv_positions(ts, zone_id, agv_id, speed_mps)
+COMMENT 'Covering index for the zone occupancy refresh';
+
 CREATE INDEX idx_positions_covering_trajectory
 ON agv_positions(agv_id, ts, plant_x, plant_y, heading_deg, speed_mps)
 COMMENT 'Covering index for trajectory queries';
@@ -48,6 +52,10 @@ CREATE INDEX idx_zone_occupancy_history
 ON zone_occupancy_log(zone_id, entered_at DESC)
 COMMENT 'For zone history queries';
 
+CREATE INDEX idx_zones_type
+ON plant_zones(zone_type, zone_id)
+COMMENT 'For downtime joins on maintenance/charging zones';
+
 -- Task management indexes
 CREATE INDEX idx_tasks_active
 ON agv_tasks(status, priority DESC, created_at)
@@ -323,6 +323,88 @@ BEGIN
         ROUND(v_total_tasks / 24.0, 2) AS tasks_per_hour;
 END$$
 
+-- Refresh 5-minute fleet snapshot buckets from p_since onward
+CREATE PROCEDURE RefreshFleetSnapshot(
+    IN p_since DATETIME
+)
+BEGIN
+    DECLARE v_bucket_start DATETIME;
+    
+    -- Align to a bucket boundary so the oldest rebuilt bucket is complete.
+    -- The current bucket is still open: it is written with the samples so
+    -- far and overwritten by the next run.
+    SET v_bucket_start = FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(p_since) / 300) * 300);
+    
+    INSERT INTO fleet_snapshot_5min (
+        ts_bucket, agv_id, avg_speed, moving_sec, idle_sec,
+        dist_m, last_battery, status
+    )
+    SELECT
+        ts_bucket,
+        agv_id,
+        AVG(speed_mps) AS avg_speed,
+        SUM(CASE WHEN speed_mps >= 0.1 THEN 1 ELSE 0 END) / 3 AS moving_sec,
+        SUM(CASE WHEN speed_mps < 0.1 THEN 1 ELSE 0 END) / 3 AS idle_sec,
+        COALESCE(SUM(step_m), 0) AS dist_m,
+        MAX(CASE WHEN rn = 1 THEN battery_percent END) AS last_battery,
+        MAX(CASE WHEN rn = 1 THEN status END) AS status
+    FROM (
+        SELECT
+            agv_id,
+            FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(ts) / 300) * 300) AS ts_bucket,
+            speed_mps,
+            battery_percent,
+            status,
+            SQRT(
+                POW(plant_x - LAG(plant_x) OVER w, 2) +
+                POW(plant_y - LAG(plant_y) OVER w, 2)
+            ) AS step_m,
+            ROW_NUMBER() OVER (
+                PARTITION BY agv_id, FLOOR(UNIX_TIMESTAMP(ts) / 300)
+                ORDER BY ts DESC
+            ) AS rn
+        FROM agv_positions
+        -- One bucket of margin gives LAG() the sample before each AGV's
+        -- first one in v_bucket_start; the margin bucket is not written
+        WHERE ts >= v_bucket_start - INTERVAL 5 MINUTE
+        WINDOW w AS (PARTITION BY agv_id ORDER BY ts)
+    ) samples
+    WHERE ts_bucket >= v_bucket_start
+    GROUP BY ts_bucket, agv_id
+    ON DUPLICATE KEY UPDATE
+        avg_speed = VALUES(avg_speed),
+        moving_sec = VALUES(moving_sec),
+        idle_sec = VALUES(idle_sec),
+        dist_m = VALUES(dist_m),
+        last_battery = VALUES(last_battery),
+        status = VALUES(status);
+    
+    -- Snapshots follow the raw position retention
+    DELETE FROM fleet_snapshot_5min
+    WHERE ts_bucket < NOW() - INTERVAL 90 DAY;
+END$$
+
+-- Rebuild trailing-hour zone occupancy
+CREATE PROCEDURE RefreshZoneOccupancy()
+BEGIN
+    START TRANSACTION;
+    
+    DELETE FROM mv_zone_occupancy_1h;
+    
+    INSERT INTO mv_zone_occupancy_1h (zone_id, current_agvs, avg_speed, refreshed_at)
+    SELECT 
+        zone_id,
+        COUNT(DISTINCT agv_id) AS current_agvs,
+        AVG(speed_mps) AS avg_speed,
+        NOW(3) AS refreshed_at
+    FROM agv_positions
+    WHERE ts >= NOW() - INTERVAL 1 HOUR
+    AND zone_id IS NOT NULL
+    GROUP BY zone_id;
+    
+    COMMIT;
+END$$
+
 DELIMITER ;
 
 -- Create scheduled events
@@ -356,6 +438,17 @@ BEGIN
         avg_speed_mps = VALUES(avg_speed_mps);
 END;
 
+CREATE EVENT IF NOT EXISTS fleet_snapshot_refresh
+ON SCHEDULE EVERY 5 MINUTE
+DO
+  -- Rebuild the previous (now complete) bucket and the current one
+  CALL RefreshFleetSnapshot(NOW() - INTERVAL 5 MINUTE);
+
+CREATE EVENT IF NOT EXISTS zone_occupancy_refresh
+ON SCHEDULE EVERY 1 MINUTE
+DO
+  CALL RefreshZoneOccupancy();
+
 CREATE EVENT IF NOT EXISTS daily_cleanup
 ON SCHEDULE EVERY 1 DAY
 STARTS '2025-01-01 02:00:00'
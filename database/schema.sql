@@ -132,6 +132,41 @@ CREATE TABLE IF NOT EXISTS agv_analytics_hourly (
     INDEX idx_hour (hour_start DESC)
 ) ENGINE=InnoDB;
 
+-- Per-AGV 5-minute fleet snapshot (refreshed by the fleet_snapshot_refresh event)
+CREATE TABLE IF NOT EXISTS fleet_snapshot_5min (
+    ts_bucket DATETIME NOT NULL,
+    agv_id VARCHAR(64) NOT NULL,
+    avg_speed DOUBLE,
+    moving_sec INT,
+    idle_sec INT,
+    dist_m DOUBLE,
+    last_battery DOUBLE,
+    status VARCHAR(32),
+    PRIMARY KEY (ts_bucket, agv_id)
+) ENGINE=InnoDB;
+
+-- Newest position per AGV (upserted by the ingest writer on each flush)
+CREATE TABLE IF NOT EXISTS agv_latest_position (
+    agv_id VARCHAR(64) PRIMARY KEY,
+    ts DATETIME(3) NOT NULL,
+    heading_deg DOUBLE,
+    speed_mps DOUBLE,
+    plant_x DOUBLE,
+    plant_y DOUBLE,
+    zone_id VARCHAR(64),
+    battery_percent DOUBLE,
+    status VARCHAR(32),
+    INDEX idx_ts (ts)
+) ENGINE=InnoDB;
+
+-- Zone occupancy over the trailing hour (refreshed by the zone_occupancy_refresh event)
+CREATE TABLE IF NOT EXISTS mv_zone_occupancy_1h (
+    zone_id VARCHAR(64) PRIMARY KEY,
+    current_agvs INT NOT NULL,
+    avg_speed DOUBLE,
+    refreshed_at DATETIME(3) NOT NULL
+) ENGINE=InnoDB;
+
 -- Zone occupancy tracking
 CREATE TABLE IF NOT EXISTS zone_occupancy_log (
     id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
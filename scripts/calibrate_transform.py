@@ -6,8 +6,9 @@ Maps real-world coordinates to plant coordinate system.
 
 import os
 import sys
-import json
+import functools
 import numpy as np
+import orjson
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 import click
@@ -20,7 +21,7 @@ import yaml
 # Add project root to path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from src.core.transforms import TransformManager
+from src.core.transforms import TransformManager, affine_residuals, split_affine
 from src.core.database import db_manager
 
 
@@ -35,12 +36,26 @@ class CalibrationTool:
         self.control_points = []
         self.calibration_file = Path('assets/calibration/control_points.json')
         self.matrix_file = Path('assets/calibration/affine_matrix.npy')
+        self.inverse_matrix_file = self.matrix_file.with_name('affine_matrix_inv.npy')
+        self._agv_positions: Dict[str, Dict] = {}
         
+    @functools.cached_property
+    def _affine(self) -> np.ndarray:
+        """Forward affine matrix, memory-mapped once per tool instance."""
+        return np.load(self.matrix_file, mmap_mode='r')
+    
+    @functools.cached_property
+    def _affine_inv(self) -> np.ndarray:
+        """Inverse affine matrix, precomputed at calibration time if present."""
+        if self.inverse_matrix_file.exists():
+            return np.load(self.inverse_matrix_file, mmap_mode='r')
+        return np.linalg.inv(self._affine)
+    
     def load_existing_points(self) -> List[Dict]:
         """Load existing control points if available."""
         if self.calibration_file.exists():
-            with open(self.calibration_file, 'r') as f:
-                data = json.load(f)
+            with open(self.calibration_file, 'rb') as f:
+                data = orjson.loads(f.read())
                 return data.get('control_points', [])
         return []
     
@@ -58,8 +73,10 @@ class CalibrationTool:
             }
         }
         
-        with open(self.calibration_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        with open(self.calibration_file, 'wb') as f:
+            f.write(orjson.dumps(
+                data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+            ))
         
         console.print(f"[green]✓ Saved {len(self.control_points)} control points[/green]")
     
@@ -70,21 +87,21 @@ class CalibrationTool:
         name = Prompt.ask("Point name/description")
         
         console.print("\n[cyan]World Coordinates (WGS84 or UTM):[/cyan]")
-        coord_type = Prompt.ask("Coordinate type", choices=["wgs84", "utm"])
+        coord_type = click.prompt("Coordinate type", type=click.Choice(["wgs84", "utm"]))
         
         if coord_type == "wgs84":
-            lat = float(Prompt.ask("Latitude"))
-            lon = float(Prompt.ask("Longitude"))
+            lat = click.prompt("Latitude", type=float)
+            lon = click.prompt("Longitude", type=float)
             # Convert to UTM
             utm_x, utm_y = self.transform_manager.transformer.transform(lon, lat)
             world_x, world_y = utm_x, utm_y
         else:
-            world_x = float(Prompt.ask("UTM X (meters)"))
-            world_y = float(Prompt.ask("UTM Y (meters)"))
+            world_x = click.prompt("UTM X (meters)", type=float)
+            world_y = click.prompt("UTM Y (meters)", type=float)
         
         console.print("\n[cyan]Plant Coordinates (from CAD):[/cyan]")
-        plant_x = float(Prompt.ask("Plant X (meters)"))
-        plant_y = float(Prompt.ask("Plant Y (meters)"))
+        plant_x = click.prompt("Plant X (meters)", type=float)
+        plant_y = click.prompt("Plant Y (meters)", type=float)
         
         # Optional: Get from actual AGV position
         if Confirm.ask("\nGet current position from AGV?"):
@@ -108,22 +125,89 @@ class CalibrationTool:
         console.print(f"[green]✓ Added control point '{name}'[/green]")
     
     def _get_agv_position(self, agv_id: str) -> Optional[Dict]:
-        """Get current AGV position from database."""
+        """Get current AGV position from database, always queried fresh."""
+        self._agv_positions.pop(agv_id, None)
+        return self._get_agv_positions([agv_id]).get(agv_id)
+    
+    def _get_agv_positions(self, agv_ids: List[str]) -> Dict[str, Dict]:
+        """Fetch the latest position for several AGVs in one round-trip.
+        
+        Results are kept in ``self._agv_positions`` so a batch can look up
+        each AGV without another query; callers clear it once the batch is
+        done. Relies on idx_agv_ts (agv_id, ts DESC).
+        """
+        agv_ids = list(dict.fromkeys(agv_ids))
+        if not agv_ids:
+            return {}
+        
+        placeholders = ', '.join(['%s'] * len(agv_ids))
         try:
-            result = db_manager.execute_query("""
-                SELECT lat, lon, plant_x, plant_y 
-                FROM agv_positions 
-                WHERE agv_id = %s 
-                ORDER BY ts DESC 
-                LIMIT 1
-            """, (agv_id,))
+            result = db_manager.execute_query(f"""
+                SELECT agv_id, lat, lon, plant_x, plant_y
+                FROM (
+                    SELECT agv_id, lat, lon, plant_x, plant_y,
+                           ROW_NUMBER() OVER (PARTITION BY agv_id ORDER BY ts DESC) AS rn
+                    FROM agv_positions
+                    WHERE agv_id IN ({placeholders})
+                ) latest
+                WHERE rn = 1
+            """, tuple(agv_ids))
             
-            if result:
-                return result[0]
+            for row in result:
+                self._agv_positions[row['agv_id']] = row
         except Exception as e:
-            console.print(f"[red]Error getting AGV position: {e}[/red]")
+            console.print(f"[red]Error getting AGV positions: {e}[/red]")
         
-        return None
+        return {agv_id: self._agv_positions[agv_id]
+                for agv_id in agv_ids if agv_id in self._agv_positions}
+    
+    def resolve_agv_points(self):
+        """Fill lat/lon for loaded points that only reference an AGV.
+        
+        The current position of every referenced AGV is fetched in one
+        query; the cached positions are dropped afterwards.
+        """
+        pending = [
+            p for p in self.control_points
+            if 'agv_id' in p and 'world_x' not in p and 'lat' not in p
+        ]
+        if not pending:
+            return
+        
+        try:
+            self._get_agv_positions([p['agv_id'] for p in pending])
+            for point in pending:
+                position = self._agv_positions.get(point['agv_id'])
+                if position:
+                    point['lat'] = position['lat']
+                    point['lon'] = position['lon']
+                else:
+                    console.print(f"[yellow]No position for AGV {point['agv_id']}, "
+                                  f"skipping point '{point.get('name')}'[/yellow]")
+                    self.control_points.remove(point)
+        finally:
+            self._agv_positions.clear()
+    
+    def project_wgs84_points(self):
+        """Fill world coordinates for points given only as WGS84 lat/lon.
+        
+        All such points are projected with one vectorized transformer call
+        instead of one PROJ call per point.
+        """
+        pending = [
+            p for p in self.control_points
+            if 'world_x' not in p and 'lat' in p and 'lon' in p
+        ]
+        if not pending:
+            return
+        
+        xs, ys = self.transform_manager.transform_array(
+            [p['lon'] for p in pending],
+            [p['lat'] for p in pending]
+        )
+        for point, x, y in zip(pending, xs.tolist(), ys.tolist()):
+            point['world_x'] = x
+            point['world_y'] = y
     
     def display_points(self):
         """Display current control points."""
@@ -158,23 +242,26 @@ class CalibrationTool:
         console.print("\n[bold]Performing Calibration...[/bold]")
         
         try:
-            # Extract coordinates
-            world_coords = np.array([
-                [p['world_x'], p['world_y'], 1.0] 
-                for p in self.control_points
-            ])
-            plant_coords = np.array([
-                [p['plant_x'], p['plant_y'], 1.0] 
-                for p in self.control_points
-            ])
+            # Extract coordinates in a single pass into one (N, 4) buffer
+            n = len(self.control_points)
+            coords = np.fromiter(
+                (value for p in self.control_points
+                 for value in (p['world_x'], p['world_y'], p['plant_x'], p['plant_y'])),
+                dtype=np.float64, count=4 * n
+            ).reshape(n, 4)
+            ones = np.ones(n)
+            world_coords = np.column_stack((coords[:, 0], coords[:, 1], ones))
+            plant_coords = np.column_stack((coords[:, 2], coords[:, 3], ones))
             
-            # Compute affine transformation
-            affine_matrix, residuals, rank, s = np.linalg.lstsq(
-                world_coords, plant_coords, rcond=None
-            )
+            # Compute affine transformation via the 3x3 normal equations
+            # (W^T W) M = W^T P, avoiding the full SVD done by lstsq
+            wtw = world_coords.T @ world_coords
+            wtp = world_coords.T @ plant_coords
+            affine_matrix = np.linalg.solve(wtw, wtp)
+            rank = np.linalg.matrix_rank(wtw)
             
-            # Validate transformation
-            errors = []
+            # Validate transformation (all points in one matmul)
+            errors = affine_residuals(affine_matrix, world_coords, plant_coords)
             console.print("\n[cyan]Validation Results:[/cyan]")
             
             table = Table(title="Calibration Errors")
@@ -182,11 +269,7 @@ class CalibrationTool:
             table.add_column("Error (m)", justify="right")
             table.add_column("Status", justify="center")
             
-            for point, wc, pc in zip(self.control_points, world_coords, plant_coords):
-                predicted = affine_matrix.T @ wc
-                error = np.linalg.norm(predicted[:2] - pc[:2])
-                errors.append(error)
-                
+            for point, error in zip(self.control_points, errors):
                 status = "✓" if error < 0.5 else "⚠" if error < 1.0 else "✗"
                 status_color = "green" if error < 0.5 else "yellow" if error < 1.0 else "red"
                 
@@ -198,8 +281,8 @@ class CalibrationTool:
             
             console.print(table)
             
-            mean_error = np.mean(errors)
-            max_error = np.max(errors)
+            mean_error = errors.mean()
+            max_error = errors.max()
             
             console.print(f"\n[bold]Calibration Statistics:[/bold]")
             console.print(f"Mean error: {mean_error:.3f} meters")
@@ -214,6 +297,9 @@ class CalibrationTool:
             # Save calibration matrix
             self.matrix_file.parent.mkdir(parents=True, exist_ok=True)
             np.save(self.matrix_file, affine_matrix.T)
+            np.save(self.inverse_matrix_file, np.linalg.inv(affine_matrix.T))
+            self.__dict__.pop('_affine', None)
+            self.__dict__.pop('_affine_inv', None)
             console.print(f"[green]✓ Saved calibration matrix to {self.matrix_file}[/green]")
             
             # Save to database
@@ -229,8 +315,22 @@ class CalibrationTool:
     def _save_to_database(self):
         """Save calibration points to database."""
         try:
-            for point in self.control_points:
-                db_manager.execute_query("""
+            world_crs = f"EPSG:{os.getenv('UTM_EPSG', 32633)}"
+            params_list = [
+                (
+                    point['name'],
+                    point['world_x'],
+                    point['world_y'],
+                    world_crs,
+                    point['plant_x'],
+                    point['plant_y'],
+                    1.0
+                )
+                for point in self.control_points
+            ]
+            
+            with db_manager.transaction() as cursor:
+                cursor.executemany("""
                     INSERT INTO calibration_points 
                     (name, world_x, world_y, world_crs, plant_x, plant_y, quality)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
@@ -239,15 +339,7 @@ class CalibrationTool:
                     world_y = VALUES(world_y),
                     plant_x = VALUES(plant_x),
                     plant_y = VALUES(plant_y)
-                """, (
-                    point['name'],
-                    point['world_x'],
-                    point['world_y'],
-                    f"EPSG:{os.getenv('UTM_EPSG', 32633)}",
-                    point['plant_x'],
-                    point['plant_y'],
-                    1.0
-                ))
+                """, params_list)
             
             console.print("[green]✓ Saved calibration points to database[/green]")
             
@@ -262,16 +354,16 @@ class CalibrationTool:
         
         console.print("\n[bold]Test Transformation[/bold]")
         
-        coord_type = Prompt.ask("Input coordinate type", choices=["wgs84", "utm", "plant"])
+        coord_type = click.prompt("Input coordinate type", type=click.Choice(["wgs84", "utm", "plant"]))
         
         if coord_type == "wgs84":
-            lat = float(Prompt.ask("Latitude"))
-            lon = float(Prompt.ask("Longitude"))
+            lat = click.prompt("Latitude", type=float)
+            lon = click.prompt("Longitude", type=float)
             
             # Transform through the pipeline
             utm_x, utm_y = self.transform_manager.transformer.transform(lon, lat)
-            matrix = np.load(self.matrix_file)
-            plant_coords = matrix @ np.array([utm_x, utm_y, 1.0])
+            linear, offset = split_affine(self._affine)
+            plant_coords = linear @ np.array([utm_x, utm_y]) + offset
             
             console.print(f"\n[cyan]Results:[/cyan]")
             console.print(f"WGS84: ({lat:.6f}, {lon:.6f})")
@@ -279,24 +371,23 @@ class CalibrationTool:
             console.print(f"Plant: ({plant_coords[0]:.2f}, {plant_coords[1]:.2f})")
             
         elif coord_type == "utm":
-            utm_x = float(Prompt.ask("UTM X"))
-            utm_y = float(Prompt.ask("UTM Y"))
+            utm_x = click.prompt("UTM X", type=float)
+            utm_y = click.prompt("UTM Y", type=float)
             
-            matrix = np.load(self.matrix_file)
-            plant_coords = matrix @ np.array([utm_x, utm_y, 1.0])
+            linear, offset = split_affine(self._affine)
+            plant_coords = linear @ np.array([utm_x, utm_y]) + offset
             
             console.print(f"\n[cyan]Results:[/cyan]")
             console.print(f"UTM: ({utm_x:.2f}, {utm_y:.2f})")
             console.print(f"Plant: ({plant_coords[0]:.2f}, {plant_coords[1]:.2f})")
             
         else:  # plant
-            plant_x = float(Prompt.ask("Plant X"))
-            plant_y = float(Prompt.ask("Plant Y"))
+            plant_x = click.prompt("Plant X", type=float)
+            plant_y = click.prompt("Plant Y", type=float)
             
             # Inverse transform
-            matrix = np.load(self.matrix_file)
-            inv_matrix = np.linalg.inv(matrix)
-            utm_coords = inv_matrix @ np.array([plant_x, plant_y, 1.0])
+            linear, offset = split_affine(self._affine_inv)
+            utm_coords = linear @ np.array([plant_x, plant_y]) + offset
             
             console.print(f"\n[cyan]Results:[/cyan]")
             console.print(f"Plant: ({plant_x:.2f}, {plant_y:.2f})")
@@ -334,7 +425,7 @@ class CalibrationTool:
             elif choice == "3":
                 self.display_points()
                 if self.control_points:
-                    idx = int(Prompt.ask("Point index to remove")) - 1
+                    idx = click.prompt("Point index to remove", type=int) - 1
                     if 0 <= idx < len(self.control_points):
                         removed = self.control_points.pop(idx)
                         console.print(f"[green]Removed point '{removed['name']}'[/green]")
@@ -367,9 +458,11 @@ def main(interactive, test, load):
     tool = CalibrationTool()
     
     if load:
-        with open(load, 'r') as f:
-            data = json.load(f)
+        with open(load, 'rb') as f:
+            data = orjson.loads(f.read())
             tool.control_points = data.get('control_points', [])
+        tool.resolve_agv_points()
+        tool.project_wgs84_points()
         console.print(f"[green]Loaded {len(tool.control_points)} points from {load}[/green]")
         tool.display_points()
         if tool.calibrate():
@@ -5,17 +5,22 @@ Load zone definitions into the database from configuration files.
 
 import os
 import sys
-import json
 import yaml
+import orjson
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple, Union
 import click
 from rich import print
 from rich.console import Console
 from rich.table import Table
-from shapely.geometry import Polygon
+import shapely
 import numpy as np
 
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 # Add project root to path
 sys.path.append(str(Path(__file__).parent.parent))
 
@@ -24,6 +29,27 @@ from src.core.zone_manager import ZoneManager
 
 console = Console()
 
+ZONE_UPSERT_QUERY = """
+    INSERT INTO plant_zones (
+        zone_id, name, category, zone_type, 
+        max_speed_mps, max_agvs, priority,
+        vertices, centroid_x, centroid_y, area_sqm
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    ) ON DUPLICATE KEY UPDATE
+        name = VALUES(name),
+        category = VALUES(category),
+        zone_type = VALUES(zone_type),
+        max_speed_mps = VALUES(max_speed_mps),
+        max_agvs = VALUES(max_agvs),
+        priority = VALUES(priority),
+        vertices = VALUES(vertices),
+        centroid_x = VALUES(centroid_x),
+        centroid_y = VALUES(centroid_y),
+        area_sqm = VALUES(area_sqm),
+        updated_at = CURRENT_TIMESTAMP
+"""
+
 
 class ZoneLoader:
     """Loads zone definitions into the database."""
@@ -32,12 +58,15 @@ class ZoneLoader:
         self.zone_manager = ZoneManager()
         self.zones_loaded = 0
         self.zones_failed = 0
+        self._pending_rows: List[tuple] = []
+        self._pending_zone_ids: List[str] = []
+        self._vertex_json_cache: Dict[int, Tuple[Any, str]] = {}
     
     def load_from_yaml(self, file_path: str) -> bool:
         """Load zones from YAML configuration file."""
         try:
             with open(file_path, 'r') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=_YamlLoader)
             
             if 'zones' not in config:
                 console.print("[red]No zones found in configuration file[/red]")
@@ -46,8 +75,12 @@ class ZoneLoader:
             zones = config['zones']
             console.print(f"[cyan]Found {len(zones)} zones to load[/cyan]")
             
-            for zone_config in zones:
-                self._load_zone(zone_config)
+            polygon_props = self._polygon_properties(
+                [zone_config.get('vertices') or [] for zone_config in zones]
+            )
+            for zone_config, props in zip(zones, polygon_props):
+                self._load_zone(zone_config, props)
+            self._flush_pending_rows()
             
             console.print(f"\n[green]Successfully loaded {self.zones_loaded} zones[/green]")
             if self.zones_failed > 0:
@@ -62,8 +95,8 @@ class ZoneLoader:
     def load_from_geojson(self, file_path: str) -> bool:
         """Load zones from GeoJSON file."""
         try:
-            with open(file_path, 'r') as f:
-                geojson = json.load(f)
+            with open(file_path, 'rb') as f:
+                geojson = orjson.loads(f.read())
             
             if 'features' not in geojson:
                 console.print("[red]Invalid GeoJSON format[/red]")
@@ -72,8 +105,18 @@ class ZoneLoader:
             features = geojson['features']
             console.print(f"[cyan]Found {len(features)} features to load[/cyan]")
             
+            zone_configs = []
             for feature in features:
-                self._load_geojson_feature(feature)
+                zone_config = self._geojson_feature_config(feature)
+                if zone_config is not None:
+                    zone_configs.append(zone_config)
+            
+            polygon_props = self._polygon_properties(
+                [zone_config['vertices'] for zone_config in zone_configs]
+            )
+            for zone_config, props in zip(zone_configs, polygon_props):
+                self._load_zone(zone_config, props)
+            self._flush_pending_rows()
             
             console.print(f"\n[green]Successfully loaded {self.zones_loaded} zones[/green]")
             if self.zones_failed > 0:
@@ -85,8 +128,59 @@ class ZoneLoader:
             console.print(f"[red]Error loading zones from GeoJSON: {e}[/red]")
             return False
     
-    def _load_zone(self, zone_config: Dict) -> bool:
-        """Load a single zone from configuration."""
+    @staticmethod
+    def _polygon_properties(vertex_lists: List[List]) -> List[Optional[Union[Tuple, Exception]]]:
+        """Compute (is_valid, centroid_x, centroid_y, area) for many polygons.
+        
+        Each vertex list is converted on its own; a list that cannot form a
+        polygon (ragged coordinates, fewer than 3 vertices) yields the
+        exception instead. The remaining polygons are built and measured with
+        vectorized shapely calls, so GEOS is entered once per attribute rather
+        than once per zone. Entries without vertices yield None.
+        """
+        results: List[Optional[Union[Tuple, Exception]]] = [None] * len(vertex_lists)
+        rings: Dict[int, np.ndarray] = {}
+        for i, vertices in enumerate(vertex_lists):
+            if not vertices:
+                continue
+            try:
+                ring = np.asarray(vertices, dtype=np.float64)
+                if ring.ndim != 2 or ring.shape[1] < 2:
+                    raise ValueError("vertices must be [x, y] coordinate pairs")
+                if len(ring) < 3:
+                    raise ValueError(f"a polygon needs at least 3 vertices, got {len(ring)}")
+                rings[i] = ring[:, :2]
+            except (TypeError, ValueError) as e:
+                results[i] = e
+        if not rings:
+            return results
+        
+        buildable = list(rings)
+        coords = np.concatenate([rings[i] for i in buildable])
+        ring_index = np.repeat(
+            np.arange(len(buildable)), [len(rings[i]) for i in buildable]
+        )
+        polygons = shapely.polygons(shapely.linearrings(coords, indices=ring_index))
+        
+        valid = shapely.is_valid(polygons)
+        centroids = shapely.centroid(polygons)
+        centroid_x = shapely.get_x(centroids)
+        centroid_y = shapely.get_y(centroids)
+        areas = shapely.area(polygons)
+        
+        for k, i in enumerate(buildable):
+            results[i] = (bool(valid[k]), float(centroid_x[k]),
+                          float(centroid_y[k]), float(areas[k]))
+        return results
+    
+    def _load_zone(self, zone_config: Dict,
+                   polygon_props: Optional[Union[Tuple, Exception]] = None) -> bool:
+        """Load a single zone from configuration.
+        
+        ``polygon_props`` may carry precomputed output of
+        ``_polygon_properties``; otherwise it is computed for this zone.
+        A zone whose vertices could not form a polygon counts as failed.
+        """
         try:
             zone_id = zone_config.get('zone_id')
             if not zone_id:
@@ -94,41 +188,22 @@ class ZoneLoader:
                 return False
             
             # Calculate centroid and area if vertices provided
+            if polygon_props is None:
+                polygon_props = self._polygon_properties(
+                    [zone_config.get('vertices') or []]
+                )[0]
+            if isinstance(polygon_props, Exception):
+                raise polygon_props
+            
             centroid_x, centroid_y, area = None, None, None
-            if 'vertices' in zone_config and zone_config['vertices']:
-                vertices = zone_config['vertices']
-                polygon = Polygon(vertices)
-                
-                if polygon.is_valid:
-                    centroid = polygon.centroid
-                    centroid_x = centroid.x
-                    centroid_y = centroid.y
-                    area = polygon.area
-                else:
+            if polygon_props is not None:
+                is_valid, centroid_x, centroid_y, area = polygon_props
+                if not is_valid:
+                    centroid_x, centroid_y, area = None, None, None
                     console.print(f"[yellow]Invalid polygon for zone {zone_id}[/yellow]")
             
-            # Insert or update zone in database
-            query = """
-                INSERT INTO plant_zones (
-                    zone_id, name, category, zone_type, 
-                    max_speed_mps, max_agvs, priority,
-                    vertices, centroid_x, centroid_y, area_sqm
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                ) ON DUPLICATE KEY UPDATE
-                    name = VALUES(name),
-                    category = VALUES(category),
-                    zone_type = VALUES(zone_type),
-                    max_speed_mps = VALUES(max_speed_mps),
-                    max_agvs = VALUES(max_agvs),
-                    priority = VALUES(priority),
-                    vertices = VALUES(vertices),
-                    centroid_x = VALUES(centroid_x),
-                    centroid_y = VALUES(centroid_y),
-                    area_sqm = VALUES(area_sqm),
-                    updated_at = CURRENT_TIMESTAMP
-            """
-            
+            # Queue the upsert; rows are written in one batch by
+            # _flush_pending_rows once the whole file has been read
             params = (
                 zone_id,
                 zone_config.get('name', zone_id),
@@ -137,15 +212,14 @@ class ZoneLoader:
                 zone_config.get('max_speed_mps', 2.0),
                 zone_config.get('max_agvs', 5),
                 zone_config.get('priority', 5),
-                json.dumps(zone_config.get('vertices', [])),
+                self._vertices_json(zone_config.get('vertices', [])),
                 centroid_x,
                 centroid_y,
                 area
             )
             
-            db_manager.execute_query(query, params)
-            self.zones_loaded += 1
-            console.print(f"[green]✓[/green] Loaded zone: {zone_id}")
+            self._pending_rows.append(params)
+            self._pending_zone_ids.append(zone_id)
             return True
             
         except Exception as e:
@@ -153,8 +227,44 @@ class ZoneLoader:
             self.zones_failed += 1
             return False
     
-    def _load_geojson_feature(self, feature: Dict) -> bool:
-        """Load a zone from GeoJSON feature."""
+    def _vertices_json(self, vertices: List) -> str:
+        """Serialize a vertex list, reusing the result for repeated lists.
+        
+        Entries keep a reference to the list so its id cannot be recycled
+        while cached.
+        """
+        key = id(vertices)
+        cached = self._vertex_json_cache.get(key)
+        if cached is None or cached[0] is not vertices:
+            cached = (vertices, orjson.dumps(vertices).decode())
+            self._vertex_json_cache[key] = cached
+        return cached[1]
+    
+    def _flush_pending_rows(self) -> bool:
+        """Write all queued zone rows with a single multi-row upsert."""
+        if not self._pending_rows:
+            return True
+        
+        rows, zone_ids = self._pending_rows, self._pending_zone_ids
+        self._pending_rows, self._pending_zone_ids = [], []
+        self._vertex_json_cache.clear()
+        
+        try:
+            with db_manager.transaction() as cursor:
+                cursor.executemany(ZONE_UPSERT_QUERY, rows)
+        except Exception as e:
+            console.print(f"[red]✗ Failed to load {len(rows)} zones: {e}[/red]")
+            self.zones_failed += len(rows)
+            return False
+        
+        for zone_id in zone_ids:
+            console.print(f"[green]✓[/green] Loaded zone: {zone_id}")
+        self.zones_loaded += len(rows)
+        ZoneManager.invalidate_caches()
+        return True
+    
+    def _geojson_feature_config(self, feature: Dict) -> Optional[Dict]:
+        """Build a zone configuration from a GeoJSON feature."""
         try:
             properties = feature.get('properties', {})
             geometry = feature.get('geometry', {})
@@ -166,13 +276,16 @@ class ZoneLoader:
             
             if not zone_id:
                 console.print("[yellow]Skipping feature without ID[/yellow]")
-                return False
+                return None
             
             # Extract vertices from geometry
             vertices = []
             if geometry.get('type') == 'Polygon':
-                coordinates = geometry.get('coordinates', [[]])[0]
-                vertices = [[coord[0], coord[1]] for coord in coordinates]
+                coordinates = np.asarray(
+                    geometry.get('coordinates', [[]])[0], dtype=np.float64
+                )
+                if coordinates.ndim == 2:
+                    vertices = coordinates[:, :2].tolist()
             
             # Create zone configuration
             zone_config = {
@@ -186,16 +299,16 @@ class ZoneLoader:
                 'vertices': vertices
             }
             
-            return self._load_zone(zone_config)
+            return zone_config
             
         except Exception as e:
             console.print(f"[red]✗ Failed to load GeoJSON feature: {e}[/red]")
             self.zones_failed += 1
-            return False
+            return None
     
     def list_zones(self):
         """List all zones in the database."""
-        zones = db_manager.query_dataframe("""
+        zones = db_manager.execute_query("""
             SELECT 
                 zone_id, name, category, zone_type,
                 max_agvs, max_speed_mps, priority,
@@ -204,7 +317,7 @@ class ZoneLoader:
             ORDER BY category, zone_id
         """)
         
-        if zones.empty:
+        if not zones:
             console.print("[yellow]No zones found in database[/yellow]")
             return
         
@@ -219,7 +332,7 @@ class ZoneLoader:
         table.add_column("Area (m²)", justify="right")
         table.add_column("Active", justify="center")
         
-        for _, zone in zones.iterrows():
+        for zone in zones:
             active_indicator = "✓" if zone['active'] else "✗"
             active_color = "green" if zone['active'] else "red"
             
@@ -261,16 +374,18 @@ class ZoneLoader:
         
         # Check for zone connectivity
         if len(zones) > 1:
-            # Build adjacency graph
-            adjacent_zones = {}
-            for zone_id in zones:
-                adjacent = self.zone_manager.get_adjacent_zones(zone_id)
-                if adjacent:
-                    adjacent_zones[zone_id] = adjacent
+            # Find every touching pair with one spatial-index query
+            polygon_ids = list(self.zone_manager.zone_polygons.keys())
+            connected = set()
+            if polygon_ids:
+                polygons = np.array(list(self.zone_manager.zone_polygons.values()))
+                tree = shapely.STRtree(polygons)
+                input_idx, _ = tree.query(polygons, predicate='touches')
+                connected = {polygon_ids[i] for i in np.unique(input_idx)}
             
             # Check for isolated zones
             for zone_id in zones:
-                if zone_id not in adjacent_zones or not adjacent_zones[zone_id]:
+                if zone_id not in connected:
                     issues.append(f"Zone {zone_id} appears to be isolated (no adjacent zones)")
         
         if issues:
@@ -293,6 +408,7 @@ class ZoneLoader:
         
         try:
             db_manager.execute_query("DELETE FROM plant_zones")
+            ZoneManager.invalidate_caches()
             console.print("[green]All zones deleted[/green]")
         except Exception as e:
             console.print(f"[red]Error deleting zones: {e}[/red]")
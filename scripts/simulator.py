@@ -6,15 +6,18 @@ Generates realistic AGV movement data for testing.
 
 import os
 import sys
-import json
+import math
 import time
+import pickle
 import random
+import socket
 import asyncio
-import threading
 from datetime import datetime, timezone
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Optional
 from pathlib import Path
 import numpy as np
+import orjson
+import ormsgpack
 import click
 from rich import print
 from rich.console import Console
@@ -25,6 +28,22 @@ from rich.panel import Panel
 import paho.mqtt.client as mqtt
 import yaml
 
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# asyncio-native MQTT client and event loop, used when installed
+try:
+    import gmqtt
+except ImportError:
+    gmqtt = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Add project root to path
 sys.path.append(str(Path(__file__).parent.parent))
 
@@ -32,18 +51,38 @@ sys.path.append(str(Path(__file__).parent.parent))
 console = Console()
 
 
+STATUS_NAMES = ('ACTIVE', 'IDLE', 'CHARGING', 'LOW_BATTERY')
+STATUS_ACTIVE, STATUS_IDLE, STATUS_CHARGING, STATUS_LOW_BATTERY = range(len(STATUS_NAMES))
+
+# Send buffer sized for a full tick of position messages (~250 B each)
+SOCKET_SNDBUF_BYTES = 256 * 1024
+
+# Topic suffix marking MessagePack payloads for the consumer
+MSGPACK_TOPIC_SUFFIX = '.msgpack'
+
+# Heading jitter of 5 degrees (one standard deviation)
+HEADING_NOISE_RAD = math.radians(5)
+
+
 class AGVSimulator:
-    """Simulates multiple AGVs with realistic movement patterns."""
+    """Simulates multiple AGVs with realistic movement patterns.
+    
+    Fleet state is kept as parallel NumPy arrays (one element per AGV) so a
+    tick advances every AGV with a handful of vectorized operations.
+    """
     
     def __init__(self, config_file: Optional[str] = None):
         self.config = self._load_config(config_file)
         self.agvs = []
         self.running = False
+        self._rng = np.random.default_rng()
         self.mqtt_client = None
+        self._backend = self._resolve_backend()
         self.stats = {
             'messages_sent': 0,
             'start_time': time.time(),
-            'errors': 0
+            'errors': 0,
+            'dropped_ticks': 0
         }
         
     def _load_config(self, config_file: Optional[str]) -> Dict:
@@ -52,7 +91,24 @@ class AGVSimulator:
             'mqtt': {
                 'broker': os.getenv('MQTT_BROKER', 'localhost'),
                 'port': int(os.getenv('MQTT_PORT', 1883)),
-                'topic_pattern': 'rtls/{agv_id}/position'
+                # 'gmqtt' publishes from the simulator's event loop; 'paho'
+                # runs the network I/O in paho's own thread
+                'backend': 'gmqtt',
+                'topic_pattern': 'rtls/{agv_id}/position',
+                # 'per_agv' publishes one message per AGV on topic_pattern;
+                # 'fleet' publishes one JSON array per tick on fleet_topic
+                'publish_mode': 'per_agv',
+                'fleet_topic': 'rtls/fleet/positions',
+                # In per_agv mode, AGVs that moved less than delta_threshold_m
+                # with unchanged status and battery are only re-sent every
+                # heartbeat_s seconds
+                'delta_threshold_m': 0.05,
+                'heartbeat_s': 10,
+                # 'json' or 'msgpack'; msgpack topics get a '.msgpack' suffix
+                'payload_format': 'json',
+                # Position telemetry is superseded every tick, so QoS 0
+                # avoids a PUBACK round-trip per message
+                'qos': 0
             },
             'simulation': {
                 'num_agvs': 5,
@@ -68,17 +124,73 @@ class AGVSimulator:
         }
         
         if config_file and Path(config_file).exists():
-            with open(config_file, 'r') as f:
-                custom_config = yaml.safe_load(f)
-                # Merge configs
-                for key in custom_config:
-                    if key in default_config:
-                        default_config[key].update(custom_config[key])
-                    else:
-                        default_config[key] = custom_config[key]
+            custom_config = self._read_config_file(Path(config_file))
+            # Merge configs
+            for key in custom_config:
+                if key in default_config:
+                    default_config[key].update(custom_config[key])
+                else:
+                    default_config[key] = custom_config[key]
         
         return default_config
     
+    def _read_config_file(self, config_path: Path) -> Dict:
+        """Parse a YAML config file, reusing a pickled copy when up to date.
+        
+        Only the file contents are cached; defaults are merged on every run
+        because they depend on environment variables.
+        """
+        cache_path = config_path.with_name(f".{config_path.name}.pkl")
+        try:
+            if cache_path.stat().st_mtime >= config_path.stat().st_mtime:
+                with open(cache_path, 'rb') as f:
+                    return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        
+        if not yaml.__with_libyaml__:
+            console.print("[yellow]PyYAML built without libyaml; using the slower pure-Python loader[/yellow]")
+        with open(config_path, 'r') as f:
+            custom_config = yaml.load(f, Loader=_YamlLoader) or {}
+        
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump(custom_config, f, protocol=5)
+        except OSError:
+            pass
+        
+        return custom_config
+    
+    def _resolve_backend(self) -> str:
+        """Pick the MQTT client library, falling back to paho."""
+        backend = self.config['mqtt']['backend']
+        if backend == 'gmqtt' and gmqtt is None:
+            console.print("[yellow]gmqtt not installed; falling back to paho-mqtt[/yellow]")
+            backend = 'paho'
+        return backend
+    
+    async def _init_gmqtt(self) -> bool:
+        """Initialize and connect the asyncio MQTT client."""
+        self.mqtt_client = gmqtt.Client(f"simulator_{os.getpid()}")
+        
+        def on_connect(client, flags, rc, properties):
+            console.print(f"[green]Connected to MQTT broker[/green]")
+        
+        self.mqtt_client.on_connect = on_connect
+        
+        try:
+            # asyncio enables TCP_NODELAY on its sockets by itself
+            await self.mqtt_client.connect(
+                self.config['mqtt']['broker'],
+                self.config['mqtt']['port'],
+                keepalive=60
+            )
+            return True
+        except Exception as e:
+            console.print(f"[red]MQTT connection failed: {e}[/red]")
+            self.mqtt_client = None
+            return False
+    
     def _init_mqtt(self):
         """Initialize MQTT client."""
         self.mqtt_client = mqtt.Client(client_id=f"simulator_{os.getpid()}")
@@ -89,7 +201,14 @@ class AGVSimulator:
             else:
                 console.print(f"[red]Failed to connect: {rc}[/red]")
         
+        def on_socket_open(client, userdata, sock):
+            # Push each tick's publishes out immediately instead of letting
+            # Nagle coalesce them behind outstanding ACKs
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF_BYTES)
+        
         self.mqtt_client.on_connect = on_connect
+        self.mqtt_client.on_socket_open = on_socket_open
         
         try:
             self.mqtt_client.connect(
@@ -106,47 +225,309 @@ class AGVSimulator:
     def create_agvs(self, num_agvs: int):
         """Create simulated AGVs."""
         agv_types = ['TUGGER', 'FORKLIFT', 'PALLET_JACK', 'AMR']
+        topic_pattern = self.config['mqtt']['topic_pattern']
+        if self.config['mqtt']['payload_format'] == 'msgpack':
+            topic_pattern += MSGPACK_TOPIC_SUFFIX
+        bounds = self.config['plant']
+        rng = self._rng
         
+        # Initialize position
+        self.x = rng.uniform(bounds['xmin'] + 10, bounds['xmax'] - 10, num_agvs)
+        self.y = rng.uniform(bounds['ymin'] + 10, bounds['ymax'] - 10, num_agvs)
+        self.heading = rng.uniform(0, 360, num_agvs)
+        
+        # Movement parameters
+        self.base_speed = rng.uniform(0.5, 2.0, num_agvs)
+        self.speed = self.base_speed.copy()
+        
+        # Status
+        self.battery = rng.uniform(60, 100, num_agvs)
+        self.status = np.full(num_agvs, STATUS_ACTIVE, dtype=np.int8)
+        self.quality = rng.uniform(0.8, 1.0, num_agvs)
+        self.satellites = rng.integers(8, 13, num_agvs)
+        self.hdop = rng.uniform(0.5, 1.5, num_agvs)
+        
+        # Path planning: waypoints padded to the longest path, (N, Kmax, 2)
+        paths = [self._generate_path() for _ in range(num_agvs)]
+        max_len = max((len(path) for path in paths), default=0)
+        self.waypoints = np.zeros((num_agvs, max_len, 2), dtype=np.float32)
+        self.num_waypoints = np.array([len(path) for path in paths], dtype=np.intp)
+        for i, path in enumerate(paths):
+            self.waypoints[i, :len(path)] = path
+        self.current_waypoint = np.zeros(num_agvs, dtype=np.intp)
+        self._scratch = np.empty((3, num_agvs))
+        self._take_snapshot()
+        
+        # Settings read every tick, bound once so update_all does no dict lookups
+        sim = self.config['simulation']
+        self._dt = 1.0 / sim['sample_rate_hz']
+        self._speed_variation = sim['speed_variation']
+        self._position_noise = sim['position_noise']
+        self._drain_rate = sim['battery_drain_rate']
+        self._xmin, self._xmax = bounds['xmin'], bounds['xmax']
+        self._ymin, self._ymax = bounds['ymin'], bounds['ymax']
+        
+        # Last published state per AGV; -inf forces a first publish
+        self._last_x = self.x.copy()
+        self._last_y = self.y.copy()
+        self._last_status = self.status.copy()
+        self._last_battery = self.battery.astype(np.int16)
+        self._last_published = np.full(num_agvs, -np.inf)
+        
+        self.agvs = []
         for i in range(num_agvs):
-            agv = SimulatedAGV(
-                agv_id=f"AGV_SIM_{i+1:02d}",
+            agv_id = f"AGV_SIM_{i+1:02d}"
+            self.agvs.append(SimulatedAGV(
+                fleet=self,
+                index=i,
+                agv_id=agv_id,
                 agv_type=random.choice(agv_types),
-                plant_bounds=self.config['plant'],
-                config=self.config['simulation']
-            )
-            self.agvs.append(agv)
+                topic=topic_pattern.format(agv_id=agv_id)
+            ))
         
         console.print(f"[green]Created {num_agvs} simulated AGVs[/green]")
     
-    def publish_positions(self):
+    def _generate_path(self) -> np.ndarray:
+        """Generate a random path through the plant as a (K, 2) array."""
+        bounds = self.config['plant']
+        num_waypoints = self._rng.integers(5, 16)
+        return self._rng.uniform(
+            [bounds['xmin'] + 5, bounds['ymin'] + 5],
+            [bounds['xmax'] - 5, bounds['ymax'] - 5],
+            size=(num_waypoints, 2)
+        ).astype(np.float32)
+    
+    def _set_path(self, i: int, path: np.ndarray):
+        """Replace the path of AGV ``i``, growing the waypoint array if needed."""
+        if len(path) > self.waypoints.shape[1]:
+            grown = np.zeros((len(self.agvs), len(path), 2), dtype=np.float32)
+            grown[:, :self.waypoints.shape[1]] = self.waypoints
+            self.waypoints = grown
+        self.waypoints[i, :len(path)] = path
+        self.num_waypoints[i] = len(path)
+        self.current_waypoint[i] = 0
+    
+    def update_all(self):
+        """Advance every AGV by one sample period."""
+        rng = self._rng
+        n = len(self.agvs)
+        idx = np.arange(n)
+        
+        # All Gaussian noise for the tick in one draw: heading, speed,
+        # position x/y and signal quality jitter, one row each
+        noise = rng.standard_normal((5, n))
+        noise[0] *= HEADING_NOISE_RAD
+        noise[1] *= self._speed_variation
+        noise[2:4] *= self._position_noise
+        noise[4] *= 0.05
+        
+        # Kinematics write into preallocated scratch buffers and the state
+        # arrays themselves, so a tick allocates no full-size temporaries
+        # beyond the random draws
+        dx, dy, travel = self._scratch
+        
+        # Advance AGVs that reached their current waypoint
+        target = self.waypoints[idx, self.current_waypoint]
+        np.subtract(target[:, 0], self.x, out=dx)
+        np.subtract(target[:, 1], self.y, out=dy)
+        reached = np.hypot(dx, dy, out=travel) < 2.0
+        self.current_waypoint[reached] += 1
+        
+        # Generate new paths for AGVs that finished theirs
+        for i in np.flatnonzero(self.current_waypoint >= self.num_waypoints):
+            self._set_path(i, self._generate_path())
+        
+        # Move towards target
+        if reached.any():
+            target = self.waypoints[idx, self.current_waypoint]
+            np.subtract(target[:, 0], self.x, out=dx)
+            np.subtract(target[:, 1], self.y, out=dy)
+        
+        # Heading towards target with some noise; trig works on radians
+        # directly and degrees are derived once for reporting
+        heading_rad = np.arctan2(dy, dx, out=dx)
+        heading_rad += noise[0]
+        np.degrees(heading_rad, out=self.heading)
+        np.mod(self.heading, 360, out=self.heading)
+        
+        # Speed with variation
+        noise[1] += 1
+        np.multiply(self.base_speed, noise[1], out=self.speed)
+        np.clip(self.speed, 0.1, 3.0, out=self.speed)
+        
+        # Update position with noise, kept within bounds
+        np.multiply(self.speed, self._dt, out=travel)
+        self.x += np.multiply(np.cos(heading_rad, out=dy), travel, out=dy)
+        self.y += np.multiply(np.sin(heading_rad, out=dy), travel, out=dy)
+        self.x += noise[2]
+        self.y += noise[3]
+        np.clip(self.x, self._xmin, self._xmax, out=self.x)
+        np.clip(self.y, self._ymin, self._ymax, out=self.y)
+        
+        # Update battery
+        self.battery -= np.multiply(self.speed, self._drain_rate, out=travel)
+        np.maximum(self.battery, 0, out=self.battery)
+        
+        # Update status based on battery, with occasional idle
+        draw = rng.random(n)
+        low = self.battery < 20
+        self.status = np.where(
+            low,
+            np.where(draw < 0.1, STATUS_CHARGING, STATUS_LOW_BATTERY),
+            np.where(draw < 0.01, STATUS_IDLE, STATUS_ACTIVE)
+        ).astype(np.int8)
+        
+        # Update quality (signal strength simulation)
+        self.quality += noise[4]
+        np.clip(self.quality, 0.3, 1.0, out=self.quality)
+        
+        # GNSS diagnostics reported with each message
+        self.satellites = rng.integers(8, 13, n)
+        self.hdop = rng.uniform(0.5, 1.5, n)
+    
+    def _take_snapshot(self):
+        """Publish a copy of the display fields for the status table.
+        
+        The tuple is rebound in one assignment, so readers always see the
+        arrays of a single tick without needing a lock.
+        """
+        self.snapshot = (
+            self.x.copy(),
+            self.y.copy(),
+            self.speed.copy(),
+            self.heading.copy(),
+            self.battery.copy(),
+            self.status.copy()
+        )
+    
+    def build_messages(self, ts: str) -> List[Dict]:
+        """Build the MQTT messages of every AGV for tick timestamp ``ts``.
+        
+        Fields are converted column by column with ``tolist()`` and zipped
+        into dicts, instead of reading each AGV's values one at a time.
+        """
+        # Convert to WGS84 (fake conversion for simulation)
+        lat = 49.0 + self.y / 111000  # Rough conversion
+        lon = 12.0 + self.x / 111000
+        statuses = [STATUS_NAMES[s] for s in self.status.tolist()]
+        
+        return [
+            {
+                'ts': ts,
+                'agv_id': agv.agv_id,
+                'lat': la,
+                'lon': lo,
+                'plant_x': x,
+                'plant_y': y,
+                'heading_deg': heading,
+                'speed_mps': speed,
+                'quality': quality,
+                'battery_percent': battery,
+                'status': status,
+                'satellites': sats,
+                'hdop': hdop
+            }
+            for agv, la, lo, x, y, heading, speed, quality, battery, status, sats, hdop in zip(
+                self.agvs, lat.tolist(), lon.tolist(), self.x.tolist(), self.y.tolist(),
+                self.heading.tolist(), self.speed.tolist(), self.quality.tolist(),
+                self.battery.tolist(), statuses, self.satellites.tolist(), self.hdop.tolist()
+            )
+        ]
+    
+    def _changed_agvs(self, now: float, threshold: float, heartbeat: float) -> np.ndarray:
+        """Indices of AGVs whose state changed since they were last published.
+        
+        An AGV counts as changed when it moved at least ``threshold`` metres
+        on either axis, changed status or whole battery percent, or was not
+        published for ``heartbeat`` seconds. Their last published state is
+        updated on the assumption that the caller publishes them.
+        """
+        battery = self.battery.astype(np.int16)
+        changed = (
+            (np.abs(self.x - self._last_x) >= threshold)
+            | (np.abs(self.y - self._last_y) >= threshold)
+            | (self.status != self._last_status)
+            | (battery != self._last_battery)
+            | (now - self._last_published >= heartbeat)
+        )
+        
+        self._last_x[changed] = self.x[changed]
+        self._last_y[changed] = self.y[changed]
+        self._last_status[changed] = self.status[changed]
+        self._last_battery[changed] = battery[changed]
+        self._last_published[changed] = now
+        
+        return np.flatnonzero(changed)
+    
+    async def publish_positions(self):
         """Publish AGV positions via MQTT."""
+        # Settings are fixed for the run; resolve them once outside the loop
+        mqtt_config = self.config['mqtt']
+        qos = mqtt_config['qos']
+        fleet_mode = mqtt_config['publish_mode'] == 'fleet'
+        fleet_topic = mqtt_config['fleet_topic']
+        if mqtt_config['payload_format'] == 'msgpack':
+            encode = ormsgpack.packb
+            fleet_topic += MSGPACK_TOPIC_SUFFIX
+        else:
+            encode = orjson.dumps
+        threshold = mqtt_config['delta_threshold_m']
+        heartbeat = mqtt_config['heartbeat_s']
+        period = self._dt
+        publish = self.mqtt_client.publish
+        next_tick = time.perf_counter()
+        
         while self.running:
+            # Counted locally and added to stats once per tick
+            sent = 0
             try:
-                for agv in self.agvs:
-                    # Update AGV position
-                    agv.update()
-                    
-                    # Create message
-                    message = agv.get_message()
-                    
-                    # Publish to MQTT
-                    topic = self.config['mqtt']['topic_pattern'].format(agv_id=agv.agv_id)
-                    self.mqtt_client.publish(
-                        topic,
-                        json.dumps(message),
-                        qos=1
-                    )
-                    
-                    self.stats['messages_sent'] += 1
+                # Advance the whole fleet
+                self.update_all()
+                self._take_snapshot()
+                
+                # All messages of one tick share a timestamp
+                ts = datetime.now(timezone.utc).isoformat()
+                messages = self.build_messages(ts)
                 
-                # Sleep to maintain sample rate
-                time.sleep(1.0 / self.config['simulation']['sample_rate_hz'])
+                if fleet_mode:
+                    # One snapshot of the whole fleet per tick
+                    publish(
+                        fleet_topic,
+                        encode(messages),
+                        qos=qos
+                    )
+                    sent += 1
+                else:
+                    # Only AGVs that changed, plus periodic heartbeats timed
+                    # on the tick schedule rather than another clock read
+                    for i in self._changed_agvs(next_tick, threshold, heartbeat).tolist():
+                        # Publish to MQTT on the topic formatted at creation
+                        publish(
+                            self.agvs[i].topic,
+                            encode(messages[i]),
+                            qos=qos
+                        )
+                        sent += 1
                 
             except Exception as e:
                 console.print(f"[red]Error publishing: {e}[/red]")
                 self.stats['errors'] += 1
+            
+            self.stats['messages_sent'] += sent
+            
+            # Sleep until the next deadline so the work of a tick does not
+            # stretch the period; when a tick overran, restart the schedule
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                if delay < -period:
+                    self.stats['dropped_ticks'] += int(-delay // period)
+                next_tick = time.perf_counter()
+                await asyncio.sleep(0)
     
-    def display_status(self):
+    async def display_status(self):
         """Display live status table."""
         def generate_table():
             table = Table(title="AGV Simulator Status")
@@ -158,16 +539,22 @@ class AGVSimulator:
             table.add_column("Battery", justify="right")
             table.add_column("Status", justify="center")
             
-            for agv in self.agvs:
-                status_color = "green" if agv.status == "ACTIVE" else "yellow"
+            # Read one consistent tick instead of the live arrays
+            xs, ys, speeds, headings, batteries, statuses = self.snapshot
+            rows = zip(
+                self.agvs, xs.tolist(), ys.tolist(), speeds.tolist(),
+                headings.tolist(), batteries.tolist(), statuses.tolist()
+            )
+            for agv, x, y, speed, heading, battery, status in rows:
+                status_color = "green" if status == STATUS_ACTIVE else "yellow"
                 table.add_row(
                     agv.agv_id,
                     agv.agv_type,
-                    f"({agv.x:.1f}, {agv.y:.1f})",
-                    f"{agv.speed:.2f} m/s",
-                    f"{agv.heading:.0f}°",
-                    f"{agv.battery:.0f}%",
-                    f"[{status_color}]{agv.status}[/{status_color}]"
+                    f"({x:.1f}, {y:.1f})",
+                    f"{speed:.2f} m/s",
+                    f"{heading:.0f}°",
+                    f"{battery:.0f}%",
+                    f"[{status_color}]{STATUS_NAMES[status]}[/{status_color}]"
                 )
             
             # Add statistics panel
@@ -178,48 +565,57 @@ class AGVSimulator:
                 f"Messages Sent: {self.stats['messages_sent']}\n"
                 f"Rate: {rate:.1f} msg/s\n"
                 f"Errors: {self.stats['errors']}\n"
+                f"Dropped Ticks: {self.stats['dropped_ticks']}\n"
                 f"Runtime: {runtime:.0f}s"
             )
             
             layout = Layout()
             layout.split_column(
                 Layout(Panel(table)),
-                Layout(Panel(stats_text, title="Statistics"), size=6)
+                Layout(Panel(stats_text, title="Statistics"), size=7)
             )
             
             return layout
         
-        with Live(generate_table(), refresh_per_second=2) as live:
+        with Live(generate_table(), refresh_per_second=1) as live:
             while self.running:
-                time.sleep(0.5)
+                await asyncio.sleep(1.0)
                 live.update(generate_table())
     
-    def run(self, duration: Optional[int] = None):
-        """Run the simulator."""
-        if not self._init_mqtt():
+    async def _run_loops(self, duration: Optional[int]):
+        """Run publisher and display as tasks on one event loop."""
+        if self._backend == 'gmqtt' and not await self._init_gmqtt():
             return
         
         self.running = True
-        
-        # Start publishing thread
-        publish_thread = threading.Thread(target=self.publish_positions)
-        publish_thread.daemon = True
-        publish_thread.start()
-        
-        # Start display thread
-        display_thread = threading.Thread(target=self.display_status)
-        display_thread.daemon = True
-        display_thread.start()
+        tasks = [
+            asyncio.create_task(self.publish_positions()),
+            asyncio.create_task(self.display_status())
+        ]
         
         try:
             if duration:
                 console.print(f"[cyan]Running for {duration} seconds...[/cyan]")
-                time.sleep(duration)
+                await asyncio.sleep(duration)
+                self.running = False
             else:
                 console.print("[cyan]Running... Press Ctrl+C to stop[/cyan]")
-                while True:
-                    time.sleep(1)
-                    
+            
+            await asyncio.gather(*tasks)
+        
+        finally:
+            if self._backend == 'gmqtt':
+                await self.mqtt_client.disconnect()
+    
+    def run(self, duration: Optional[int] = None):
+        """Run the simulator."""
+        if self._backend == 'paho' and not self._init_mqtt():
+            return
+        
+        try:
+            run_loop = uvloop.run if uvloop is not None else asyncio.run
+            run_loop(self._run_loops(duration))
+        
         except KeyboardInterrupt:
             console.print("\n[yellow]Stopping simulator...[/yellow]")
         
@@ -230,127 +626,77 @@ class AGVSimulator:
         """Stop the simulator."""
         self.running = False
         
-        if self.mqtt_client:
+        # The gmqtt client is disconnected on its event loop in _run_loops
+        if self.mqtt_client and self._backend == 'paho':
             self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
         
         console.print(f"[green]Simulator stopped. Sent {self.stats['messages_sent']} messages[/green]")
+        if self.stats['dropped_ticks']:
+            console.print(
+                f"[yellow]{self.stats['dropped_ticks']} ticks dropped; "
+                f"the sample rate is too high for the fleet size[/yellow]"
+            )
 
 
 class SimulatedAGV:
-    """Represents a simulated AGV with realistic movement."""
+    """View of one AGV inside an ``AGVSimulator`` fleet.
     
-    def __init__(self, agv_id: str, agv_type: str, plant_bounds: Dict, config: Dict):
+    State lives in the simulator's arrays; this object only carries the
+    identity and exposes the AGV's current values for messages and display.
+    """
+    
+    def __init__(self, fleet: AGVSimulator, index: int, agv_id: str, agv_type: str, topic: str):
+        self.fleet = fleet
+        self.index = index
         self.agv_id = agv_id
         self.agv_type = agv_type
-        self.config = config
-        self.bounds = plant_bounds
-        
-        # Initialize position
-        self.x = random.uniform(bounds['xmin'] + 10, bounds['xmax'] - 10)
-        self.y = random.uniform(bounds['ymin'] + 10, bounds['ymax'] - 10)
-        self.heading = random.uniform(0, 360)
-        
-        # Movement parameters
-        self.base_speed = random.uniform(0.5, 2.0)
-        self.speed = self.base_speed
-        self.target_x = self.x
-        self.target_y = self.y
-        
-        # Status
-        self.battery = random.uniform(60, 100)
-        self.status = "ACTIVE"
-        self.quality = random.uniform(0.8, 1.0)
-        
-        # Path planning
-        self.waypoints = self._generate_path()
-        self.current_waypoint = 0
-    
-    def _generate_path(self) -> List[Tuple[float, float]]:
-        """Generate a random path through the plant."""
-        num_waypoints = random.randint(5, 15)
-        waypoints = []
-        
-        for _ in range(num_waypoints):
-            x = random.uniform(
-                self.bounds['xmin'] + 5,
-                self.bounds['xmax'] - 5
-            )
-            y = random.uniform(
-                self.bounds['ymin'] + 5,
-                self.bounds['ymax'] - 5
-            )
-            waypoints.append((x, y))
-        
-        return waypoints
+        self.topic = topic
     
-    def update(self):
-        """Update AGV position and status."""
-        # Check if reached current waypoint
-        if self.current_waypoint < len(self.waypoints):
-            target = self.waypoints[self.current_waypoint]
-            distance = np.sqrt((target[0] - self.x)**2 + (target[1] - self.y)**2)
-            
-            if distance < 2.0:  # Reached waypoint
-                self.current_waypoint += 1
-                if self.current_waypoint >= len(self.waypoints):
-                    # Generate new path
-                    self.waypoints = self._generate_path()
-                    self.current_waypoint = 0
-            
-            # Move towards target
-            if self.current_waypoint < len(self.waypoints):
-                target = self.waypoints[self.current_waypoint]
-                
-                # Calculate heading
-                dx = target[0] - self.x
-                dy = target[1] - self.y
-                self.heading = np.degrees(np.arctan2(dy, dx)) % 360
-                
-                # Add some noise to heading
-                self.heading += random.gauss(0, 5)
-                self.heading = self.heading % 360
-                
-                # Calculate speed with variation
-                self.speed = self.base_speed * (1 + random.gauss(0, self.config['speed_variation']))
-                self.speed = max(0.1, min(3.0, self.speed))
-                
-                # Update position
-                dt = 1.0 / self.config['sample_rate_hz']
-                self.x += self.speed * np.cos(np.radians(self.heading)) * dt
-                self.y += self.speed * np.sin(np.radians(self.heading)) * dt
-                
-                # Add position noise
-                self.x += random.gauss(0, self.config['position_noise'])
-                self.y += random.gauss(0, self.config['position_noise'])
-                
-                # Keep within bounds
-                self.x = max(self.bounds['xmin'], min(self.bounds['xmax'], self.x))
-                self.y = max(self.bounds['ymin'], min(self.bounds['ymax'], self.y))
-        
-        # Update battery
-        self.battery -= self.config['battery_drain_rate'] * self.speed
-        self.battery = max(0, self.battery)
-        
-        # Update status based on battery
-        if self.battery < 20:
-            self.status = "CHARGING" if random.random() < 0.1 else "LOW_BATTERY"
-        elif random.random() < 0.01:  # Occasional idle
-            self.status = "IDLE"
-        else:
-            self.status = "ACTIVE"
-        
-        # Update quality (signal strength simulation)
-        self.quality = min(1.0, max(0.3, self.quality + random.gauss(0, 0.05)))
+    @property
+    def x(self) -> float:
+        return float(self.fleet.x[self.index])
+    
+    @property
+    def y(self) -> float:
+        return float(self.fleet.y[self.index])
+    
+    @property
+    def heading(self) -> float:
+        return float(self.fleet.heading[self.index])
+    
+    @property
+    def speed(self) -> float:
+        return float(self.fleet.speed[self.index])
+    
+    @property
+    def battery(self) -> float:
+        return float(self.fleet.battery[self.index])
+    
+    @property
+    def quality(self) -> float:
+        return float(self.fleet.quality[self.index])
+    
+    @property
+    def satellites(self) -> int:
+        return int(self.fleet.satellites[self.index])
+    
+    @property
+    def hdop(self) -> float:
+        return float(self.fleet.hdop[self.index])
+    
+    @property
+    def status(self) -> str:
+        return STATUS_NAMES[self.fleet.status[self.index]]
     
-    def get_message(self) -> Dict:
-        """Get MQTT message for current state."""
+    def get_message(self, ts: str) -> Dict:
+        """Get MQTT message for current state at tick timestamp ``ts``."""
         # Convert to WGS84 (fake conversion for simulation)
         lat = 49.0 + (self.y / 111000)  # Rough conversion
         lon = 12.0 + (self.x / 111000)
         
         return {
-            'ts': datetime.now(timezone.utc).isoformat(),
+            'ts': ts,
             'agv_id': self.agv_id,
             'lat': lat,
             'lon': lon,
@@ -361,8 +707,8 @@ class SimulatedAGV:
             'quality': self.quality,
             'battery_percent': self.battery,
             'status': self.status,
-            'satellites': random.randint(8, 12),
-            'hdop': random.uniform(0.5, 1.5)
+            'satellites': self.satellites,
+            'hdop': self.hdop
         }
 
 
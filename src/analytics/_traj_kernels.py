@@ -0,0 +1,142 @@
+"""
+Numerical kernels behind TrajectoryAnalyzer.
+
+Each kernel takes plain ndarrays extracted from the trajectory DataFrame.
+With Numba installed they are compiled single-pass loops; otherwise the
+NumPy versions below are used, with the same signatures and results.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def stats_kernel(x: np.ndarray, y: np.ndarray, speeds: np.ndarray):
+    """
+    Path length and speed statistics of a trajectory.
+
+    Returns:
+        (total_distance, stop_samples, min_moving_speed, max_speed,
+        mean_speed). stop_samples counts speeds below 0.1 m/s;
+        min_moving_speed is the lowest speed above zero, NaN if none.
+        The speed figures are NaN for an empty ``speeds``.
+    """
+    total_distance = np.hypot(np.diff(x), np.diff(y)).sum()
+
+    if len(speeds) == 0:
+        return total_distance, 0, np.nan, np.nan, np.nan
+
+    moving = speeds[speeds > 0]
+    min_moving = moving.min() if len(moving) > 0 else np.nan
+    stop_samples = np.count_nonzero(speeds < 0.1)
+    return total_distance, stop_samples, min_moving, speeds.max(), speeds.mean()
+
+
+def stops_kernel(speeds: np.ndarray, threshold: float, min_samples: int):
+    """
+    Runs of consecutive samples with speed below ``threshold``.
+
+    Returns:
+        (starts, ends) int64 arrays; run k covers samples
+        starts[k]:ends[k]. Runs shorter than ``min_samples`` are dropped.
+    """
+    stopped = np.zeros(len(speeds) + 2, dtype=np.int8)
+    stopped[1:-1] = speeds < threshold
+    edges = np.diff(stopped)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = ends - starts >= min_samples
+    return starts[keep], ends[keep]
+
+
+def turn_kernel(headings: np.ndarray, sample_rate: float):
+    """
+    Turn statistics from consecutive heading samples (at least two).
+
+    Returns:
+        (significant_turns, mean_turn_rate, max_turn_rate), counting
+        heading changes above 30 degrees, with rates in degrees/second.
+    """
+    # Heading changes wrapped into [-180, 180) (e.g., 359° to 1° is +2°),
+    # folded to magnitudes and scaled to rates in place
+    changes = np.diff(headings)
+    changes += 180.0
+    np.mod(changes, 360.0, out=changes)
+    changes -= 180.0
+    np.abs(changes, out=changes)
+
+    significant_turns = np.count_nonzero(changes > 30)
+    changes *= sample_rate
+    return significant_turns, changes.mean(), changes.max()
+
+
+if njit is not None:
+    # fastmath is left off: it would let LLVM drop the NaN checks
+
+    @njit(cache=True)
+    def stats_kernel(x, y, speeds):  # noqa: F811
+        total_distance = 0.0
+        for k in range(1, len(x)):
+            total_distance += np.hypot(x[k] - x[k - 1], y[k] - y[k - 1])
+
+        n = len(speeds)
+        if n == 0:
+            return total_distance, 0, np.nan, np.nan, np.nan
+
+        stop_samples = 0
+        min_moving = np.inf
+        max_speed = speeds[0]
+        speed_sum = 0.0
+        for k in range(n):
+            s = speeds[k]
+            if s < 0.1:
+                stop_samples += 1
+            if 0 < s < min_moving:
+                min_moving = s
+            if s > max_speed or s != s:  # NaN propagates like np.max
+                max_speed = s
+            speed_sum += s
+
+        if min_moving == np.inf:
+            min_moving = np.nan
+        return total_distance, stop_samples, min_moving, max_speed, speed_sum / n
+
+    @njit(cache=True)
+    def stops_kernel(speeds, threshold, min_samples):  # noqa: F811
+        starts = np.empty(len(speeds), dtype=np.int64)
+        ends = np.empty(len(speeds), dtype=np.int64)
+        count = 0
+        run_start = -1
+        for k in range(len(speeds)):
+            if speeds[k] < threshold:
+                if run_start < 0:
+                    run_start = k
+            elif run_start >= 0:
+                if k - run_start >= min_samples:
+                    starts[count] = run_start
+                    ends[count] = k
+                    count += 1
+                run_start = -1
+        if run_start >= 0 and len(speeds) - run_start >= min_samples:
+            starts[count] = run_start
+            ends[count] = len(speeds)
+            count += 1
+        return starts[:count], ends[:count]
+
+    @njit(cache=True)
+    def turn_kernel(headings, sample_rate):  # noqa: F811
+        significant_turns = 0
+        rate_sum = 0.0
+        max_rate = 0.0
+        for k in range(1, len(headings)):
+            change = abs((headings[k] - headings[k - 1] + 180.0) % 360.0 - 180.0)
+            if change > 30:
+                significant_turns += 1
+            rate = change * sample_rate
+            if rate > max_rate or rate != rate:
+                max_rate = rate
+            rate_sum += rate
+        return significant_turns, rate_sum / (len(headings) - 1), max_rate
@@ -0,0 +1,47 @@
+"""
+Classification kernels behind ZoneAnalytics.
+
+The kernel takes float64 column arrays (one entry per zone) and returns an
+int8 array of bit flags. With Numba installed it is a compiled loop;
+otherwise the NumPy version below is used, with the same results.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# bottleneck_flags bits
+CROWDED = 1      # current_agvs >= 80% of max_agvs
+AT_CAPACITY = 2  # current_agvs >= max_agvs
+SLOW = 4         # avg_speed < 50% of max_speed
+
+
+def bottleneck_flags(current_agvs: np.ndarray, max_agvs: np.ndarray,
+                     avg_speed: np.ndarray, max_speed: np.ndarray) -> np.ndarray:
+    """Occupancy and speed bottleneck flags per zone."""
+    flags = np.zeros(len(current_agvs), dtype=np.int8)
+    flags[current_agvs >= max_agvs * 0.8] |= CROWDED
+    flags[current_agvs >= max_agvs] |= AT_CAPACITY
+    flags[avg_speed < max_speed * 0.5] |= SLOW
+    return flags
+
+
+if njit is not None:
+    # fastmath is left off: NaN inputs (e.g. a NULL avg_speed) must compare False
+
+    @njit(cache=True)
+    def bottleneck_flags(current_agvs, max_agvs, avg_speed, max_speed):  # noqa: F811
+        flags = np.zeros(len(current_agvs), dtype=np.int8)
+        for k in range(len(current_agvs)):
+            f = 0
+            if current_agvs[k] >= max_agvs[k] * 0.8:
+                f |= CROWDED
+            if current_agvs[k] >= max_agvs[k]:
+                f |= AT_CAPACITY
+            if avg_speed[k] < max_speed[k] * 0.5:
+                f |= SLOW
+            flags[k] = f
+        return flags
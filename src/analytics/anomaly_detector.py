@@ -8,8 +8,10 @@ import pandas as pd
 from typing import Dict, List, Tuple, Optional, Any
 from datetime import datetime, timedelta
 from collections import deque
+from threading import Lock, Timer
 import json
-from scipy import stats
+from joblib import Parallel, delayed
+from scipy.spatial import cKDTree
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import warnings
@@ -19,15 +21,50 @@ from loguru import logger
 from src.core.database import db_manager
 
 
+# Fields kept in each AGV's history buffer, in column order
+HISTORY_FIELDS = ['speed_mps', 'heading_deg', 'quality',
+                  'battery_percent', 'plant_x', 'plant_y']
+SPEED, HEADING, QUALITY, BATTERY, PLANT_X, PLANT_Y = range(len(HISTORY_FIELDS))
+
+# Trailing samples used by the idle and erratic-heading pattern checks
+IDLE_WINDOW = 30
+HEADING_WINDOW = 10
+
+# Fleet size from which collision candidates come from a k-d tree range
+# query rather than from enumerating every pair
+KDTREE_MIN_FLEET = 64
+
+
+def _heading_change(previous: float, current: float) -> float:
+    """Absolute heading change in degrees, accounting for wrap-around."""
+    change = abs(current - previous)
+    return min(change, 360 - change)
+
+
 class AnomalyDetector:
     """Detects anomalies in AGV behavior using multiple methods."""
     
     def __init__(self, config: Optional[Dict] = None):
         self.config = config or self._default_config()
-        self.history = {}  # AGV-specific history
+        self.history = {}  # AGV-specific history ring buffers
         self.models = {}  # ML models per AGV
         self.scaler = StandardScaler()
         self.anomaly_buffer = deque(maxlen=1000)
+        
+        # Anomaly events waiting for a batched database write
+        self._pending_events = []
+        self._pending_lock = Lock()
+        self._flush_timer = None
+        
+        # Threshold limits packed as [speed, -quality, -battery], so one
+        # greater-than compare flags any violation
+        self._thresholds = np.array([
+            self.config['speed_threshold'],
+            -self.config['quality_threshold'],
+            -self.config['battery_threshold']
+        ])
+        self._quiet_samples = {}  # Samples per AGV since the last full check
+        
         self._initialize_models()
     
     def _default_config(self) -> Dict:
@@ -42,7 +79,11 @@ class AnomalyDetector:
             'collision_threshold': 2.0,  # meters
             'ml_enabled': True,
             'ml_contamination': 0.1,  # Expected anomaly rate
+            'ml_n_jobs': -1,  # Workers for model fitting (-1 = all cores)
             'history_window': 100,  # Number of points to keep
+            'full_check_interval': 10,  # Run ML and pattern methods at least every N samples
+            'event_batch_size': 100,  # Anomaly events per database write
+            'event_flush_interval': 5.0,  # seconds
             'detection_methods': [
                 'threshold',
                 'statistical',
@@ -58,7 +99,8 @@ class AnomalyDetector:
             self.isolation_forest = IsolationForest(
                 contamination=self.config['ml_contamination'],
                 random_state=42,
-                n_estimators=100
+                n_estimators=100,
+                n_jobs=self.config.get('ml_n_jobs', -1)
             )
     
     def check(self, data: Dict) -> bool:
@@ -74,25 +116,40 @@ class AnomalyDetector:
         anomalies = []
         agv_id = data.get('agv_id')
         
-        # Initialize history for new AGV
-        if agv_id not in self.history:
-            self.history[agv_id] = deque(maxlen=self.config['history_window'])
-        
         # Add to history
-        self.history[agv_id].append(data)
+        self._append_history(agv_id, data)
+        
+        # Fast path: with no threshold violated, the ML and pattern methods
+        # only run every full_check_interval samples. The statistical checks
+        # look at the current sample alone (O(1) with the Welford stats), so
+        # they run on every sample to catch single-sample spikes.
+        sample = np.array([
+            data.get('speed_mps', 0),
+            -data.get('quality', 1.0),
+            -data.get('battery_percent', 100)
+        ], dtype=np.float64)
+        violated = bool((sample > self._thresholds).any())
+        full_check = violated
+        if not violated:
+            quiet = self._quiet_samples.get(agv_id, 0) + 1
+            full_check = quiet >= self.config.get('full_check_interval', 1)
+            self._quiet_samples[agv_id] = quiet
+        if full_check:
+            self._quiet_samples[agv_id] = 0
         
         # Run detection methods
-        if 'threshold' in self.config['detection_methods']:
+        if violated and 'threshold' in self.config['detection_methods']:
             anomalies.extend(self._threshold_detection(data))
         
         if 'statistical' in self.config['detection_methods']:
             anomalies.extend(self._statistical_detection(data, agv_id))
         
-        if 'ml_isolation' in self.config['detection_methods'] and self.config['ml_enabled']:
-            anomalies.extend(self._ml_detection(data, agv_id))
-        
-        if 'pattern' in self.config['detection_methods']:
-            anomalies.extend(self._pattern_detection(data, agv_id))
+        if full_check:
+            if 'ml_isolation' in self.config['detection_methods'] and self.config['ml_enabled']:
+                anomalies.extend(self._ml_detection(data, agv_id))
+            
+            if 'pattern' in self.config['detection_methods']:
+                anomalies.extend(self._pattern_detection(data, agv_id))
         
         # Log anomalies
         if anomalies:
@@ -101,6 +158,115 @@ class AnomalyDetector:
         
         return False
     
+    def _append_history(self, agv_id: str, data: Dict):
+        """Write a data point into the AGV's history ring buffer.
+        
+        Each buffer holds ``history_window`` rows of HISTORY_FIELDS twice
+        over (a mirrored ring), so the latest rows are always one contiguous
+        slice. Missing fields are stored as NaN.
+        
+        The per-field count, mean and M2 of the window are updated with
+        Welford's method as rows enter and leave, so z-scores need no pass
+        over the window.
+        """
+        history = self.history.get(agv_id)
+        if history is None:
+            window = self.config['history_window']
+            history = self.history[agv_id] = {
+                'buf': np.full((2 * window, len(HISTORY_FIELDS)), np.nan),
+                'idx': 0,
+                'n': 0,
+                'count': np.zeros(len(HISTORY_FIELDS)),
+                'mean': np.zeros(len(HISTORY_FIELDS)),
+                'm2': np.zeros(len(HISTORY_FIELDS)),
+                'idle': 0,
+                'heading_sum': 0.0,
+                'heading_nan': 0
+            }
+        
+        buf = history['buf']
+        window = len(buf) // 2
+        pos = history['idx']
+        row = np.array([data.get(field) for field in HISTORY_FIELDS], dtype=np.float64)
+        
+        # The row being overwritten is the oldest in a full window
+        if history['n'] == window:
+            self._window_remove(history, buf[pos])
+        self._window_add(history, row)
+        if window >= IDLE_WINDOW:
+            self._update_pattern_sums(history, row)
+        
+        buf[pos] = row
+        buf[pos + window] = row
+        
+        history['idx'] = (pos + 1) % window
+        history['n'] = min(history['n'] + 1, window)
+    
+    @staticmethod
+    def _window_add(history: Dict, row: np.ndarray):
+        """Add a row's non-NaN fields to the running window statistics."""
+        valid = ~np.isnan(row)
+        count, mean, m2 = history['count'], history['mean'], history['m2']
+        
+        count += valid
+        delta = np.where(valid, row - mean, 0.0)
+        mean += np.divide(delta, count, out=np.zeros_like(delta), where=valid)
+        m2 += delta * np.where(valid, row - mean, 0.0)
+    
+    @staticmethod
+    def _window_remove(history: Dict, row: np.ndarray):
+        """Remove a row's non-NaN fields from the running window statistics."""
+        valid = ~np.isnan(row)
+        count, mean, m2 = history['count'], history['mean'], history['m2']
+        
+        count -= valid
+        delta = np.where(valid, row - mean, 0.0)
+        mean -= np.divide(delta, count, out=np.zeros_like(delta), where=valid & (count > 0))
+        m2 -= delta * np.where(valid, row - mean, 0.0)
+        
+        # Reset emptied fields and clamp rounding drift
+        empty = count == 0
+        mean[empty] = 0.0
+        m2[empty] = 0.0
+        np.maximum(m2, 0.0, out=m2)
+    
+    @staticmethod
+    def _update_pattern_sums(history: Dict, row: np.ndarray):
+        """Update the rolling idle count and heading-change sum for a new row.
+        
+        Called before ``row`` is written; the samples leaving each trailing
+        window are read from the buffer, so each update is O(1). Heading
+        changes involving a missing heading are counted in ``heading_nan``.
+        """
+        buf = history['buf']
+        end = history['idx'] + len(buf) // 2  # One past the latest row
+        n = history['n']
+        
+        history['idle'] += int(row[SPEED] < 0.1)
+        if n >= IDLE_WINDOW:
+            history['idle'] -= int(buf[end - IDLE_WINDOW, SPEED] < 0.1)
+        
+        if n >= 1:
+            change = _heading_change(buf[end - 1, HEADING], row[HEADING])
+            if np.isnan(change):
+                history['heading_nan'] += 1
+            else:
+                history['heading_sum'] += change
+        if n >= HEADING_WINDOW:
+            change = _heading_change(buf[end - HEADING_WINDOW, HEADING],
+                                     buf[end - HEADING_WINDOW + 1, HEADING])
+            if np.isnan(change):
+                history['heading_nan'] -= 1
+            else:
+                history['heading_sum'] -= change
+    
+    def _recent_history(self, agv_id: str) -> np.ndarray:
+        """History of an AGV as an (n, len(HISTORY_FIELDS)) view, oldest first."""
+        history = self.history[agv_id]
+        window = len(history['buf']) // 2
+        end = history['idx'] + window
+        return history['buf'][end - history['n']:end]
+    
     def _threshold_detection(self, data: Dict) -> List[Dict]:
         """Simple threshold-based anomaly detection."""
         anomalies = []
@@ -144,59 +310,61 @@ class AnomalyDetector:
         """Statistical anomaly detection using z-scores."""
         anomalies = []
         
-        if len(self.history[agv_id]) < 10:
+        window_stats = self.history[agv_id]
+        history = self._recent_history(agv_id)
+        if len(history) < 10:
             return anomalies
         
-        # Extract historical values
-        history_df = pd.DataFrame(list(self.history[agv_id]))
-        
-        # Calculate z-scores for numerical fields
-        numerical_fields = ['speed_mps', 'heading_deg', 'quality']
-        
-        for field in numerical_fields:
-            if field in history_df.columns:
-                values = history_df[field].dropna()
-                if len(values) > 3:
-                    z_score = np.abs(stats.zscore(values))[-1]
-                    
-                    if z_score > 3:  # 3 standard deviations
-                        anomalies.append({
-                            'type': 'STATISTICAL_ANOMALY',
-                            'severity': 'INFO',
-                            'field': field,
-                            'z_score': float(z_score),
-                            'value': data.get(field),
-                            'message': f"Unusual {field} value detected (z-score: {z_score:.2f})"
-                        })
-        
-        # Check for acceleration anomalies
-        if 'speed_mps' in history_df.columns and len(history_df) > 1:
-            speeds = history_df['speed_mps'].values
-            accelerations = np.diff(speeds) * self.config.get('sample_rate_hz', 3)
-            
-            if len(accelerations) > 0:
-                current_accel = accelerations[-1]
-                if abs(current_accel) > self.config['acceleration_threshold']:
+        # Calculate z-scores for numerical fields against the running
+        # window mean and (population) variance
+        numerical_fields = {'speed_mps': SPEED, 'heading_deg': HEADING, 'quality': QUALITY}
+        latest = history[-1]
+        
+        for field, col in numerical_fields.items():
+            count = window_stats['count'][col]
+            if count > 3 and not np.isnan(latest[col]):
+                variance = window_stats['m2'][col] / count
+                if variance <= 1e-12:  # Constant values have no z-score
+                    continue
+                z_score = abs(latest[col] - window_stats['mean'][col]) / np.sqrt(variance)
+                
+                if z_score > 3:  # 3 standard deviations
                     anomalies.append({
-                        'type': 'ACCELERATION_ANOMALY',
-                        'severity': 'WARNING',
-                        'value': float(current_accel),
-                        'threshold': self.config['acceleration_threshold'],
-                        'message': f"High acceleration detected: {current_accel:.2f} m/s²"
+                        'type': 'STATISTICAL_ANOMALY',
+                        'severity': 'INFO',
+                        'field': field,
+                        'z_score': float(z_score),
+                        'value': data.get(field),
+                        'message': f"Unusual {field} value detected (z-score: {z_score:.2f})"
                     })
         
+        # Check for acceleration anomalies
+        speeds = history[:, SPEED]
+        accelerations = np.diff(speeds) * self.config.get('sample_rate_hz', 3)
+        
+        if len(accelerations) > 0:
+            current_accel = accelerations[-1]
+            if abs(current_accel) > self.config['acceleration_threshold']:
+                anomalies.append({
+                    'type': 'ACCELERATION_ANOMALY',
+                    'severity': 'WARNING',
+                    'value': float(current_accel),
+                    'threshold': self.config['acceleration_threshold'],
+                    'message': f"High acceleration detected: {current_accel:.2f} m/s²"
+                })
+        
         return anomalies
     
     def _ml_detection(self, data: Dict, agv_id: str) -> List[Dict]:
         """Machine learning based anomaly detection."""
         anomalies = []
         
-        if len(self.history[agv_id]) < 20:
+        if self.history[agv_id]['n'] < 20:
             return anomalies
         
         try:
             # Prepare features
-            features = self._extract_features(data)
+            features = self._extract_features(agv_id)
             
             if features is not None:
                 # Ensure we have a trained model
@@ -204,12 +372,20 @@ class AnomalyDetector:
                     self._train_model(agv_id)
                 
                 if agv_id in self.models:
-                    # Predict
-                    features_scaled = self.models[agv_id]['scaler'].transform([features])
-                    prediction = self.models[agv_id]['model'].predict(features_scaled)
+                    model_info = self.models[agv_id]
+                    
+                    # Scale with the fitted float32 statistics directly,
+                    # skipping sklearn's per-call input validation; missing
+                    # values are zero-filled as in training
+                    x = np.nan_to_num(features[model_info['columns']], nan=0.0).astype(np.float32)
+                    features_scaled = ((x - model_info['mean']) / model_info['scale'])[None, :]
+                    
+                    # Score once and threshold locally; predict() would
+                    # traverse the trees again for the same decision
+                    model = model_info['model']
+                    score = model.score_samples(features_scaled)[0]
                     
-                    if prediction[0] == -1:  # Anomaly
-                        score = self.models[agv_id]['model'].score_samples(features_scaled)[0]
+                    if score < model.offset_:  # Anomaly
                         anomalies.append({
                             'type': 'ML_ANOMALY',
                             'severity': 'INFO',
@@ -226,88 +402,77 @@ class AnomalyDetector:
         """Detect specific movement patterns."""
         anomalies = []
         
-        if len(self.history[agv_id]) < 30:
+        window_stats = self.history[agv_id]
+        history = self._recent_history(agv_id)
+        if len(history) < IDLE_WINDOW:
             return anomalies
         
-        history_df = pd.DataFrame(list(self.history[agv_id]))
+        # Check for idle time, from the rolling count
+        idle_count = window_stats['idle']
+        idle_seconds = idle_count / self.config.get('sample_rate_hz', 3)
+        
+        if idle_seconds > self.config['idle_threshold']:
+            anomalies.append({
+                'type': 'EXCESSIVE_IDLE',
+                'severity': 'WARNING',
+                'idle_time': float(idle_seconds),
+                'threshold': self.config['idle_threshold'],
+                'message': f"AGV idle for {idle_seconds:.0f} seconds"
+            })
         
-        # Check for idle time
-        if 'speed_mps' in history_df.columns:
-            recent_speeds = history_df['speed_mps'].tail(30).values
-            idle_count = np.sum(recent_speeds < 0.1)
-            idle_seconds = idle_count / self.config.get('sample_rate_hz', 3)
+        # Check for circular movement (stuck)
+        positions = history[-20:, PLANT_X:PLANT_Y + 1]
+        if len(positions) > 10:
+            # Calculate total distance vs displacement
+            total_distance = np.sum(np.linalg.norm(np.diff(positions, axis=0), axis=1))
+            displacement = np.linalg.norm(positions[-1] - positions[0])
             
-            if idle_seconds > self.config['idle_threshold']:
+            if total_distance > 0 and displacement / total_distance < 0.2:
                 anomalies.append({
-                    'type': 'EXCESSIVE_IDLE',
+                    'type': 'CIRCULAR_MOVEMENT',
                     'severity': 'WARNING',
-                    'idle_time': float(idle_seconds),
-                    'threshold': self.config['idle_threshold'],
-                    'message': f"AGV idle for {idle_seconds:.0f} seconds"
+                    'total_distance': float(total_distance),
+                    'displacement': float(displacement),
+                    'message': "AGV appears to be moving in circles"
                 })
         
-        # Check for circular movement (stuck)
-        if 'plant_x' in history_df.columns and 'plant_y' in history_df.columns:
-            positions = history_df[['plant_x', 'plant_y']].tail(20).values
-            if len(positions) > 10:
-                # Calculate total distance vs displacement
-                total_distance = np.sum(np.linalg.norm(np.diff(positions, axis=0), axis=1))
-                displacement = np.linalg.norm(positions[-1] - positions[0])
-                
-                if total_distance > 0 and displacement / total_distance < 0.2:
-                    anomalies.append({
-                        'type': 'CIRCULAR_MOVEMENT',
-                        'severity': 'WARNING',
-                        'total_distance': float(total_distance),
-                        'displacement': float(displacement),
-                        'message': "AGV appears to be moving in circles"
-                    })
-        
-        # Check for erratic heading changes
-        if 'heading_deg' in history_df.columns:
-            headings = history_df['heading_deg'].tail(10).values
-            heading_changes = np.abs(np.diff(headings))
-            # Handle wrap-around
-            heading_changes = np.minimum(heading_changes, 360 - heading_changes)
+        # Check for erratic heading changes, from the rolling sum of
+        # wrap-around corrected changes; a missing heading disables the check
+        if window_stats['heading_nan'] == 0:
+            avg_change = window_stats['heading_sum'] / (HEADING_WINDOW - 1)
             
-            if np.mean(heading_changes) > 45:  # Average change > 45 degrees
+            if avg_change > 45:  # Average change > 45 degrees
                 anomalies.append({
                     'type': 'ERRATIC_HEADING',
                     'severity': 'INFO',
-                    'avg_change': float(np.mean(heading_changes)),
+                    'avg_change': float(avg_change),
                     'message': "Erratic heading changes detected"
                 })
         
         return anomalies
     
-    def _extract_features(self, data: Dict) -> Optional[np.ndarray]:
-        """Extract features for ML model."""
-        try:
-            features = [
-                data.get('speed_mps', 0),
-                data.get('heading_deg', 0),
-                data.get('quality', 1.0),
-                data.get('battery_percent', 100),
-                data.get('plant_x', 0),
-                data.get('plant_y', 0)
-            ]
-            return np.array(features)
-        except:
+    def _extract_features(self, agv_id: str) -> Optional[np.ndarray]:
+        """Latest HISTORY_FIELDS row of an AGV, as a view into its history."""
+        history = self.history.get(agv_id)
+        if history is None or history['n'] == 0:
             return None
+        
+        window = len(history['buf']) // 2
+        return history['buf'][history['idx'] - 1 + window]
     
     def _train_model(self, agv_id: str):
         """Train ML model for specific AGV."""
         try:
-            history_df = pd.DataFrame(list(self.history[agv_id]))
-            
-            # Extract features
-            feature_cols = ['speed_mps', 'heading_deg', 'quality', 
-                          'battery_percent', 'plant_x', 'plant_y']
+            history = self._recent_history(agv_id)
             
-            available_cols = [col for col in feature_cols if col in history_df.columns]
+            # Extract features present in at least one data point
+            available = ~np.isnan(history).all(axis=0)
+            available_cols = [field for field, present in zip(HISTORY_FIELDS, available) if present]
             
             if len(available_cols) >= 3:
-                X = history_df[available_cols].fillna(0).values
+                # float32 throughout: the trees split on float32 anyway, so
+                # this avoids a conversion on every fit and score
+                X = np.nan_to_num(history[:, available], nan=0.0).astype(np.float32)
                 
                 # Scale features
                 scaler = StandardScaler()
@@ -316,14 +481,18 @@ class AnomalyDetector:
                 # Train Isolation Forest
                 model = IsolationForest(
                     contamination=self.config['ml_contamination'],
-                    random_state=42
+                    random_state=42,
+                    n_jobs=self.config.get('ml_n_jobs', -1)
                 )
                 model.fit(X_scaled)
                 
                 self.models[agv_id] = {
                     'model': model,
                     'scaler': scaler,
-                    'features': available_cols
+                    'mean': scaler.mean_.astype(np.float32),
+                    'scale': scaler.scale_.astype(np.float32),
+                    'features': available_cols,
+                    'columns': np.flatnonzero(available)
                 }
                 
                 logger.debug(f"Trained ML model for {agv_id}")
@@ -331,9 +500,27 @@ class AnomalyDetector:
         except Exception as e:
             logger.debug(f"Failed to train model for {agv_id}: {e}")
     
+    def retrain_all(self):
+        """Retrain the ML models of all AGVs with enough history.
+        
+        Fits run concurrently on threads (tree building releases the GIL),
+        so the detector itself is shared rather than pickled to workers.
+        """
+        agv_ids = [agv_id for agv_id, history in self.history.items() if history['n'] >= 20]
+        Parallel(n_jobs=self.config.get('ml_n_jobs', -1), prefer='threads')(
+            delayed(self._train_model)(agv_id) for agv_id in agv_ids
+        )
+        logger.info(f"Retrained ML models for {len(agv_ids)} AGVs")
+    
     def _log_anomalies(self, data: Dict, anomalies: List[Dict]):
-        """Log detected anomalies to database."""
+        """Queue detected anomalies for the database.
+        
+        Events are written in batches by ``flush_events``, once
+        ``event_batch_size`` are queued or ``event_flush_interval`` seconds
+        after the first queued event, whichever comes first.
+        """
         try:
+            rows = []
             for anomaly in anomalies:
                 # Add to buffer
                 self.anomaly_buffer.append({
@@ -342,12 +529,7 @@ class AnomalyDetector:
                     'anomaly': anomaly
                 })
                 
-                # Log to database
-                db_manager.execute_query("""
-                    INSERT INTO system_events 
-                    (event_type, severity, agv_id, zone_id, message, details)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
+                rows.append((
                     anomaly['type'],
                     anomaly['severity'],
                     data.get('agv_id'),
@@ -357,52 +539,106 @@ class AnomalyDetector:
                 ))
                 
                 logger.info(f"Anomaly detected for {data.get('agv_id')}: {anomaly['type']}")
+            
+            with self._pending_lock:
+                self._pending_events.extend(rows)
+                flush_now = len(self._pending_events) >= self.config.get('event_batch_size', 100)
+                if not flush_now and self._flush_timer is None:
+                    self._flush_timer = Timer(
+                        self.config.get('event_flush_interval', 5.0), self.flush_events
+                    )
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+            
+            if flush_now:
+                self.flush_events()
         
         except Exception as e:
             logger.error(f"Failed to log anomaly: {e}")
     
+    def flush_events(self):
+        """Write all queued anomaly events to the database in one batch."""
+        with self._pending_lock:
+            rows, self._pending_events = self._pending_events, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        
+        if not rows:
+            return
+        
+        try:
+            db_manager.execute_many("""
+                INSERT INTO system_events 
+                (event_type, severity, agv_id, zone_id, message, details)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, rows)
+        except Exception as e:
+            logger.error(f"Failed to log {len(rows)} anomalies: {e}")
+    
     def detect_collision_risk(self, fleet_positions: pd.DataFrame) -> List[Dict]:
-        """Detect potential collision risks between AGVs."""
+        """Detect potential collision risks between AGVs.
+        
+        ``fleet_positions`` may be a DataFrame or any mapping of column name
+        to array; the columns are read once into NumPy arrays.
+        """
         collision_risks = []
         
-        if len(fleet_positions) < 2:
+        agv_ids = np.asarray(fleet_positions['agv_id'])
+        if len(agv_ids) < 2:
             return collision_risks
         
-        # Calculate pairwise distances
-        for i in range(len(fleet_positions)):
-            for j in range(i + 1, len(fleet_positions)):
-                agv1 = fleet_positions.iloc[i]
-                agv2 = fleet_positions.iloc[j]
-                
-                distance = np.sqrt(
-                    (agv1['plant_x'] - agv2['plant_x'])**2 +
-                    (agv1['plant_y'] - agv2['plant_y'])**2
-                )
-                
-                if distance < self.config['collision_threshold']:
-                    # Calculate time to collision based on velocities
-                    v1 = np.array([
-                        agv1['speed_mps'] * np.cos(np.radians(agv1['heading_deg'])),
-                        agv1['speed_mps'] * np.sin(np.radians(agv1['heading_deg']))
-                    ])
-                    v2 = np.array([
-                        agv2['speed_mps'] * np.cos(np.radians(agv2['heading_deg'])),
-                        agv2['speed_mps'] * np.sin(np.radians(agv2['heading_deg']))
-                    ])
-                    
-                    relative_velocity = np.linalg.norm(v1 - v2)
-                    
-                    if relative_velocity > 0:
-                        time_to_collision = distance / relative_velocity
-                        
-                        if time_to_collision < 5:  # Less than 5 seconds
-                            collision_risks.append({
-                                'agv1': agv1['agv_id'],
-                                'agv2': agv2['agv_id'],
-                                'distance': float(distance),
-                                'time_to_collision': float(time_to_collision),
-                                'severity': 'CRITICAL' if time_to_collision < 2 else 'WARNING'
-                            })
+        x = np.asarray(fleet_positions['plant_x'], dtype=float)
+        y = np.asarray(fleet_positions['plant_y'], dtype=float)
+        speed = np.asarray(fleet_positions['speed_mps'], dtype=float)
+        heading_deg = np.asarray(fleet_positions['heading_deg'], dtype=float)
+        threshold = self.config['collision_threshold']
+        
+        # Pairs i < j inside the collision threshold. Small fleets check all
+        # pairs at once; large ones ask a k-d tree for the pairs in range.
+        if len(agv_ids) < KDTREE_MIN_FLEET:
+            i, j = np.triu_indices(len(agv_ids), k=1)
+        else:
+            pairs = cKDTree(np.column_stack((x, y))).query_pairs(r=threshold, output_type='ndarray')
+            pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+            i, j = pairs[:, 0], pairs[:, 1]
+        dx = x[i] - x[j]
+        dy = y[i] - y[j]
+        distance_sq = dx * dx + dy * dy
+        close = np.flatnonzero(distance_sq < threshold * threshold)
+        i, j, distance_sq = i[close], j[close], distance_sq[close]
+        
+        # Velocity components, evaluated once per AGV that is in a close pair
+        vx = np.zeros(len(agv_ids))
+        vy = np.zeros(len(agv_ids))
+        nearby = np.union1d(i, j)
+        heading = np.radians(heading_deg[nearby])
+        vx[nearby] = speed[nearby] * np.cos(heading)
+        vy[nearby] = speed[nearby] * np.sin(heading)
+        
+        dvx = vx[i] - vx[j]
+        dvy = vy[i] - vy[j]
+        relative_velocity_sq = dvx * dvx + dvy * dvy
+        
+        # Pairs with less than 5 seconds to collision, compared in
+        # squares (distance / v < 5  <=>  distance² < 25·v²) so only the
+        # risky pairs take a square root
+        risky = np.flatnonzero(
+            (relative_velocity_sq > 0)
+            & (distance_sq < 25 * relative_velocity_sq)
+        )
+        distance = np.sqrt(distance_sq[risky])
+        time_to_collision = distance / np.sqrt(relative_velocity_sq[risky])
+        
+        for k, pair in enumerate(risky):
+            ttc = float(time_to_collision[k])
+            collision_risks.append({
+                'agv1': agv_ids[i[pair]],
+                'agv2': agv_ids[j[pair]],
+                'distance': float(distance[k]),
+                'time_to_collision': ttc,
+                'severity': 'CRITICAL' if ttc < 2 else 'WARNING'
+            })
         
         return collision_risks
     
@@ -6,21 +6,44 @@ import numpy as np
 import pandas as pd
 from typing import Dict, Tuple, Optional, List
 from datetime import datetime, timedelta
+from threading import Lock
+from cachetools import TTLCache
+import diskcache
 from scipy.ndimage import gaussian_filter
+from scipy.signal import fftconvolve
 import datashader as ds
-import datashader.transfer_functions as tf
-from datashader.colors import viridis
 
 from loguru import logger
 from src.core.database import db_manager
 
 
+# Gaussian blob stamped around each zone centroid in zone heatmaps,
+# indexed [dy, dx] for offsets -5..5 grid cells
+_BLOB_OFFSETS = np.arange(-5, 6)
+_BLOB_KERNEL = np.exp(-np.add.outer(_BLOB_OFFSETS**2, _BLOB_OFFSETS**2) / 10)
+
+# Grids larger than this are smoothed by FFT convolution instead of
+# gaussian_filter
+FFT_SMOOTHING_MIN_SIZE = 40_000
+
+
 class HeatmapGenerator:
     """Generates heatmaps for AGV position density visualization."""
     
     def __init__(self, config: Optional[Dict] = None):
         self.config = config or self._default_config()
-        self.cache = {}
+        
+        # Bounded LRU of recent heatmaps, entries expiring after cache_ttl.
+        # With cache_dir set, results are also shared between worker
+        # processes through an on-disk cache.
+        self.cache = TTLCache(
+            maxsize=self.config.get('cache_size', 128),
+            ttl=self.config['cache_ttl']
+        )
+        self._cache_lock = Lock()
+        cache_dir = self.config.get('cache_dir')
+        self.shared_cache = diskcache.Cache(cache_dir) if cache_dir else None
+        self._kernels = {}  # Gaussian smoothing kernels by sigma
         
     def _default_config(self) -> Dict:
         """Default heatmap configuration."""
@@ -29,7 +52,11 @@ class HeatmapGenerator:
             'smoothing': 1.0,
             'min_samples': 10,
             'cache_ttl': 300,  # seconds
+            'cache_size': 128,  # heatmaps kept in memory
+            'cache_dir': None,  # diskcache directory shared by workers
             'use_datashader': True,
+            'db_histogram': True,  # Bin positions in SQL instead of fetching them
+            'coverage_cell_size': 1.0,  # meters per coverage grid cell
             'colormap': 'viridis',
             'bounds': {
                 'xmin': 0, 'xmax': 200,
@@ -50,32 +77,66 @@ class HeatmapGenerator:
             zone_id: Optional zone filter
             
         Returns:
-            Dictionary with heatmap data
+            Dictionary with heatmap data. 'z', 'x' and 'y' are NumPy arrays;
+            serialize with orjson's OPT_SERIALIZE_NUMPY.
         """
         # Check cache
-        cache_key = f"{start_time}_{end_time}_{agv_ids}_{zone_id}"
-        if cache_key in self.cache:
-            cached_time, cached_data = self.cache[cache_key]
-            if (datetime.now() - cached_time).seconds < self.config['cache_ttl']:
-                return cached_data
-        
-        # Query positions
-        positions = self._get_positions(start_time, end_time, agv_ids, zone_id)
-        
-        if positions.empty:
-            return None
-        
-        # Generate heatmap
-        if self.config['use_datashader'] and len(positions) > 1000:
-            heatmap_data = self._generate_datashader(positions)
+        cache_key = (start_time, end_time, tuple(agv_ids) if agv_ids else None, zone_id)
+        heatmap_data = self._cache_get(cache_key)
+        if heatmap_data is not None:
+            return heatmap_data
+        
+        if self.config.get('db_histogram', False):
+            # Only bin counts cross the wire
+            heatmap_data = self._generate_db_histogram(start_time, end_time, agv_ids, zone_id)
+            if heatmap_data is None:
+                return None
         else:
-            heatmap_data = self._generate_numpy(positions)
+            # Query positions
+            positions = self._get_positions(start_time, end_time, agv_ids, zone_id)
+            
+            if positions.empty:
+                return None
+            
+            # Generate heatmap
+            if self.config['use_datashader'] and len(positions) > 1000:
+                heatmap_data = self._generate_datashader(positions)
+            else:
+                heatmap_data = self._generate_numpy(positions)
         
         # Cache result
-        self.cache[cache_key] = (datetime.now(), heatmap_data)
+        self._cache_set(cache_key, heatmap_data)
         
         return heatmap_data
     
+    def _cache_get(self, cache_key: Tuple) -> Optional[Dict]:
+        """Look up a heatmap in the local cache, then the shared one."""
+        with self._cache_lock:
+            heatmap_data = self.cache.get(cache_key)
+        
+        if heatmap_data is None and self.shared_cache is not None:
+            try:
+                heatmap_data = self.shared_cache.get(cache_key)
+            except Exception as e:
+                logger.warning(f"Shared heatmap cache read failed: {e}")
+                return None
+            if heatmap_data is not None:
+                with self._cache_lock:
+                    self.cache[cache_key] = heatmap_data
+        
+        return heatmap_data
+    
+    def _cache_set(self, cache_key: Tuple, heatmap_data: Dict):
+        """Store a heatmap in the local and shared caches."""
+        with self._cache_lock:
+            self.cache[cache_key] = heatmap_data
+        
+        if self.shared_cache is not None:
+            try:
+                self.shared_cache.set(cache_key, heatmap_data, expire=self.config['cache_ttl'])
+            except Exception as e:
+                logger.warning(f"Shared heatmap cache write failed: {e}")
+    
     def _get_positions(self, start_time: datetime, end_time: datetime,
                       agv_ids: Optional[List[str]] = None,
                       zone_id: Optional[str] = None) -> pd.DataFrame:
@@ -101,6 +162,61 @@ class HeatmapGenerator:
         
         return db_manager.query_dataframe(query, tuple(params))
     
+    def _generate_db_histogram(self, start_time: datetime, end_time: datetime,
+                               agv_ids: Optional[List[str]] = None,
+                               zone_id: Optional[str] = None) -> Optional[Dict]:
+        """Generate heatmap from bin counts aggregated in the database.
+        
+        Binning follows ``np.histogram2d``: positions outside the bounds are
+        dropped and the upper bound falls into the last bin.
+        """
+        bounds = self.config['bounds']
+        bins = self.config['bins']
+        x_width = bounds['xmax'] - bounds['xmin']
+        y_width = bounds['ymax'] - bounds['ymin']
+        
+        query = """
+            SELECT
+                LEAST(FLOOR((plant_x - %s) * %s / %s), %s) AS bin_x,
+                LEAST(FLOOR((plant_y - %s) * %s / %s), %s) AS bin_y,
+                COUNT(*) AS samples
+            FROM agv_positions
+            WHERE ts BETWEEN %s AND %s
+            AND plant_x BETWEEN %s AND %s
+            AND plant_y BETWEEN %s AND %s
+        """
+        params = [
+            bounds['xmin'], bins, x_width, bins - 1,
+            bounds['ymin'], bins, y_width, bins - 1,
+            start_time, end_time,
+            bounds['xmin'], bounds['xmax'],
+            bounds['ymin'], bounds['ymax']
+        ]
+        
+        if agv_ids:
+            placeholders = ','.join(['%s'] * len(agv_ids))
+            query += f" AND agv_id IN ({placeholders})"
+            params.extend(agv_ids)
+        
+        if zone_id:
+            query += " AND zone_id = %s"
+            params.append(zone_id)
+        
+        query += " GROUP BY bin_x, bin_y"
+        
+        counts = db_manager.query_dataframe(query, tuple(params))
+        if counts.empty:
+            return None
+        
+        H = np.zeros((bins, bins))
+        H[counts['bin_x'].to_numpy(dtype=np.intp), counts['bin_y'].to_numpy(dtype=np.intp)] = (
+            counts['samples'].to_numpy(dtype=float)
+        )
+        xedges = np.linspace(bounds['xmin'], bounds['xmax'], bins + 1)
+        yedges = np.linspace(bounds['ymin'], bounds['ymax'], bins + 1)
+        
+        return self._finish_histogram(H, xedges, yedges, 'db_histogram', int(H.sum()))
+    
     def _generate_numpy(self, positions: pd.DataFrame) -> Dict:
         """Generate heatmap using NumPy."""
         bounds = self.config['bounds']
@@ -108,29 +224,55 @@ class HeatmapGenerator:
         
         # Create 2D histogram
         H, xedges, yedges = np.histogram2d(
-            positions['plant_x'],
-            positions['plant_y'],
+            positions['plant_x'].to_numpy(copy=False),
+            positions['plant_y'].to_numpy(copy=False),
             bins=bins,
             range=[[bounds['xmin'], bounds['xmax']], 
                    [bounds['ymin'], bounds['ymax']]]
         )
         
+        return self._finish_histogram(H, xedges, yedges, 'numpy', len(positions))
+    
+    def _finish_histogram(self, H: np.ndarray, xedges: np.ndarray, yedges: np.ndarray,
+                          heatmap_type: str, samples: int) -> Dict:
+        """Smooth and normalize an (x, y) histogram into heatmap data."""
         # Apply Gaussian smoothing
         if self.config['smoothing'] > 0:
-            H = gaussian_filter(H, sigma=self.config['smoothing'])
+            H = self._smooth(H, self.config['smoothing'])
         
         # Normalize
         if H.max() > 0:
             H = H / H.max()
         
         return {
-            'z': H.T.tolist(),  # Transpose for correct orientation
-            'x': xedges.tolist(),
-            'y': yedges.tolist(),
-            'type': 'numpy',
-            'samples': len(positions)
+            'z': np.ascontiguousarray(H.T, dtype=np.float32),  # Transpose for correct orientation
+            'x': xedges,
+            'y': yedges,
+            'type': heatmap_type,
+            'samples': samples
         }
     
+    def _smooth(self, grid: np.ndarray, sigma: float) -> np.ndarray:
+        """Gaussian-smooth a grid, via FFT convolution for large grids.
+        
+        Both paths match ``gaussian_filter`` defaults (reflected edges,
+        kernel truncated at 4 sigma).
+        """
+        if grid.size <= FFT_SMOOTHING_MIN_SIZE:
+            return gaussian_filter(grid, sigma=sigma)
+        
+        kernel = self._kernels.get(sigma)
+        if kernel is None:
+            radius = int(4.0 * sigma + 0.5)
+            offsets = np.arange(-radius, radius + 1)
+            weights = np.exp(-0.5 * (offsets / sigma) ** 2)
+            weights /= weights.sum()
+            kernel = self._kernels[sigma] = np.outer(weights, weights)
+        
+        radius = kernel.shape[0] // 2
+        padded = np.pad(grid, radius, mode='symmetric')
+        return fftconvolve(padded, kernel, mode='valid')
+    
     def _generate_datashader(self, positions: pd.DataFrame) -> Dict:
         """Generate heatmap using Datashader for large datasets."""
         bounds = self.config['bounds']
@@ -143,22 +285,18 @@ class HeatmapGenerator:
             y_range=(bounds['ymin'], bounds['ymax'])
         )
         
-        # Aggregate points
+        # Aggregate points; rows run along y from ymin like the NumPy path
         agg = canvas.points(positions, 'plant_x', 'plant_y')
         
-        # Apply transfer function
-        img = tf.shade(agg, cmap=viridis, how='log')
-        
-        # Convert to array
-        img_array = np.array(img.to_pil())
-        
-        # Extract single channel for heatmap
-        heatmap = img_array[:, :, 0] / 255.0
+        # Log-scale the raw counts and normalize; coloring is left to the
+        # client (config['colormap'])
+        heatmap = np.log1p(np.asarray(agg.values, dtype=np.float32))
+        heatmap /= heatmap.max() or 1.0
         
         return {
-            'z': heatmap.tolist(),
-            'x': np.linspace(bounds['xmin'], bounds['xmax'], self.config['bins']).tolist(),
-            'y': np.linspace(bounds['ymin'], bounds['ymax'], self.config['bins']).tolist(),
+            'z': heatmap,
+            'x': np.linspace(bounds['xmin'], bounds['xmax'], self.config['bins']),
+            'y': np.linspace(bounds['ymin'], bounds['ymax'], self.config['bins']),
             'type': 'datashader',
             'samples': len(positions)
         }
@@ -194,24 +332,29 @@ class HeatmapGenerator:
         # Create empty grid
         grid = np.zeros((bins, bins))
         
-        # Add zone intensities
-        for _, zone in result.iterrows():
-            if zone['centroid_x'] and zone['centroid_y']:
-                # Convert to grid coordinates
-                x_idx = int((zone['centroid_x'] - bounds['xmin']) / 
-                           (bounds['xmax'] - bounds['xmin']) * bins)
-                y_idx = int((zone['centroid_y'] - bounds['ymin']) / 
-                           (bounds['ymax'] - bounds['ymin']) * bins)
-                
-                if 0 <= x_idx < bins and 0 <= y_idx < bins:
-                    # Add Gaussian blob for zone
-                    intensity = zone['sample_count'] / 1000  # Normalize
-                    for dx in range(-5, 6):
-                        for dy in range(-5, 6):
-                            nx, ny = x_idx + dx, y_idx + dy
-                            if 0 <= nx < bins and 0 <= ny < bins:
-                                dist = np.sqrt(dx**2 + dy**2)
-                                grid[ny, nx] += intensity * np.exp(-dist**2 / 10)
+        # Convert zone centroids to grid coordinates
+        cx = result['centroid_x'].to_numpy(dtype=float)
+        cy = result['centroid_y'].to_numpy(dtype=float)
+        x_idx = np.trunc((cx - bounds['xmin']) / (bounds['xmax'] - bounds['xmin']) * bins)
+        y_idx = np.trunc((cy - bounds['ymin']) / (bounds['ymax'] - bounds['ymin']) * bins)
+        
+        # Zones without a centroid (NULL or 0) or outside the plant are skipped
+        inside = (
+            (np.nan_to_num(cx) != 0) & (np.nan_to_num(cy) != 0)
+            & (x_idx >= 0) & (x_idx < bins) & (y_idx >= 0) & (y_idx < bins)
+        )
+        x_idx = x_idx[inside].astype(np.intp)
+        y_idx = y_idx[inside].astype(np.intp)
+        intensity = result['sample_count'].to_numpy(dtype=float)[inside] / 1000  # Normalize
+        
+        # Add a Gaussian blob for every zone in one scatter-add, clipped
+        # to the grid
+        nx = x_idx[:, None, None] + _BLOB_OFFSETS[None, None, :]
+        ny = y_idx[:, None, None] + _BLOB_OFFSETS[None, :, None]
+        nx, ny = np.broadcast_arrays(nx, ny)
+        blobs = intensity[:, None, None] * _BLOB_KERNEL
+        on_grid = (nx >= 0) & (nx < bins) & (ny >= 0) & (ny < bins)
+        np.add.at(grid, (ny[on_grid], nx[on_grid]), blobs[on_grid])
         
         # Apply smoothing
         grid = gaussian_filter(grid, sigma=2)
@@ -221,9 +364,9 @@ class HeatmapGenerator:
             grid = grid / grid.max()
         
         return {
-            'z': grid.tolist(),
-            'x': np.linspace(bounds['xmin'], bounds['xmax'], bins).tolist(),
-            'y': np.linspace(bounds['ymin'], bounds['ymax'], bins).tolist(),
+            'z': grid.astype(np.float32),
+            'x': np.linspace(bounds['xmin'], bounds['xmax'], bins),
+            'y': np.linspace(bounds['ymin'], bounds['ymax'], bins),
             'type': 'zone_heatmap',
             'zones': result[['zone_id', 'name', 'sample_count']].to_dict('records')
         }
@@ -254,20 +397,26 @@ class HeatmapGenerator:
         return heatmap
     
     def _calculate_coverage(self, positions: pd.DataFrame) -> float:
-        """Calculate area covered by positions."""
+        """Calculate area covered by positions.
+        
+        Positions are snapped to a grid of ``coverage_cell_size`` cells and
+        the area of the occupied cells is summed, which follows the route
+        actually driven rather than the convex hull around it.
+        """
         if len(positions) < 3:
             return 0.0
         
-        # Create convex hull of positions
-        from scipy.spatial import ConvexHull
-        
-        points = positions[['plant_x', 'plant_y']].values
+        cell = self.config.get('coverage_cell_size', 1.0)
+        cells = np.floor(positions[['plant_x', 'plant_y']].to_numpy(dtype=float) / cell)
+        cells = cells[np.isfinite(cells).all(axis=1)].astype(np.int64)
         
-        try:
-            hull = ConvexHull(points)
-            return float(hull.volume)  # In 2D, volume is area
-        except:
+        if len(cells) == 0:
             return 0.0
+        
+        # One id per occupied cell, offset so ids are non-negative
+        cells -= cells.min(axis=0)
+        cell_ids = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+        return float(len(np.unique(cell_ids)) * cell * cell)
     
     def generate_comparative_heatmap(self, time_periods: List[Tuple[datetime, datetime]],
                                     labels: Optional[List[str]] = None) -> Dict:
@@ -284,12 +433,12 @@ class HeatmapGenerator:
         
         # Calculate difference if exactly 2 periods
         if len(heatmaps) == 2:
-            diff = np.array(heatmaps[1]['z']) - np.array(heatmaps[0]['z'])
+            diff = heatmaps[1]['z'] - heatmaps[0]['z']
             
             return {
                 'heatmaps': heatmaps,
                 'difference': {
-                    'z': diff.tolist(),
+                    'z': diff,
                     'x': heatmaps[0]['x'],
                     'y': heatmaps[0]['y'],
                     'type': 'difference'
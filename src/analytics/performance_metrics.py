@@ -2,8 +2,11 @@
 Performance metrics calculation for AGV fleet (MySQL-compatible).
 """
 
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict
+from types import MappingProxyType
+from typing import Any, ClassVar, Dict, Mapping, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -12,94 +15,189 @@ from loguru import logger
 from src.core.database import db_manager
 
 
+# Latest position of each AGV seen in the last minute, from the
+# agv_latest_position table kept current by the ingest writer
+LAST_POSITION_JOIN = """
+    LEFT JOIN agv_latest_position p
+        ON p.agv_id = r.agv_id
+        AND p.ts >= NOW() - INTERVAL 1 MINUTE
+"""
+
+# Per-AGV current status (quote reserved identifier `type`)
+FLEET_STATUS_SQL = """
+    SELECT 
+        r.agv_id,
+        r.status,
+        r.`type`,
+        r.total_distance_km,
+        r.total_runtime_hours,
+        COALESCE(p.speed_mps, 0)           AS current_speed,
+        COALESCE(p.battery_percent, 100)   AS battery
+    FROM agv_registry r
+""" + LAST_POSITION_JOIN
+
+# Column dtypes of the current fleet status frame
+FLEET_STATUS_DTYPES = {
+    "agv_id": object,
+    "status": "category",
+    "type": "category",
+    "current_speed": np.float32,
+    "battery": np.float32,
+}
+
+# Fleet-wide counts behind the top-level stats and system health, reduced
+# to a single row on the server
+FLEET_SUMMARY_SQL = """
+    SELECT 
+        COUNT(*)                                                  AS total_count,
+        COALESCE(SUM(r.status <> 'OFFLINE'), 0)                   AS active_count,
+        COALESCE(SUM(r.status = 'ERROR'), 0)                      AS error_count,
+        COALESCE(SUM(r.maintenance_due_date <= NOW() + INTERVAL 7 DAY), 0)
+                                                                  AS maintenance_due_count,
+        AVG(COALESCE(p.battery_percent, 100))                     AS avg_battery
+    FROM agv_registry r
+""" + LAST_POSITION_JOIN
+
+# KPI queries behind the individual _calculate_* helpers
+
+# Current window [start, end] and the equally long window before it, split
+# by conditional aggregation over the 5-minute fleet snapshot
+# (params: start x3, start x2, prev_start, end)
+EFFICIENCY_SQL = """
+    SELECT 
+        SUM(CASE WHEN ts_bucket >= %s THEN moving_sec END) AS moving_time,
+        SUM(CASE WHEN ts_bucket >= %s THEN idle_sec END)   AS idle_time,
+        SUM(CASE WHEN ts_bucket >= %s THEN dist_m END)     AS distance,
+        SUM(CASE WHEN ts_bucket <= %s THEN moving_sec END) AS prev_moving_time,
+        SUM(CASE WHEN ts_bucket <= %s THEN idle_sec END)   AS prev_idle_time
+    FROM fleet_snapshot_5min
+    WHERE ts_bucket BETWEEN %s AND %s
+"""
+
+# params: start, end
+TASK_METRICS_SQL = """
+    SELECT 
+        AVG(actual_duration_sec / 60) AS avg_duration_min,
+        COUNT(*)                      AS task_count,
+        SUM(CASE WHEN status = 'COMPLETED' THEN 1 ELSE 0 END) AS completed
+    FROM agv_tasks
+    WHERE started_at BETWEEN %s AND %s
+"""
+
+# params: start, end, end, start
+DOWNTIME_SQL = """
+    SELECT 
+        zo.agv_id,
+        SUM(
+            TIMESTAMPDIFF(
+                SECOND, 
+                GREATEST(zo.entered_at, %s),
+                LEAST(COALESCE(zo.exited_at, NOW()), %s)
+            )
+        ) AS downtime
+    FROM zone_occupancy_log zo
+    JOIN plant_zones pz
+      ON pz.zone_id = zo.zone_id
+     AND pz.zone_type IN ('MAINTENANCE', 'CHARGING')
+    WHERE zo.entered_at <= %s
+      AND (zo.exited_at IS NULL OR zo.exited_at >= %s)
+    GROUP BY zo.agv_id
+"""
+
+REGISTRY_COUNT_SQL = "SELECT COUNT(*) AS count FROM agv_registry"
+
+# params: start, end
+THROUGHPUT_SQL = """
+    SELECT COUNT(*) AS count
+    FROM agv_tasks
+    WHERE completed_at BETWEEN %s AND %s
+      AND status = 'COMPLETED'
+"""
+
+
 class PerformanceMetrics:
     """Calculates and tracks AGV fleet performance metrics."""
 
-    def __init__(self):
-        self.cache = {}
-        self.benchmarks = self._load_benchmarks()
+    # Performance benchmarks, shared read-only by all instances
+    benchmarks: ClassVar[Mapping[str, float]] = MappingProxyType({
+        "target_utilization": 0.85,
+        "target_availability": 0.95,
+        "target_task_time": 15,  # minutes
+        "target_throughput": 10,  # tasks/hour
+        "target_efficiency": 0.80,
+        "maintenance_interval_days": 30,
+        "cache_ttl_sec": 5,  # how long dashboard queries are memoized
+    })
+
+    # Yesterday's statistics for trend comparisons (placeholder/demo)
+    yesterday_stats: ClassVar[Mapping[str, float]] = MappingProxyType({
+        "total_distance_km": 450.0,
+        "avg_speed_mps": 1.2,
+        "system_health": 92.0,
+    })
 
-    def _load_benchmarks(self) -> Dict:
-        """Load performance benchmarks."""
-        return {
-            "target_utilization": 0.85,
-            "target_availability": 0.95,
-            "target_task_time": 15,  # minutes
-            "target_throughput": 10,  # tasks/hour
-            "target_efficiency": 0.80,
-            "maintenance_interval_days": 30,
-        }
+    def __init__(self):
+        self.cache: Dict[Tuple, Tuple[float, Any]] = {}  # key -> (monotonic time, result)
+
+    def _cache_get(self, key: Tuple) -> Optional[Any]:
+        """Return a memoized result younger than cache_ttl_sec, if any."""
+        entry = self.cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.benchmarks["cache_ttl_sec"]:
+            return entry[1]
+        return None
+
+    def _cache_set(self, key: Tuple, value: Any) -> Any:
+        """Memoize a result and return it, dropping expired entries as it grows."""
+        now = time.monotonic()
+        if len(self.cache) > 128:
+            ttl = self.benchmarks["cache_ttl_sec"]
+            self.cache = {k: v for k, v in self.cache.items() if now - v[0] < ttl}
+        self.cache[key] = (now, value)
+        return value
 
     def get_fleet_stats(self, time_window: timedelta = timedelta(hours=24)) -> Dict:
         """Get comprehensive fleet statistics."""
+        cache_key = ("fleet_stats", time_window)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         end_time = datetime.now()
         start_time = end_time - time_window
 
-        # Current fleet status (MySQL-safe):
-        # - Replace Postgres DISTINCT ON with a max(ts) self-join
-        # - Replace INTERVAL '1 minute' with INTERVAL 1 MINUTE
-        # - Quote reserved identifier `type`
-        fleet_status = db_manager.query_dataframe(
-            """
-            SELECT 
-                r.agv_id,
-                r.status,
-                r.`type`,
-                r.total_distance_km,
-                r.total_runtime_hours,
-                COALESCE(p.speed_mps, 0)           AS current_speed,
-                COALESCE(p.battery_percent, 100)   AS battery
-            FROM agv_registry r
-            LEFT JOIN (
-                SELECT p1.agv_id, p1.speed_mps, p1.battery_percent
-                FROM agv_positions p1
-                JOIN (
-                    SELECT agv_id, MAX(ts) AS max_ts
-                    FROM agv_positions
-                    WHERE ts >= NOW() - INTERVAL 1 MINUTE
-                    GROUP BY agv_id
-                ) last ON last.agv_id = p1.agv_id AND last.max_ts = p1.ts
-            ) p ON r.agv_id = p.agv_id
-            """
-        )
-
-        # Historical metrics over window
-        historical = db_manager.query_dataframe(
-            """
-            SELECT 
-                COUNT(DISTINCT agv_id)                  AS active_agvs,
-                SUM(total_distance_m) / 1000            AS total_distance_km,
-                AVG(avg_speed_mps)                      AS avg_speed,
-                SUM(moving_time_sec) / 3600             AS total_moving_hours,
-                SUM(idle_time_sec) / 3600               AS total_idle_hours
-            FROM agv_analytics_hourly
-            WHERE hour_start >= %s
-            """,
-            (start_time,),
+        # All four queries go to the server in one multi-statement round-trip
+        summary_df, historical, zone_stats, total_zones_df = db_manager.query_many(
+            [
+                FLEET_SUMMARY_SQL,
+                # Historical metrics over window, from the 5-minute snapshot
+                """
+                SELECT 
+                    COUNT(DISTINCT agv_id)                  AS active_agvs,
+                    SUM(dist_m) / 1000                      AS total_distance_km,
+                    AVG(avg_speed)                          AS avg_speed,
+                    SUM(moving_sec) / 3600                  AS total_moving_hours,
+                    SUM(idle_sec) / 3600                    AS total_idle_hours
+                FROM fleet_snapshot_5min
+                WHERE ts_bucket >= %s
+                """,
+                # Zone statistics
+                """
+                SELECT COUNT(DISTINCT zone_id) AS occupied_zones
+                FROM agv_positions
+                WHERE ts >= %s AND zone_id IS NOT NULL
+                """,
+                "SELECT COUNT(*) AS count FROM plant_zones WHERE active = TRUE",
+            ],
+            [None, (start_time,), (start_time,), None],
         )
+        total_zones = int(total_zones_df["count"].iloc[0]) if not total_zones_df.empty else 0
 
-        # Zone statistics
-        zone_stats = db_manager.query_dataframe(
-            """
-            SELECT COUNT(DISTINCT zone_id) AS occupied_zones
-            FROM agv_positions
-            WHERE ts >= %s AND zone_id IS NOT NULL
-            """,
-            (start_time,),
-        )
-
-        total_zones_row = db_manager.execute_query(
-            "SELECT COUNT(*) AS count FROM plant_zones WHERE active = TRUE"
-        )
-        total_zones = int(total_zones_row[0]["count"]) if total_zones_row else 0
-
-        # Calculate top-level metrics
-        total_agvs = len(fleet_status)
-        active_agvs = (
-            len(fleet_status[fleet_status["status"] != "OFFLINE"])
-            if not fleet_status.empty
-            else 0
-        )
+        # Top-level metrics from the server-side counts
+        summary = summary_df.iloc[0] if not summary_df.empty else pd.Series(dtype=float)
+        total_agvs = int(summary.get("total_count", 0))
+        active_agvs = int(summary.get("active_count", 0))
+        avg_battery = summary.get("avg_battery")
+        avg_battery = float(avg_battery) if pd.notna(avg_battery) else np.nan
 
         stats_out = {
             "total_agvs": total_agvs,
@@ -115,10 +213,8 @@ class PerformanceMetrics:
             if (not zone_stats.empty and pd.notna(zone_stats["occupied_zones"].iloc[0]))
             else 0,
             "total_zones": total_zones,
-            "system_health": self._calculate_system_health(fleet_status),
-            "avg_battery": float(fleet_status["battery"].mean())
-            if (not fleet_status.empty and pd.notna(fleet_status["battery"].mean()))
-            else 100.0,
+            "system_health": self._calculate_system_health(summary),
+            "avg_battery": avg_battery if pd.notna(avg_battery) else 100.0,
         }
 
         # Trend comparisons (vs. yesterday placeholder)
@@ -133,21 +229,36 @@ class PerformanceMetrics:
             stats_out["system_health"], yesterday_stats.get("system_health", 100)
         )
 
-        return stats_out
+        return self._cache_set(cache_key, stats_out)
 
     def calculate_kpis(self, start_time: datetime, end_time: datetime) -> Dict:
         """Calculate key performance indicators."""
+        cache_key = ("kpis", start_time, end_time)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        # The four KPIs are independent; each runs on its own pooled
+        # connection so the wall time is the slowest query, not the sum
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix="kpi") as executor:
+            efficiency_future = executor.submit(self._calculate_efficiency, start_time, end_time)
+            task_future = executor.submit(self._calculate_task_metrics, start_time, end_time)
+            availability_future = executor.submit(
+                self._calculate_availability, start_time, end_time
+            )
+            throughput_future = executor.submit(self._calculate_throughput, start_time, end_time)
+
         # Fleet efficiency
-        efficiency = self._calculate_efficiency(start_time, end_time)
+        efficiency = efficiency_future.result()
 
         # Task metrics
-        task_metrics = self._calculate_task_metrics(start_time, end_time)
+        task_metrics = task_future.result()
 
         # Availability
-        availability = self._calculate_availability(start_time, end_time)
+        availability = availability_future.result()
 
         # Throughput
-        throughput = self._calculate_throughput(start_time, end_time)
+        throughput = throughput_future.result()
 
         kpis = {
             "efficiency": efficiency["value"],
@@ -162,54 +273,53 @@ class PerformanceMetrics:
                 efficiency["value"], availability["value"], throughput["value"]
             ),
         }
-        return kpis
-
-    def _calculate_efficiency(self, start_time: datetime, end_time: datetime) -> Dict:
-        """Calculate fleet efficiency."""
-        result = db_manager.query_dataframe(
-            """
-            SELECT 
-                SUM(moving_time_sec) AS moving_time,
-                SUM(idle_time_sec)   AS idle_time,
-                SUM(total_distance_m) AS distance
-            FROM agv_analytics_hourly
-            WHERE hour_start BETWEEN %s AND %s
-            """,
-            (start_time, end_time),
-        )
+        return self._cache_set(cache_key, kpis)
+
+    @staticmethod
+    def _efficiency_params(start_time: datetime, end_time: datetime) -> tuple:
+        """Bind EFFICIENCY_SQL to a window and the equally long one before it."""
+        prev_start = start_time - (end_time - start_time)
+        return (start_time,) * 5 + (prev_start, end_time)
+
+    def _calculate_efficiency(self, start_time: datetime, end_time: datetime,
+                              result: Optional[pd.DataFrame] = None) -> Dict:
+        """Calculate fleet efficiency and its change from the previous period.
+        
+        Both periods come from one query; pass ``result`` to reuse rows
+        already fetched with EFFICIENCY_SQL.
+        """
+        if result is None:
+            result = db_manager.query_dataframe(
+                EFFICIENCY_SQL, self._efficiency_params(start_time, end_time)
+            )
 
         if result.empty or pd.isna(result["moving_time"].iloc[0]):
             return {"value": 0.0, "change": 0.0}
 
-        moving = float(result["moving_time"].iloc[0] or 0)
-        idle = float(result["idle_time"].iloc[0] or 0)
-        total = moving + idle
-
-        efficiency_val = (moving / total * 100.0) if total > 0 else 0.0
-
-        # Compare with previous period
-        prev_end = start_time
-        prev_start = prev_end - (end_time - start_time)
-        prev_efficiency = self._calculate_efficiency(prev_start, prev_end)
+        row = result.iloc[0]
+        efficiency_val = self._moving_ratio(row["moving_time"], row["idle_time"])
+        prev_efficiency_val = self._moving_ratio(row["prev_moving_time"], row["prev_idle_time"])
 
         return {
             "value": efficiency_val,
-            "change": efficiency_val - prev_efficiency.get("value", efficiency_val),
+            "change": efficiency_val - prev_efficiency_val,
         }
 
-    def _calculate_task_metrics(self, start_time: datetime, end_time: datetime) -> Dict:
+    @staticmethod
+    def _moving_ratio(moving_time: Any, idle_time: Any) -> float:
+        """Percentage of time spent moving; 0 when there is no data."""
+        if pd.isna(moving_time):
+            return 0.0
+        moving = float(moving_time or 0)
+        idle = 0.0 if pd.isna(idle_time) else float(idle_time or 0)
+        total = moving + idle
+        return (moving / total * 100.0) if total > 0 else 0.0
+
+    def _calculate_task_metrics(self, start_time: datetime, end_time: datetime,
+                                result: Optional[pd.DataFrame] = None) -> Dict:
         """Calculate task-related metrics."""
-        result = db_manager.query_dataframe(
-            """
-            SELECT 
-                AVG(actual_duration_sec / 60) AS avg_duration_min,
-                COUNT(*)                      AS task_count,
-                SUM(CASE WHEN status = 'COMPLETED' THEN 1 ELSE 0 END) AS completed
-            FROM agv_tasks
-            WHERE started_at BETWEEN %s AND %s
-            """,
-            (start_time, end_time),
-        )
+        if result is None:
+            result = db_manager.query_dataframe(TASK_METRICS_SQL, (start_time, end_time))
 
         if result.empty or pd.isna(result["avg_duration_min"].iloc[0]):
             return {"avg_time": 0.0, "change": 0.0, "completion_rate": 0.0}
@@ -229,41 +339,24 @@ class PerformanceMetrics:
 
         return {"avg_time": avg_time, "change": change, "completion_rate": completion_rate}
 
-    def _calculate_availability(self, start_time: datetime, end_time: datetime) -> Dict:
+    def _calculate_availability(self, start_time: datetime, end_time: datetime,
+                                result: Optional[pd.DataFrame] = None,
+                                registry: Optional[pd.DataFrame] = None) -> Dict:
         """Calculate fleet availability (percent of time NOT in maintenance/charging zones)."""
         total_time = (end_time - start_time).total_seconds()
 
-        result = db_manager.query_dataframe(
-            """
-            SELECT 
-                agv_id,
-                SUM(
-                    TIMESTAMPDIFF(
-                        SECOND, 
-                        GREATEST(entered_at, %s),
-                        LEAST(COALESCE(exited_at, NOW()), %s)
-                    )
-                ) AS downtime
-            FROM zone_occupancy_log
-            WHERE zone_id IN (
-                SELECT zone_id FROM plant_zones 
-                WHERE zone_type IN ('MAINTENANCE', 'CHARGING')
+        if result is None or registry is None:
+            # Downtime and fleet size in one round-trip
+            result, registry = db_manager.query_many(
+                [DOWNTIME_SQL, REGISTRY_COUNT_SQL],
+                [(start_time, end_time, end_time, start_time), None],
             )
-            AND entered_at <= %s
-            AND (exited_at IS NULL OR exited_at >= %s)
-            GROUP BY agv_id
-            """,
-            (start_time, end_time, end_time, start_time),
-        )
 
         if result.empty:
             availability = 100.0
         else:
             total_downtime = float(result["downtime"].sum() or 0)
-            num_agvs_row = db_manager.execute_query(
-                "SELECT COUNT(*) AS count FROM agv_registry"
-            )
-            num_agvs = int(num_agvs_row[0]["count"]) if num_agvs_row else 0
+            num_agvs = int(registry["count"].iloc[0]) if not registry.empty else 0
 
             total_possible_time = total_time * max(num_agvs, 0)
             availability = (
@@ -275,21 +368,15 @@ class PerformanceMetrics:
         change = availability - (self.benchmarks["target_availability"] * 100.0)
         return {"value": availability, "change": change}
 
-    def _calculate_throughput(self, start_time: datetime, end_time: datetime) -> Dict:
+    def _calculate_throughput(self, start_time: datetime, end_time: datetime,
+                              result: Optional[pd.DataFrame] = None) -> Dict:
         """Calculate task throughput (tasks/hour)."""
         hours = (end_time - start_time).total_seconds() / 3600.0
 
-        result = db_manager.execute_query(
-            """
-            SELECT COUNT(*) AS count
-            FROM agv_tasks
-            WHERE completed_at BETWEEN %s AND %s
-              AND status = 'COMPLETED'
-            """,
-            (start_time, end_time),
-        )
+        if result is None:
+            result = db_manager.query_dataframe(THROUGHPUT_SQL, (start_time, end_time))
 
-        task_count = int(result[0]["count"]) if result else 0
+        task_count = int(result["count"].iloc[0]) if not result.empty else 0
         throughput = task_count / hours if hours > 0 else 0.0
 
         change = (
@@ -305,41 +392,30 @@ class PerformanceMetrics:
         """Calculate Overall Equipment Effectiveness."""
         return (efficiency / 100.0) * (availability / 100.0) * (quality / 100.0) * 100.0
 
-    def _calculate_system_health(self, fleet_status: pd.DataFrame) -> float:
-        """Calculate overall system health score."""
-        if fleet_status.empty:
+    def get_fleet_status(self) -> pd.DataFrame:
+        """Get the current status of every AGV, one row per AGV."""
+        return db_manager.query_dataframe(FLEET_STATUS_SQL, dtype_map=FLEET_STATUS_DTYPES)
+
+    def _calculate_system_health(self, summary: pd.Series) -> float:
+        """Calculate overall system health score from a FLEET_SUMMARY_SQL row."""
+        total = int(summary.get("total_count", 0))
+        if total == 0:
             return 0.0
 
         factors = []
 
         # Battery health
-        avg_battery = float(fleet_status["battery"].mean() or 0.0)
-        factors.append(avg_battery / 100.0)
+        avg_battery = summary.get("avg_battery")
+        factors.append(float(avg_battery) / 100.0 if pd.notna(avg_battery) else 0.0)
 
         # Active ratio
-        active_ratio = (
-            len(fleet_status[fleet_status["status"] != "OFFLINE"]) / len(fleet_status)
-            if len(fleet_status) > 0
-            else 0.0
-        )
-        factors.append(active_ratio)
+        factors.append(int(summary["active_count"]) / total)
 
         # Error rate (inverse)
-        error_count = len(fleet_status[fleet_status["status"] == "ERROR"])
-        error_ratio = 1.0 - (error_count / len(fleet_status)) if len(fleet_status) > 0 else 1.0
-        factors.append(error_ratio)
+        factors.append(1.0 - int(summary["error_count"]) / total)
 
         # Maintenance status
-        # Replace Postgres INTERVAL '7 day' with MySQL syntax
-        maintenance_query = """
-            SELECT COUNT(*) AS due_count
-            FROM agv_registry
-            WHERE maintenance_due_date <= NOW() + INTERVAL 7 DAY
-        """
-        due_maintenance_row = db_manager.execute_query(maintenance_query)
-        due_maintenance = int(due_maintenance_row[0]["due_count"]) if due_maintenance_row else 0
-        maintenance_ratio = 1.0 - (due_maintenance / len(fleet_status)) if len(fleet_status) > 0 else 1.0
-        factors.append(maintenance_ratio)
+        factors.append(1.0 - int(summary["maintenance_due_count"]) / total)
 
         # Weights: Battery, Active, Error, Maintenance
         weights = [0.25, 0.35, 0.25, 0.15]
@@ -348,28 +424,86 @@ class PerformanceMetrics:
         return round(health, 1)
 
     def get_hourly_metrics(self, start_time: datetime, end_time: datetime) -> pd.DataFrame:
-        """Get hourly performance metrics (already MySQL-compatible)."""
-        return db_manager.query_dataframe(
+        """Get hourly performance metrics for the whole fleet."""
+        return self.derive_hourly(self.get_hourly_raw(start_time, end_time))
+
+    def get_hourly_raw(self, start_time: datetime, end_time: datetime) -> pd.DataFrame:
+        """Get un-aggregated hourly analytics rows, one per AGV and hour.
+        
+        The frame is cached, so several dashboard views can be derived
+        from one round-trip with derive_hourly().
+        """
+        cache_key = ("hourly_raw", start_time, end_time)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        result = pd.DataFrame(db_manager.query_columnar(
             """
             SELECT 
-                DATE_FORMAT(hour_start, '%%Y-%%m-%%d %%H:00') AS hour,
-                COUNT(DISTINCT agv_id)                        AS active_agvs,
-                SUM(total_distance_m) / 1000                  AS distance_km,
-                AVG(avg_speed_mps)                            AS avg_speed,
-                SUM(task_count)                               AS tasks,
-                (SUM(moving_time_sec) / (SUM(moving_time_sec) + SUM(idle_time_sec)) * 100) AS efficiency,
-                SUM(anomaly_count)                            AS anomalies
-            FROM agv_analytics_hourly
-            WHERE hour_start BETWEEN %s AND %s
-            GROUP BY hour
-            ORDER BY hour
+                DATE_FORMAT(a.hour_start, '%%Y-%%m-%%d %%H:00') AS hour,
+                a.agv_id,
+                r.`type`                                          AS `type`,
+                a.moving_time_sec,
+                a.idle_time_sec,
+                a.total_distance_m,
+                a.avg_speed_mps,
+                a.task_count,
+                a.anomaly_count
+            FROM agv_analytics_hourly a
+            LEFT JOIN agv_registry r ON r.agv_id = a.agv_id
+            WHERE a.hour_start BETWEEN %s AND %s
+            ORDER BY a.hour_start
             """,
             (start_time, end_time),
+            {
+                "type": "category",
+                "moving_time_sec": np.float64,
+                "idle_time_sec": np.float64,
+                "total_distance_m": np.float64,
+                "avg_speed_mps": np.float64,
+                "task_count": np.float64,
+                "anomaly_count": np.float64,
+            },
+        ))
+        return self._cache_set(cache_key, result)
+
+    @staticmethod
+    def derive_hourly(raw: pd.DataFrame, by: Tuple[str, ...] = ("hour",)) -> pd.DataFrame:
+        """Aggregate get_hourly_raw() rows into metrics per ``by`` group.
+        
+        ``by=("hour", "type")`` gives the same metrics split by AGV type.
+        """
+        by = list(by)
+        columns = by + ["active_agvs", "distance_km", "avg_speed", "tasks", "efficiency", "anomalies"]
+        if raw.empty:
+            return pd.DataFrame(columns=columns)
+
+        hourly = raw.groupby(by, sort=True, observed=True).agg(
+            active_agvs=("agv_id", "nunique"),
+            moving_time_sec=("moving_time_sec", "sum"),
+            idle_time_sec=("idle_time_sec", "sum"),
+            total_distance_m=("total_distance_m", "sum"),
+            avg_speed=("avg_speed_mps", "mean"),
+            tasks=("task_count", "sum"),
+            anomalies=("anomaly_count", "sum"),
+        ).reset_index()
+
+        hourly.eval("distance_km = total_distance_m / 1000", inplace=True)
+        hourly.eval(
+            "efficiency = moving_time_sec / (moving_time_sec + idle_time_sec) * 100",
+            inplace=True,
         )
+        return hourly[columns]
 
     def get_utilization_by_type(self, start_time: datetime, end_time: datetime) -> pd.DataFrame:
         """Get utilization metrics by AGV type."""
-        return db_manager.query_dataframe(
+        cache_key = ("utilization", start_time, end_time)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        result = db_manager.query_dataframe(
             """
             SELECT 
                 r.`type`                                        AS `type`,
@@ -387,15 +521,12 @@ class PerformanceMetrics:
             """,
             (start_time, end_time),
         )
+        return self._cache_set(cache_key, result)
 
-    def _get_yesterday_stats(self) -> Dict:
+    def _get_yesterday_stats(self) -> Mapping[str, float]:
         """Get yesterday's statistics for comparison (placeholder/demo)."""
         # For production, compute like get_fleet_stats over yesterday’s window.
-        return {
-            "total_distance_km": 450.0,
-            "avg_speed_mps": 1.2,
-            "system_health": 92.0,
-        }
+        return self.yesterday_stats
 
     def _calculate_change(self, current: float, previous: float) -> float:
         """Calculate percentage change."""
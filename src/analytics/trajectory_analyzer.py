@@ -7,11 +7,36 @@ import pandas as pd
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
 from scipy.interpolate import interp1d
-from scipy.signal import savgol_filter
+from scipy.ndimage import convolve1d
+from scipy.signal import savgol_coeffs, savgol_filter
 import networkx as nx
 
 from loguru import logger
 from src.core.database import db_manager
+from src.analytics._traj_kernels import stats_kernel, stops_kernel, turn_kernel
+
+# Position sampling rate of the RTLS feed
+SAMPLE_RATE_HZ = 3
+
+# Savitzky-Golay weights per (window_length, polyorder): the centre kernel
+# plus the edge rows that reproduce savgol_filter's polynomial-fit edges
+_SAVGOL_KERNELS: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+
+def _savgol_kernel(window_length: int, polyorder: int):
+    """Cached (centre, head, tail) Savitzky-Golay weights for an odd window."""
+    key = (window_length, polyorder)
+    kernel = _SAVGOL_KERNELS.get(key)
+    if kernel is None:
+        half = window_length // 2
+        head = [savgol_coeffs(window_length, polyorder, pos=i, use='dot')
+                for i in range(half)]
+        tail = [savgol_coeffs(window_length, polyorder, pos=i, use='dot')
+                for i in range(window_length - half, window_length)]
+        kernel = _SAVGOL_KERNELS[key] = (
+            savgol_coeffs(window_length, polyorder), np.array(head), np.array(tail)
+        )
+    return kernel
 
 
 class TrajectoryAnalyzer:
@@ -39,45 +64,45 @@ class TrajectoryAnalyzer:
         if trajectory.empty:
             return self._empty_stats()
         
-        # Calculate distances between points
-        if 'plant_x' in trajectory.columns and 'plant_y' in trajectory.columns:
-            distances = np.sqrt(
-                np.diff(trajectory['plant_x'])**2 + 
-                np.diff(trajectory['plant_y'])**2
-            )
-            total_distance = np.sum(distances)
-        else:
-            total_distance = 0
+        columns = trajectory.columns
         
         # Time calculations
-        if 'ts' in trajectory.columns:
+        if 'ts' in columns:
             trajectory['ts'] = pd.to_datetime(trajectory['ts'])
             duration = (trajectory['ts'].iloc[-1] - trajectory['ts'].iloc[0]).total_seconds()
         else:
             duration = 0
         
-        # Speed statistics
-        speeds = trajectory['speed_mps'].values if 'speed_mps' in trajectory.columns else []
+        # Distance and speed statistics in one kernel call
+        has_xy = 'plant_x' in columns and 'plant_y' in columns
+        xy = trajectory[['plant_x', 'plant_y']].to_numpy(dtype=float) if has_xy else np.empty((0, 2))
+        has_speed = 'speed_mps' in columns
+        speeds = trajectory['speed_mps'].to_numpy(dtype=float) if has_speed else np.empty(0)
+        
+        total_distance, stop_samples, min_moving, max_speed, avg_speed = stats_kernel(
+            np.ascontiguousarray(xy[:, 0]), np.ascontiguousarray(xy[:, 1]), speeds
+        )
+        if not has_xy:
+            total_distance = 0
         
-        # Stop time calculation (speed < 0.1 m/s)
-        stop_samples = np.sum(speeds < 0.1) if len(speeds) > 0 else 0
-        stop_time = stop_samples / 3.0 / 60  # Convert to minutes (3Hz sampling)
+        # Stop time calculation (speed < 0.1 m/s), in minutes
+        stop_time = stop_samples / SAMPLE_RATE_HZ / 60
         
         stats = {
             'total_distance': round(total_distance, 1),
             'duration_min': round(duration / 60, 1) if duration > 0 else 0,
-            'avg_speed': round(np.mean(speeds), 2) if len(speeds) > 0 else 0,
-            'max_speed': round(np.max(speeds), 2) if len(speeds) > 0 else 0,
-            'min_speed': round(np.min(speeds[speeds > 0]), 2) if len(speeds[speeds > 0]) > 0 else 0,
+            'avg_speed': round(avg_speed, 2) if has_speed else 0,
+            'max_speed': round(max_speed, 2) if has_speed else 0,
+            'min_speed': round(min_moving, 2) if not np.isnan(min_moving) else 0,
             'stop_time': round(stop_time, 1),
             'stop_percentage': round(stop_time * 60 / duration * 100, 1) if duration > 0 else 0,
             'total_points': len(trajectory),
-            'unique_zones': trajectory['zone_id'].nunique() if 'zone_id' in trajectory.columns else 0
+            'unique_zones': trajectory['zone_id'].nunique() if 'zone_id' in columns else 0
         }
         
         # Add turn statistics
-        if 'heading_deg' in trajectory.columns:
-            turn_stats = self._calculate_turn_statistics(trajectory['heading_deg'].values)
+        if 'heading_deg' in columns:
+            turn_stats = self._calculate_turn_statistics(trajectory['heading_deg'].to_numpy(dtype=float))
             stats.update(turn_stats)
         
         return stats
@@ -102,24 +127,14 @@ class TrajectoryAnalyzer:
         if len(headings) < 2:
             return {'total_turns': 0, 'avg_turn_rate': 0}
         
-        # Calculate heading changes
-        heading_changes = np.diff(headings)
-        
-        # Handle wrap-around (e.g., 359° to 1°)
-        heading_changes = np.where(heading_changes > 180, heading_changes - 360, heading_changes)
-        heading_changes = np.where(heading_changes < -180, heading_changes + 360, heading_changes)
-        
-        # Count significant turns (> 30 degrees)
-        significant_turns = np.sum(np.abs(heading_changes) > 30)
-        
-        # Calculate turn rate (degrees per second)
-        sample_rate = 3  # Hz
-        turn_rates = np.abs(heading_changes) * sample_rate
+        significant_turns, avg_turn_rate, max_turn_rate = turn_kernel(
+            np.asarray(headings, dtype=float), SAMPLE_RATE_HZ
+        )
         
         return {
             'total_turns': int(significant_turns),
-            'avg_turn_rate': round(np.mean(turn_rates), 1),
-            'max_turn_rate': round(np.max(turn_rates), 1)
+            'avg_turn_rate': round(avg_turn_rate, 1),
+            'max_turn_rate': round(max_turn_rate, 1)
         }
     
     def smooth_trajectory(self, trajectory: pd.DataFrame, 
@@ -129,66 +144,95 @@ class TrajectoryAnalyzer:
         if len(trajectory) < window_length:
             return trajectory
         
-        smoothed = trajectory.copy()
-        
-        # Smooth position data
+        # Position and speed columns are smoothed together along axis 0
+        columns = []
         if 'plant_x' in trajectory.columns and 'plant_y' in trajectory.columns:
-            smoothed['plant_x'] = savgol_filter(
-                trajectory['plant_x'], window_length, 3
-            )
-            smoothed['plant_y'] = savgol_filter(
-                trajectory['plant_y'], window_length, 3
-            )
-        
-        # Smooth speed data
+            columns += ['plant_x', 'plant_y']
         if 'speed_mps' in trajectory.columns:
-            smoothed['speed_mps'] = savgol_filter(
-                trajectory['speed_mps'], window_length, 3
-            )
+            columns.append('speed_mps')
         
+        smoothed = trajectory.copy()
+        if not columns:
+            return smoothed
+        
+        values = trajectory[columns].to_numpy(dtype=float)
+        if window_length % 2 == 0:
+            result = savgol_filter(values, window_length, 3, axis=0)
+        else:
+            # Same output as savgol_filter(mode='interp') with the weights
+            # computed once per window: convolve the interior, then fit
+            # the half-window at each end
+            centre, head, tail = _savgol_kernel(window_length, 3)
+            half = window_length // 2
+            result = convolve1d(values, centre, axis=0, mode='constant')
+            if half:
+                result[:half] = head @ values[:window_length]
+                result[-half:] = tail @ values[-window_length:]
+        
+        smoothed[columns] = result
         return smoothed
     
     def detect_stops(self, trajectory: pd.DataFrame, 
                     speed_threshold: float = 0.1,
                     min_duration: float = 5.0) -> List[Dict]:
-        """Detect stop events in trajectory."""
+        """Detect stop events in trajectory.
+        
+        Each event carries the positional range of the stop in
+        ``trajectory`` as ``idx_start``/``idx_end`` (end exclusive).
+        """
         
         stops = []
         
         if 'speed_mps' not in trajectory.columns:
             return stops
         
-        # Find sequences where speed is below threshold
-        is_stopped = trajectory['speed_mps'] < speed_threshold
-        
-        # Find start and end of stop sequences
-        stop_starts = np.where(np.diff(is_stopped.astype(int)) == 1)[0] + 1
-        stop_ends = np.where(np.diff(is_stopped.astype(int)) == -1)[0] + 1
-        
-        # Handle edge cases
-        if is_stopped.iloc[0]:
-            stop_starts = np.insert(stop_starts, 0, 0)
-        if is_stopped.iloc[-1]:
-            stop_ends = np.append(stop_ends, len(trajectory))
+        # Runs of samples below the speed threshold lasting min_duration
+        stop_starts, stop_ends = stops_kernel(
+            trajectory['speed_mps'].to_numpy(dtype=float),
+            speed_threshold,
+            self._min_stop_samples(min_duration)
+        )
         
-        # Create stop events
-        for start_idx, end_idx in zip(stop_starts, stop_ends):
-            duration = (end_idx - start_idx) / 3.0  # Convert to seconds (3Hz)
-            
-            if duration >= min_duration:
-                stops.append({
-                    'start_time': trajectory.iloc[start_idx]['ts'],
-                    'end_time': trajectory.iloc[min(end_idx, len(trajectory)-1)]['ts'],
-                    'duration_sec': duration,
-                    'location': {
-                        'x': trajectory.iloc[start_idx]['plant_x'],
-                        'y': trajectory.iloc[start_idx]['plant_y']
-                    },
-                    'zone': trajectory.iloc[start_idx].get('zone_id')
-                })
+        # Gather each column at all stop positions at once rather than
+        # looking rows up one stop at a time
+        end_rows = np.minimum(stop_ends, len(trajectory) - 1)
+        start_times = trajectory['ts'].iloc[stop_starts].tolist()
+        end_times = trajectory['ts'].iloc[end_rows].tolist()
+        locations = trajectory[['plant_x', 'plant_y']].to_numpy(dtype=float)[stop_starts].tolist()
+        if 'zone_id' in trajectory.columns:
+            zones = trajectory['zone_id'].iloc[stop_starts].tolist()
+        else:
+            zones = [None] * len(stop_starts)
+        
+        # Create stop events from plain Python values
+        stops = [
+            {
+                'start_time': start_time,
+                'end_time': end_time,
+                'duration_sec': (end - start) / SAMPLE_RATE_HZ,  # Convert to seconds
+                'location': {'x': x, 'y': y},
+                'zone': zone,
+                'idx_start': start,
+                'idx_end': end
+            }
+            for start, end, start_time, end_time, (x, y), zone in zip(
+                stop_starts.tolist(), stop_ends.tolist(),
+                start_times, end_times, locations, zones
+            )
+        ]
         
         return stops
     
+    @staticmethod
+    def _min_stop_samples(min_duration: float) -> int:
+        """Fewest samples n with n / SAMPLE_RATE_HZ >= min_duration."""
+        n = max(int(np.ceil(min_duration * SAMPLE_RATE_HZ)), 0)
+        while n / SAMPLE_RATE_HZ < min_duration:
+            n += 1
+        while n > 0 and (n - 1) / SAMPLE_RATE_HZ >= min_duration:
+            n -= 1
+        return n
+    
     def calculate_path_efficiency(self, trajectory: pd.DataFrame) -> float:
         """
         Calculate path efficiency (direct distance / actual distance).
@@ -200,10 +244,7 @@ class TrajectoryAnalyzer:
             return 1.0
         
         # Calculate actual path distance
-        actual_distance = np.sum(np.sqrt(
-            np.diff(trajectory['plant_x'])**2 + 
-            np.diff(trajectory['plant_y'])**2
-        ))
+        actual_distance = self._path_length(trajectory)
         
         # Calculate direct distance
         direct_distance = np.sqrt(
@@ -218,14 +259,103 @@ class TrajectoryAnalyzer:
     
     def find_repeated_paths(self, agv_id: str, 
                            time_window: timedelta = timedelta(days=7),
-                           similarity_threshold: float = 0.8) -> List[Dict]:
-        """Find repeated path patterns."""
+                           similarity_threshold: float = 0.8,
+                           top_routes: int = 10) -> List[Dict]:
+        """Find repeated path patterns.
+        
+        Candidate trips are the completed tasks on the AGV's ``top_routes``
+        most frequent origin -> destination pairs, ranked in MySQL, so only
+        the positions of those trips are fetched. Without repeated tasks in
+        the window, the full trajectory is split into trips at stops.
+        """
         
         end_time = datetime.now()
         start_time = end_time - time_window
         
-        # Get all trajectories in time window
-        # Split by stops to identify individual trips
+        segments = self._route_segments(agv_id, start_time, top_routes)
+        if not segments:
+            segments = self._stop_segments(agv_id, start_time, end_time)
+        
+        # Compare segments for similarity. Lengths and endpoints are taken
+        # once per segment; each segment is then scored against all later
+        # ones in a single array pass.
+        repeated_paths = []
+        
+        if not segments:
+            return repeated_paths
+        
+        lengths = np.array([self._path_length(segment) for segment in segments])
+        starts_xy = np.array([segment[['plant_x', 'plant_y']].iloc[0].to_numpy(dtype=float)
+                              for segment in segments])
+        ends_xy = np.array([segment[['plant_x', 'plant_y']].iloc[-1].to_numpy(dtype=float)
+                            for segment in segments])
+        
+        for i in range(len(segments)):
+            similarity = self._similarity_to_later(i, lengths, starts_xy, ends_xy)
+            matches = np.flatnonzero(similarity > similarity_threshold)
+            
+            similar_segments = [
+                {
+                    'segment_index': i + 1 + k,
+                    'similarity': float(similarity[k]),
+                    'timestamp': segments[i + 1 + k].iloc[0]['ts']
+                }
+                for k in matches
+            ]
+            
+            if similar_segments:
+                repeated_paths.append({
+                    'base_segment': i,
+                    'start_zone': segments[i].iloc[0].get('zone_id'),
+                    'end_zone': segments[i].iloc[-1].get('zone_id'),
+                    'repetitions': len(similar_segments) + 1,
+                    'similar_segments': similar_segments
+                })
+        
+        return repeated_paths
+    
+    def _route_segments(self, agv_id: str, start_time: datetime,
+                        top_routes: int) -> List[pd.DataFrame]:
+        """Positions of each completed task on the AGV's most frequent routes."""
+        
+        trips = db_manager.query_dataframe("""
+            SELECT t.task_id, p.ts, p.plant_x, p.plant_y, p.speed_mps, p.zone_id
+            FROM (
+                SELECT origin_zone_id, destination_zone_id
+                FROM agv_tasks
+                WHERE agv_id = %s
+                AND status = 'COMPLETED'
+                AND started_at >= %s
+                GROUP BY origin_zone_id, destination_zone_id
+                HAVING COUNT(*) > 1
+                ORDER BY COUNT(*) DESC
+                LIMIT %s
+            ) routes
+            JOIN agv_tasks t
+                ON t.origin_zone_id = routes.origin_zone_id
+                AND t.destination_zone_id = routes.destination_zone_id
+            JOIN agv_positions p
+                ON p.agv_id = t.agv_id
+                AND p.ts BETWEEN t.started_at AND t.completed_at
+            WHERE t.agv_id = %s
+            AND t.status = 'COMPLETED'
+            AND t.started_at >= %s
+            ORDER BY t.started_at, p.ts
+        """, (agv_id, start_time, top_routes, agv_id, start_time))
+        
+        if trips.empty:
+            return []
+        
+        return [
+            trip.reset_index(drop=True)
+            for _, trip in trips.groupby('task_id', sort=False)
+            if len(trip) > 10  # Minimum segment length
+        ]
+    
+    def _stop_segments(self, agv_id: str, start_time: datetime,
+                       end_time: datetime) -> List[pd.DataFrame]:
+        """Split the full trajectory into trips at stops."""
+        
         full_trajectory = self.get_trajectory(agv_id, start_time, end_time)
         
         if full_trajectory.empty:
@@ -239,15 +369,12 @@ class TrajectoryAnalyzer:
         prev_end = 0
         
         for stop in stops:
-            stop_start = full_trajectory[full_trajectory['ts'] == stop['start_time']].index[0]
-            
-            if stop_start > prev_end:
-                segment = full_trajectory.iloc[prev_end:stop_start]
+            if stop['idx_start'] > prev_end:
+                segment = full_trajectory.iloc[prev_end:stop['idx_start']]
                 if len(segment) > 10:  # Minimum segment length
                     segments.append(segment)
             
-            stop_end = full_trajectory[full_trajectory['ts'] == stop['end_time']].index[0]
-            prev_end = stop_end
+            prev_end = stop['idx_end']
         
         # Add final segment
         if prev_end < len(full_trajectory):
@@ -255,65 +382,56 @@ class TrajectoryAnalyzer:
             if len(segment) > 10:
                 segments.append(segment)
         
-        # Compare segments for similarity
-        repeated_paths = []
+        return segments
+    
+    @staticmethod
+    def _path_length(path: pd.DataFrame) -> float:
+        """Total distance travelled along a path."""
+        xy = path[['plant_x', 'plant_y']].to_numpy(dtype=float)
+        return float(np.hypot(np.diff(xy[:, 0]), np.diff(xy[:, 1])).sum())
+    
+    @staticmethod
+    def _path_similarity(len1, len2, start_dist, end_dist):
+        """Similarity score from path lengths and endpoint distances.
         
-        for i in range(len(segments)):
-            similar_segments = []
-            
-            for j in range(i + 1, len(segments)):
-                similarity = self._calculate_path_similarity(segments[i], segments[j])
-                
-                if similarity > similarity_threshold:
-                    similar_segments.append({
-                        'segment_index': j,
-                        'similarity': similarity,
-                        'timestamp': segments[j].iloc[0]['ts']
-                    })
-            
-            if similar_segments:
-                repeated_paths.append({
-                    'base_segment': i,
-                    'start_zone': segments[i].iloc[0].get('zone_id'),
-                    'end_zone': segments[i].iloc[-1].get('zone_id'),
-                    'repetitions': len(similar_segments) + 1,
-                    'similar_segments': similar_segments
-                })
+        Works on scalars or arrays; paths with no length score 0.
+        """
+        longest = np.maximum(len1, len2)
+        length_similarity = np.divide(
+            np.minimum(len1, len2), longest,
+            out=np.zeros(np.shape(longest)), where=longest > 0
+        )
         
-        return repeated_paths
+        # Normalize endpoint distances by a typical distance
+        endpoint_similarity = np.maximum(0, 1 - (start_dist + end_dist) / 100)
+        
+        return np.where(longest > 0, (endpoint_similarity + length_similarity) / 2, 0.0)
+    
+    def _similarity_to_later(self, i: int, lengths: np.ndarray,
+                             starts_xy: np.ndarray, ends_xy: np.ndarray) -> np.ndarray:
+        """Similarity of segment i to every segment after it."""
+        start_dist = np.hypot(*(starts_xy[i + 1:] - starts_xy[i]).T)
+        end_dist = np.hypot(*(ends_xy[i + 1:] - ends_xy[i]).T)
+        return self._path_similarity(lengths[i], lengths[i + 1:], start_dist, end_dist)
     
     def _calculate_path_similarity(self, path1: pd.DataFrame, 
                                   path2: pd.DataFrame) -> float:
-        """Calculate similarity between two path segments."""
+        """Calculate similarity between two path segments.
         
-        # Use Dynamic Time Warping or simpler metric
-        # For simplicity, using endpoint and length comparison
+        Uses endpoint and length comparison rather than Dynamic Time Warping.
+        """
+        p1 = path1[['plant_x', 'plant_y']].to_numpy(dtype=float)
+        p2 = path2[['plant_x', 'plant_y']].to_numpy(dtype=float)
         
         # Compare start and end points
-        start_dist = np.sqrt(
-            (path1.iloc[0]['plant_x'] - path2.iloc[0]['plant_x'])**2 +
-            (path1.iloc[0]['plant_y'] - path2.iloc[0]['plant_y'])**2
-        )
-        
-        end_dist = np.sqrt(
-            (path1.iloc[-1]['plant_x'] - path2.iloc[-1]['plant_x'])**2 +
-            (path1.iloc[-1]['plant_y'] - path2.iloc[-1]['plant_y'])**2
-        )
+        start_dist = np.hypot(*(p1[0] - p2[0]))
+        end_dist = np.hypot(*(p1[-1] - p2[-1]))
         
         # Compare path lengths
-        len1 = self.calculate_stats(path1)['total_distance']
-        len2 = self.calculate_stats(path2)['total_distance']
-        
-        if max(len1, len2) == 0:
-            return 0
-        
-        length_similarity = min(len1, len2) / max(len1, len2)
-        
-        # Combine metrics
-        endpoint_similarity = 1 - (start_dist + end_dist) / 100  # Normalize by typical distance
-        endpoint_similarity = max(0, endpoint_similarity)
+        len1 = self._path_length(path1)
+        len2 = self._path_length(path2)
         
-        return (endpoint_similarity + length_similarity) / 2
+        return float(self._path_similarity(len1, len2, start_dist, end_dist))
     
     def predict_destination(self, agv_id: str, 
                           current_trajectory: pd.DataFrame) -> Optional[str]:
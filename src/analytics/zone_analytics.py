@@ -6,31 +6,67 @@ import numpy as np
 import pandas as pd
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
-import networkx as nx
+from scipy.sparse import csr_matrix
 from collections import defaultdict
-import json
+from threading import Lock
+from cachetools import TTLCache, cached
+import orjson
 
 from loguru import logger
-from src.core.database import db_manager
+from src.core.database import QUERY_DTYPES, db_manager
+from src.analytics._zone_kernels import AT_CAPACITY, CROWDED, SLOW, bottleneck_flags
+
+# Window covered by the mv_zone_occupancy_1h table
+OCCUPANCY_MV_WINDOW = timedelta(hours=1)
+
+
+# Active zone definitions, shared by all ZoneAnalytics instances and
+# reloaded at most once a minute
+_ZONES_CACHE = TTLCache(maxsize=1, ttl=60)
+_ZONES_LOCK = Lock()
+
+# Zone columns with few distinct values, held as categoricals
+ZONE_DTYPES = {**QUERY_DTYPES, 'category': 'category', 'zone_type': 'category'}
+
+
+@cached(_ZONES_CACHE, lock=_ZONES_LOCK)
+def _load_zones() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Load zone definitions from database, as loaded and indexed by zone_id."""
+    zones = db_manager.query_dataframe("""
+        SELECT 
+            zone_id, name, category, zone_type,
+            max_speed_mps, max_agvs, priority,
+            centroid_x, centroid_y, area_sqm
+        FROM plant_zones
+        WHERE active = TRUE
+    """, dtype_map=ZONE_DTYPES)
+    return zones, zones.set_index('zone_id', drop=False)
 
 
 class ZoneAnalytics:
     """Analyzes zone utilization and transitions."""
     
     def __init__(self):
-        self.zones = self._load_zones()
-        self.transition_graph = nx.DiGraph()
-        
-    def _load_zones(self) -> pd.DataFrame:
-        """Load zone definitions from database."""
-        return db_manager.query_dataframe("""
-            SELECT 
-                zone_id, name, category, zone_type,
-                max_speed_mps, max_agvs, priority,
-                centroid_x, centroid_y, area_sqm
-            FROM plant_zones
-            WHERE active = TRUE
-        """)
+        # Zone transition graph: transition_matrix[i, j] counts moves from
+        # transition_zones[i] to transition_zones[j]
+        self.transition_zones = np.empty(0, dtype=object)
+        self.transition_matrix = csr_matrix((0, 0))
+    
+    @property
+    def zones(self) -> pd.DataFrame:
+        """Active zone definitions (shared, treat as read-only)."""
+        return _load_zones()[0]
+    
+    @property
+    def zones_indexed(self) -> pd.DataFrame:
+        """Active zone definitions indexed by zone_id, for joins."""
+        return _load_zones()[1]
+    
+    @classmethod
+    def invalidate_zones(cls):
+        """Drop the cached zone definitions after zones are edited."""
+        with _ZONES_LOCK:
+            _ZONES_CACHE.clear()
     
     def get_zones(self) -> pd.DataFrame:
         """Get zone information."""
@@ -54,10 +90,9 @@ class ZoneAnalytics:
         stats['avg_occupancy'] = stats['total_minutes'] / stats['unique_agvs']
         
         # Merge with zone information
-        stats = stats.merge(
-            self.zones[['zone_id', 'category', 'zone_type', 'max_agvs']],
-            on='zone_id',
-            how='left'
+        stats = stats.join(
+            self.zones_indexed[['category', 'zone_type', 'max_agvs']],
+            on='zone_id'
         )
         
         # Calculate utilization
@@ -81,71 +116,99 @@ class ZoneAnalytics:
         return transitions
     
     def _build_transition_graph(self, transitions: pd.DataFrame):
-        """Build network graph of zone transitions."""
-        self.transition_graph.clear()
-        
-        for _, row in transitions.iterrows():
-            self.transition_graph.add_edge(
-                row['from_zone'],
-                row['to_zone'],
-                weight=row['transition_count']
-            )
+        """Build the sparse adjacency matrix of zone transitions."""
+        edges = len(transitions)
+        codes, zones = pd.factorize(
+            pd.concat([transitions['from_zone'], transitions['to_zone']], ignore_index=True)
+        )
+        self.transition_zones = np.asarray(zones, dtype=object)
+        self.transition_matrix = csr_matrix(
+            (transitions['transition_count'].to_numpy(), (codes[:edges], codes[edges:])),
+            shape=(len(zones), len(zones))
+        )
     
     def find_bottlenecks(self, time_window: timedelta = timedelta(hours=1)) -> List[Dict]:
         """Identify zone bottlenecks."""
         
-        end_time = datetime.now()
-        start_time = end_time - time_window
-        
-        # Get current zone occupancy
-        occupancy = db_manager.query_dataframe("""
-            SELECT 
-                zone_id,
-                COUNT(DISTINCT agv_id) as current_agvs,
-                AVG(speed_mps) as avg_speed
-            FROM agv_positions
-            WHERE ts >= %s
-            AND zone_id IS NOT NULL
-            GROUP BY zone_id
-        """, (start_time,))
+        if time_window == OCCUPANCY_MV_WINDOW:
+            # Trailing-hour occupancy is pre-aggregated every minute
+            occupancy = db_manager.query_dataframe("""
+                SELECT zone_id, current_agvs, avg_speed
+                FROM mv_zone_occupancy_1h
+            """)
+        else:
+            start_time = datetime.now() - time_window
+            
+            # Get current zone occupancy
+            occupancy = db_manager.query_dataframe("""
+                SELECT 
+                    zone_id,
+                    COUNT(DISTINCT agv_id) as current_agvs,
+                    AVG(speed_mps) as avg_speed
+                FROM agv_positions
+                WHERE ts >= %s
+                AND zone_id IS NOT NULL
+                GROUP BY zone_id
+            """, (start_time,))
         
         if occupancy.empty:
             return []
         
         # Merge with zone limits
-        occupancy = occupancy.merge(
-            self.zones[['zone_id', 'name', 'max_agvs', 'max_speed_mps']],
-            on='zone_id'
+        occupancy = occupancy.join(
+            self.zones_indexed[['name', 'max_agvs', 'max_speed_mps']],
+            on='zone_id',
+            how='inner'
         )
         
-        bottlenecks = []
-        
-        for _, zone in occupancy.iterrows():
-            # Check occupancy bottleneck
-            if zone['current_agvs'] >= zone['max_agvs'] * 0.8:
-                bottlenecks.append({
-                    'zone_id': zone['zone_id'],
-                    'zone_name': zone['name'],
-                    'type': 'OCCUPANCY',
-                    'severity': 'HIGH' if zone['current_agvs'] >= zone['max_agvs'] else 'MEDIUM',
-                    'current_agvs': int(zone['current_agvs']),
-                    'max_agvs': int(zone['max_agvs']),
-                    'utilization': float(zone['current_agvs'] / zone['max_agvs'] * 100)
-                })
-            
-            # Check speed bottleneck
-            if zone['avg_speed'] < zone['max_speed_mps'] * 0.5:
-                bottlenecks.append({
-                    'zone_id': zone['zone_id'],
-                    'zone_name': zone['name'],
-                    'type': 'SPEED',
-                    'severity': 'MEDIUM',
-                    'avg_speed': float(zone['avg_speed']),
-                    'max_speed': float(zone['max_speed_mps']),
-                    'speed_ratio': float(zone['avg_speed'] / zone['max_speed_mps'] * 100)
-                })
-        
-        return bottlenecks
+        flags = bottleneck_flags(
+            occupancy['current_agvs'].to_numpy(dtype=float),
+            occupancy['max_agvs'].to_numpy(dtype=float),
+            occupancy['avg_speed'].to_numpy(dtype=float),
+            occupancy['max_speed_mps'].to_numpy(dtype=float)
+        )
+        
+        # Occupancy bottlenecks
+        crowded = (flags & CROWDED) != 0
+        occupied = occupancy[crowded]
+        occupancy_df = pd.DataFrame({
+            'zone_id': occupied['zone_id'],
+            'zone_name': occupied['name'],
+            'type': 'OCCUPANCY',
+            'severity': np.where((flags[crowded] & AT_CAPACITY) != 0, 'HIGH', 'MEDIUM'),
+            'current_agvs': occupied['current_agvs'].astype(int),
+            'max_agvs': occupied['max_agvs'].astype(int),
+            'utilization': (occupied['current_agvs'] / occupied['max_agvs'] * 100).astype(float)
+        })
+        
+        # Speed bottlenecks
+        slow = occupancy[(flags & SLOW) != 0]
+        speed_df = pd.DataFrame({
+            'zone_id': slow['zone_id'],
+            'zone_name': slow['name'],
+            'type': 'SPEED',
+            'severity': 'MEDIUM',
+            'avg_speed': slow['avg_speed'].astype(float),
+            'max_speed': slow['max_speed_mps'].astype(float),
+            'speed_ratio': (slow['avg_speed'] / slow['max_speed_mps'] * 100).astype(float)
+        })
+        
+        return self._records_in_row_order(occupancy_df, speed_df)
+    
+    @staticmethod
+    def _records_in_row_order(*frames: pd.DataFrame) -> List[Dict]:
+        """Records of row subsets of one frame, merged back into row order.
+        
+        A row present in several frames yields one record per frame, in
+        the order the frames are given.
+        """
+        keyed = [
+            (row, k, record)
+            for k, frame in enumerate(frames)
+            for row, record in zip(frame.index, frame.to_dict('records'))
+        ]
+        keyed.sort(key=lambda item: item[:2])
+        return [record for _, _, record in keyed]
     
     def calculate_zone_flow(self, time_window: timedelta = timedelta(hours=1)) -> Dict:
         """Calculate flow rates between zones."""
@@ -176,16 +239,10 @@ class ZoneAnalytics:
     def optimize_zone_allocation(self) -> List[Dict]:
         """Suggest zone allocation optimizations."""
         
-        suggestions = []
-        
-        # Analyze historical utilization
-        historical = db_manager.query_dataframe("""
-            SELECT 
-                zone_id,
-                AVG(agv_count) as avg_agvs,
-                MAX(agv_count) as peak_agvs,
-                STD(agv_count) as std_agvs
-            FROM (
+        # Per-minute AGV counts over the last week, summarized per zone and
+        # classified against the zone limits in the same query
+        analysis = db_manager.query_dataframe("""
+            WITH minute_counts AS (
                 SELECT 
                     zone_id,
                     DATE_FORMAT(ts, '%%Y-%%m-%%d %%H:%%i') as minute,
@@ -194,57 +251,79 @@ class ZoneAnalytics:
                 WHERE ts >= NOW() - INTERVAL 7 DAY
                 AND zone_id IS NOT NULL
                 GROUP BY zone_id, minute
-            ) as minute_counts
-            GROUP BY zone_id
+            ),
+            agg AS (
+                SELECT 
+                    zone_id,
+                    AVG(agv_count) as avg_agvs,
+                    MAX(agv_count) as peak_agvs,
+                    STD(agv_count) as std_agvs
+                FROM minute_counts
+                GROUP BY zone_id
+            ),
+            classified AS (
+                SELECT 
+                    agg.zone_id,
+                    z.name,
+                    z.max_agvs,
+                    agg.avg_agvs,
+                    agg.peak_agvs,
+                    agg.std_agvs,
+                    CASE
+                        WHEN agg.avg_agvs < z.max_agvs * 0.3 THEN 'UNDER_UTILIZED'
+                        WHEN agg.peak_agvs >= z.max_agvs * 0.9 THEN 'OVER_UTILIZED'
+                    END as utilization_type,
+                    COALESCE(agg.std_agvs > agg.avg_agvs * 0.5, 0) as high_variability
+                FROM agg
+                JOIN plant_zones z ON z.zone_id = agg.zone_id
+                WHERE z.active = TRUE
+            )
+            SELECT * FROM classified
+            WHERE utilization_type IS NOT NULL OR high_variability = 1
+            ORDER BY zone_id
         """)
         
-        if historical.empty:
-            return suggestions
-        
-        # Merge with zone info
-        analysis = historical.merge(
-            self.zones[['zone_id', 'name', 'max_agvs', 'category']],
-            on='zone_id'
-        )
+        if analysis.empty:
+            return []
         
-        for _, zone in analysis.iterrows():
-            # Under-utilized zones
-            if zone['avg_agvs'] < zone['max_agvs'] * 0.3:
-                suggestions.append({
-                    'zone_id': zone['zone_id'],
-                    'zone_name': zone['name'],
-                    'type': 'UNDER_UTILIZED',
-                    'current_max': int(zone['max_agvs']),
-                    'suggested_max': int(max(2, zone['peak_agvs'] * 1.2)),
-                    'reason': 'Zone is consistently under-utilized',
-                    'potential_savings': 'Reduce allocated resources'
-                })
-            
-            # Over-utilized zones
-            elif zone['peak_agvs'] >= zone['max_agvs'] * 0.9:
-                suggestions.append({
-                    'zone_id': zone['zone_id'],
-                    'zone_name': zone['name'],
-                    'type': 'OVER_UTILIZED',
-                    'current_max': int(zone['max_agvs']),
-                    'suggested_max': int(zone['peak_agvs'] * 1.3),
-                    'reason': 'Zone frequently reaches capacity',
-                    'potential_benefit': 'Reduce congestion and wait times'
-                })
-            
-            # High variability zones
-            if zone['std_agvs'] > zone['avg_agvs'] * 0.5:
-                suggestions.append({
-                    'zone_id': zone['zone_id'],
-                    'zone_name': zone['name'],
-                    'type': 'HIGH_VARIABILITY',
-                    'current_max': int(zone['max_agvs']),
-                    'suggested_strategy': 'Implement dynamic allocation',
-                    'reason': 'Zone has highly variable demand',
-                    'std_deviation': float(zone['std_agvs'])
-                })
-        
-        return suggestions
+        # Under-utilized zones
+        under = analysis[analysis['utilization_type'] == 'UNDER_UTILIZED']
+        under_df = pd.DataFrame({
+            'zone_id': under['zone_id'],
+            'zone_name': under['name'],
+            'type': 'UNDER_UTILIZED',
+            'current_max': under['max_agvs'].astype(int),
+            'suggested_max': np.maximum(2, under['peak_agvs'] * 1.2).astype(int),
+            'reason': 'Zone is consistently under-utilized',
+            'potential_savings': 'Reduce allocated resources'
+        })
+        
+        # Over-utilized zones
+        over = analysis[analysis['utilization_type'] == 'OVER_UTILIZED']
+        over_df = pd.DataFrame({
+            'zone_id': over['zone_id'],
+            'zone_name': over['name'],
+            'type': 'OVER_UTILIZED',
+            'current_max': over['max_agvs'].astype(int),
+            'suggested_max': (over['peak_agvs'] * 1.3).astype(int),
+            'reason': 'Zone frequently reaches capacity',
+            'potential_benefit': 'Reduce congestion and wait times'
+        })
+        
+        # High variability zones
+        variable = analysis[analysis['high_variability'] == 1]
+        variable_df = pd.DataFrame({
+            'zone_id': variable['zone_id'],
+            'zone_name': variable['name'],
+            'type': 'HIGH_VARIABILITY',
+            'current_max': variable['max_agvs'].astype(int),
+            'suggested_strategy': 'Implement dynamic allocation',
+            'reason': 'Zone has highly variable demand',
+            'std_deviation': variable['std_agvs'].astype(float)
+        })
+        
+        # Utilization suggestions come before variability for each zone
+        return self._records_in_row_order(under_df, over_df, variable_df)
     
     def get_zone_heatmap_data(self, time_window: timedelta = timedelta(hours=24)) -> Dict:
         """Get zone heatmap data for visualization."""
@@ -253,7 +332,7 @@ class ZoneAnalytics:
         start_time = end_time - time_window
         
         # Get zone activity
-        activity = db_manager.query_dataframe("""
+        activity = db_manager.query_dataframe_arrow("""
             SELECT 
                 z.zone_id,
                 z.name,
@@ -267,33 +346,30 @@ class ZoneAnalytics:
                 AND p.ts BETWEEN %s AND %s
             WHERE z.active = TRUE
             GROUP BY z.zone_id, z.name, z.category, z.vertices
-        """, (start_time, end_time))
+        """, (start_time, end_time), dtype_map=ZONE_DTYPES)
         
         if activity.empty:
             return {}
         
         # Normalize activity for heatmap
         max_activity = activity['activity_count'].max()
+        intensity = (
+            activity['activity_count'] / max_activity if max_activity > 0
+            else pd.Series(0.0, index=activity.index)
+        )
         
-        heatmap_data = {
-            'zones': []
-        }
-        
-        for _, zone in activity.iterrows():
-            intensity = zone['activity_count'] / max_activity if max_activity > 0 else 0
-            
-            heatmap_data['zones'].append({
-                'zone_id': zone['zone_id'],
-                'name': zone['name'],
-                'category': zone['category'],
-                'vertices': json.loads(zone['vertices']) if zone['vertices'] else [],
-                'intensity': float(intensity),
-                'activity_count': int(zone['activity_count']),
-                'unique_agvs': int(zone['unique_agvs']),
-                'avg_speed': float(zone['avg_speed']) if zone['avg_speed'] else 0
-            })
-        
-        return heatmap_data
+        zones = pd.DataFrame({
+            'zone_id': activity['zone_id'],
+            'name': activity['name'],
+            'category': activity['category'],
+            'vertices': [orjson.loads(v) if pd.notna(v) and v else [] for v in activity['vertices']],
+            'intensity': intensity.astype(float),
+            'activity_count': activity['activity_count'].astype(int),
+            'unique_agvs': activity['unique_agvs'].astype(int),
+            'avg_speed': activity['avg_speed'].astype(float).fillna(0.0)
+        })
+        
+        return {'zones': zones.to_dict('records')}
     
     def predict_zone_demand(self, zone_id: str, 
                            forecast_hours: int = 4) -> pd.DataFrame:
@@ -314,32 +390,30 @@ class ZoneAnalytics:
         if historical.empty:
             return pd.DataFrame()
         
-        # Simple prediction based on historical average
-        current_hour = datetime.now().hour
-        current_day = datetime.now().weekday() + 1
-        
-        predictions = []
-        
-        for h in range(forecast_hours):
-            forecast_hour = (current_hour + h) % 24
-            
-            # Get historical average for this hour and day
-            hist_data = historical[
-                (historical['hour_of_day'] == forecast_hour) &
-                (historical['day_of_week'] == current_day)
-            ]
-            
-            if not hist_data.empty:
-                predicted_agvs = hist_data['agv_count'].mean()
-            else:
-                # Fall back to hour average
-                hour_data = historical[historical['hour_of_day'] == forecast_hour]
-                predicted_agvs = hour_data['agv_count'].mean() if not hour_data.empty else 0
-            
-            predictions.append({
-                'forecast_time': datetime.now() + timedelta(hours=h),
-                'predicted_agvs': round(predicted_agvs, 1),
-                'confidence': 0.8 if not hist_data.empty else 0.5
-            })
+        # Simple prediction based on historical average: mean AGV count per
+        # (day of week, hour), falling back to the hour across all days
+        day_hour_mean = historical.pivot_table(
+            index='day_of_week', columns='hour_of_day',
+            values='agv_count', aggfunc='mean'
+        ).reindex(index=range(1, 8), columns=range(24)).to_numpy(dtype=float)
+        hour_mean = historical.groupby('hour_of_day')['agv_count'].mean().reindex(
+            range(24)
+        ).to_numpy(dtype=float)
+        
+        now = datetime.now()
+        current_hour = now.hour
+        current_day = now.weekday() + 1
+        
+        offsets = np.arange(forecast_hours)
+        forecast_hours_of_day = (current_hour + offsets) % 24
+        day_hour = day_hour_mean[current_day - 1, forecast_hours_of_day]
+        has_day_hour = ~np.isnan(day_hour)
+        predicted_agvs = np.where(
+            has_day_hour, day_hour, np.nan_to_num(hour_mean[forecast_hours_of_day])
+        )
         
-        return pd.DataFrame(predictions)
\ No newline at end of file
+        return pd.DataFrame({
+            'forecast_time': [now + timedelta(hours=int(h)) for h in offsets],
+            'predicted_agvs': np.round(predicted_agvs, 1),
+            'confidence': np.where(has_day_hour, 0.8, 0.5)
+        })
@@ -4,15 +4,21 @@ FastAPI application for AGV RTLS backend API.
 
 from fastapi import FastAPI, HTTPException, Depends, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from brotli_asgi import BrotliMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
 import asyncio
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, Iterator, List, Optional, Any
 from datetime import datetime, timedelta
+from decimal import Decimal
 from pydantic import BaseModel, Field
 import os
+import hashlib
+import itertools
+import orjson
+import pandas as pd
 
 from loguru import logger
 from src.core.database import db_manager
@@ -86,6 +92,7 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down AGV RTLS API...")
     await app.state.ws_manager.disconnect_all()
+    await db_manager.close_async_pool()
 
 
 # Create FastAPI app
@@ -93,7 +100,8 @@ app = FastAPI(
     title="AGV RTLS API",
     description="Real-time Location System API for AGV Fleet Management",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add middleware
@@ -105,7 +113,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Brotli for clients that accept it, gzip otherwise
+app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1000)
+
+# Longest a streamed trajectory may hold its pooled database connection
+TRAJECTORY_STREAM_MAX_SEC = float(os.getenv('TRAJECTORY_STREAM_MAX_SEC', 120))
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Encode the DataFrame cell types orjson has no native support for."""
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _json_response(content: Any) -> Response:
+    """Serialize with orjson directly, bypassing FastAPI's jsonable_encoder.
+    
+    Used for DataFrame records and NumPy arrays, which would otherwise be
+    walked cell by cell before encoding.
+    """
+    return Response(
+        orjson.dumps(content, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json"
+    )
+
+
+def _stream_records(batches: Iterable[List[Dict]], ndjson: bool = False) -> Iterator[bytes]:
+    """Encode row batches incrementally as a JSON array or as NDJSON lines."""
+    if ndjson:
+        for rows in batches:
+            yield b"".join(orjson.dumps(row, default=_orjson_default) + b"\n" for row in rows)
+        return
+    
+    yield b"["
+    separator = b""
+    for rows in batches:
+        # Encode the batch as an array and splice its elements in
+        yield separator + orjson.dumps(rows, default=_orjson_default)[1:-1]
+        separator = b","
+    yield b"]"
 
 
 # Exception handler
@@ -137,7 +188,7 @@ async def health_check(request: Request):
     
     # Check database
     try:
-        db_manager.execute_query("SELECT 1")
+        await db_manager.execute_query_async("SELECT 1")
         db_status = "healthy"
     except:
         db_status = "unhealthy"
@@ -161,7 +212,7 @@ async def health_check(request: Request):
 @app.get("/api/agvs")
 async def get_agvs():
     """Get list of all AGVs."""
-    agvs = db_manager.execute_query("""
+    agvs = await db_manager.execute_query_async("""
         SELECT 
             agv_id, display_name, type, status,
             assigned_category, last_seen
@@ -174,7 +225,7 @@ async def get_agvs():
 @app.get("/api/agvs/{agv_id}/position")
 async def get_agv_position(agv_id: str):
     """Get current AGV position."""
-    position = db_manager.execute_query("""
+    position = await db_manager.execute_query_async("""
         SELECT 
             agv_id, ts, lat, lon, plant_x, plant_y,
             heading_deg, speed_mps, zone_id, battery_percent, status
@@ -191,22 +242,43 @@ async def get_agv_position(agv_id: str):
 
 
 @app.post("/api/agvs/{agv_id}/trajectory")
-async def get_agv_trajectory(agv_id: str, request: TrajectoryRequest):
-    """Get AGV trajectory for time range."""
+async def get_agv_trajectory(agv_id: str, request: TrajectoryRequest, http_request: Request):
+    """Get AGV trajectory for time range.
     
-    trajectory = db_manager.query_dataframe("""
+    Rows are streamed from the database in batches, as a JSON array or,
+    for clients accepting application/x-ndjson, one JSON object per line.
+    """
+    
+    # Every downsample-th position is picked in SQL, so skipped rows are
+    # never sent over the wire. The pooled connection stays checked out
+    # while the client downloads, so the stream is cut off at the first
+    # batch boundary after TRAJECTORY_STREAM_MAX_SEC.
+    batches = db_manager.iter_query("""
         SELECT 
             ts, plant_x, plant_y, heading_deg, speed_mps, zone_id
-        FROM agv_positions
-        WHERE agv_id = %s AND ts BETWEEN %s AND %s
+        FROM (
+            SELECT 
+                ts, plant_x, plant_y, heading_deg, speed_mps, zone_id,
+                ROW_NUMBER() OVER (ORDER BY ts) AS rn
+            FROM agv_positions
+            WHERE agv_id = %s AND ts BETWEEN %s AND %s
+        ) numbered
+        WHERE MOD(rn - 1, %s) = 0
         ORDER BY ts
-    """, (agv_id, request.start_time, request.end_time))
+    """, (agv_id, request.start_time, request.end_time, max(request.downsample, 1)),
+        max_seconds=TRAJECTORY_STREAM_MAX_SEC)
     
-    # Downsample if requested
-    if request.downsample > 1 and len(trajectory) > request.downsample:
-        trajectory = trajectory.iloc[::request.downsample]
+    # Run the query and read the first batch before the 200 status is sent,
+    # so database errors still surface as a 5xx response
+    first = await run_in_threadpool(next, batches, None)
+    if first is not None:
+        batches = itertools.chain([first], batches)
     
-    return trajectory.to_dict('records')
+    if "application/x-ndjson" in http_request.headers.get("accept", ""):
+        return StreamingResponse(
+            _stream_records(batches, ndjson=True), media_type="application/x-ndjson"
+        )
+    return StreamingResponse(_stream_records(batches), media_type="application/json")
 
 
 @app.get("/api/fleet/status", response_model=FleetStatusResponse)
@@ -216,7 +288,7 @@ async def get_fleet_status(request: Request):
     stats = request.app.state.performance_metrics.get_fleet_stats()
     
     # Get AGV details
-    agvs = db_manager.execute_query("""
+    agvs = await db_manager.execute_query_async("""
         SELECT 
             r.agv_id,
             r.display_name,
@@ -228,16 +300,9 @@ async def get_fleet_status(request: Request):
             p.zone_id,
             p.battery_percent
         FROM agv_registry r
-        LEFT JOIN (
-            SELECT p1.*
-            FROM agv_positions p1
-            JOIN (
-                SELECT agv_id, MAX(ts) as max_ts
-                FROM agv_positions
-                WHERE ts >= NOW() - INTERVAL 1 MINUTE
-                GROUP BY agv_id
-            ) lm ON lm.agv_id = p1.agv_id AND lm.max_ts = p1.ts
-        ) p ON r.agv_id = p.agv_id 
+        LEFT JOIN agv_latest_position p
+            ON p.agv_id = r.agv_id
+            AND p.ts >= NOW() - INTERVAL 1 MINUTE
     """)
     
     return FleetStatusResponse(
@@ -249,18 +314,50 @@ async def get_fleet_status(request: Request):
 
 
 # Zone endpoints
+# Serialized /api/zones body as (zone checksum, ETag, body)
+_zones_response: Optional[tuple] = None
+
+
 @app.get("/api/zones")
-async def get_zones():
-    """Get all zones."""
-    zones = db_manager.execute_query("""
+async def get_zones(request: Request):
+    """Get all zones.
+    
+    The serialized list is reused until the active zones change, and clients
+    revalidating with a matching ETag get 304 Not Modified.
+    """
+    global _zones_response
+    
+    # Checksum of exactly the rows and columns served below, so any change
+    # to the body is seen even within one second of the previous fill
+    version_row = await db_manager.execute_query_async("""
         SELECT 
-            zone_id, name, category, zone_type,
-            max_agvs, max_speed_mps, priority
+            COUNT(*) AS zone_count,
+            BIT_XOR(CRC32(JSON_ARRAY(
+                zone_id, name, category, zone_type,
+                max_agvs, max_speed_mps, priority
+            ))) AS checksum
         FROM plant_zones
         WHERE active = TRUE
-        ORDER BY zone_id
     """)
-    return zones
+    version = (version_row[0]['zone_count'], version_row[0]['checksum'])
+    
+    if _zones_response is None or _zones_response[0] != version:
+        zones = await db_manager.execute_query_async("""
+            SELECT 
+                zone_id, name, category, zone_type,
+                max_agvs, max_speed_mps, priority
+            FROM plant_zones
+            WHERE active = TRUE
+            ORDER BY zone_id
+        """)
+        body = orjson.dumps(zones, default=_orjson_default)
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        _zones_response = (version, etag, body)
+    
+    _, etag, body = _zones_response
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(body, media_type="application/json", headers={'ETag': etag})
 
 
 @app.post("/api/zones/statistics")
@@ -291,7 +388,7 @@ async def get_zone_statistics(request: ZoneStatsRequest):
     query += " GROUP BY z.zone_id, z.name, z.category"
     
     stats = db_manager.query_dataframe(query, tuple(params))
-    return stats.to_dict('records')
+    return _json_response(stats.to_dict('records'))
 
 
 @app.get("/api/zones/{zone_id}/occupancy")
@@ -310,7 +407,7 @@ async def get_zone_occupancy(zone_id: str, hours: int = 24):
         ORDER BY hour
     """, (zone_id, hours))
     
-    return occupancy.to_dict('records')
+    return _json_response(occupancy.to_dict('records'))
 
 
 # Analytics endpoints
@@ -350,10 +447,10 @@ async def get_anomalies(request: Request, hours: int = 24):
         LIMIT 100
     """, (hours,))
     
-    return {
+    return _json_response({
         'statistics': stats,
         'events': events.to_dict('records')
-    }
+    })
 
 
 @app.get("/api/analytics/heatmap")
@@ -369,7 +466,10 @@ async def get_heatmap(hours: int = 24, bins: int = 150):
     start_time = end_time - timedelta(hours=hours)
     
     heatmap_data = generator.generate(start_time, end_time)
-    return heatmap_data
+    
+    # Heatmap grids are NumPy arrays; orjson encodes them without a
+    # per-element Python object
+    return _json_response(heatmap_data)
 
 
 # Task endpoints
@@ -400,7 +500,7 @@ async def get_tasks(status: Optional[str] = None, limit: int = 100):
     query += " ORDER BY created_at DESC LIMIT %s"
     params.append(limit)
     
-    tasks = db_manager.execute_query(query, tuple(params))
+    tasks = await db_manager.execute_query_async(query, tuple(params))
     return tasks
 
 
@@ -409,7 +509,7 @@ async def create_task(task: Dict[str, Any]):
     """Create a new task."""
     
     # Insert task
-    db_manager.execute_query("""
+    await db_manager.execute_query_async("""
         INSERT INTO agv_tasks 
         (task_id, task_type, priority, origin_zone_id, destination_zone_id, status)
         VALUES (%s, %s, %s, %s, %s, 'PENDING')
@@ -468,7 +568,7 @@ async def get_events(
     query += " ORDER BY created_at DESC LIMIT %s"
     params.append(limit)
     
-    events = db_manager.execute_query(query, tuple(params))
+    events = await db_manager.execute_query_async(query, tuple(params))
     return events
 
 
@@ -476,7 +576,7 @@ async def get_events(
 async def acknowledge_event(event_id: int, user: str = "system"):
     """Acknowledge an event."""
     
-    db_manager.execute_query("""
+    await db_manager.execute_query_async("""
         UPDATE system_events 
         SET acknowledged = TRUE,
             acknowledged_by = %s,
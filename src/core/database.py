@@ -6,10 +6,14 @@ import asyncio
 from typing import Optional, Dict, Any, List, Generator
 from contextlib import contextmanager, asynccontextmanager
 from datetime import datetime, timedelta
+from decimal import Decimal
+from urllib.parse import quote_plus
 
+import numpy as np
 import pymysql
 import aiomysql
-from pymysql.cursors import DictCursor
+from pymysql.constants import CLIENT
+from pymysql.cursors import DictCursor, SSDictCursor
 from sqlalchemy import create_engine, text, pool
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
@@ -17,8 +21,28 @@ from dbutils.pooled_db import PooledDB
 from loguru import logger
 import pandas as pd
 
+try:
+    import connectorx as cx
+except ImportError:
+    cx = None
+
 Base = declarative_base()
 
+# Compact dtypes applied to query_dataframe results: float32 measurements
+# and categorical low-cardinality identifiers
+QUERY_DTYPES = {
+    'battery': 'float32',
+    'battery_percent': 'float32',
+    'speed_mps': 'float32',
+    'plant_x': 'float32',
+    'plant_y': 'float32',
+    'heading_deg': 'float32',
+    'agv_id': 'category',
+    'zone_id': 'category',
+    'status': 'category',
+    'type': 'category',
+}
+
 class DatabaseManager:
     """Production-grade database manager with connection pooling."""
     
@@ -54,6 +78,7 @@ class DatabaseManager:
             maxusage=None,
             setsession=['SET time_zone = "+00:00"'],
             cursorclass=DictCursor,
+            client_flag=CLIENT.MULTI_STATEMENTS,  # for query_many
             **self.config
         )
     
@@ -77,14 +102,25 @@ class DatabaseManager:
     async def _create_async_pool(self):
         """Create asynchronous connection pool."""
         if not self.async_pool:
+            # aiomysql names the schema argument `db`
+            config = dict(self.config)
+            config['db'] = config.pop('database')
             self.async_pool = await aiomysql.create_pool(
                 minsize=5,
                 maxsize=20,
                 echo=False,
-                **self.config
+                init_command='SET time_zone = "+00:00"',
+                **config
             )
         return self.async_pool
     
+    async def close_async_pool(self):
+        """Close the asynchronous pool and wait for its connections."""
+        if self.async_pool:
+            self.async_pool.close()
+            await self.async_pool.wait_closed()
+            self.async_pool = None
+    
     def _init_checks(self):
         """Perform initial database checks."""
         try:
@@ -122,6 +158,18 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor whose statements commit together on exit.
+        
+        Everything executed through the cursor shares one transaction, so a
+        write loop pays a single commit (and log flush) instead of one per row.
+        Any exception rolls the whole batch back.
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+    
     @asynccontextmanager
     async def get_async_connection(self):
         """Get an async connection from the pool."""
@@ -157,6 +205,34 @@ class DatabaseManager:
                 cursor.execute(query, params)
                 return cursor.fetchall()
     
+    def iter_query(self, query: str, params: tuple = None, batch_size: int = 5000,
+                   max_seconds: Optional[float] = None) -> Generator[List[Dict], None, None]:
+        """Execute a query and yield its rows in batches of ``batch_size``.
+        
+        Rows are read through an unbuffered server-side cursor, so only one
+        batch is held in memory. The pooled connection stays checked out
+        until the generator is exhausted or closed; with ``max_seconds`` set,
+        a TimeoutError is raised (and the connection released) once that
+        long has passed, checked each time the next batch is requested.
+        """
+        deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+        with self.get_connection() as conn:
+            with conn.cursor(SSDictCursor) as cursor:
+                cursor.execute(query, params)
+                while True:
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise TimeoutError(f"Streaming query exceeded {max_seconds}s")
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+    
+    async def execute_query_async(self, query: str, params: tuple = None) -> List[Dict]:
+        """Execute a query on the async pool and return results."""
+        async with self.get_async_connection() as cursor:
+            await cursor.execute(query, params)
+            return await cursor.fetchall()
+    
     def execute_many(self, query: str, data: List[tuple], batch_size: int = 1000):
         """Execute bulk insert with batching."""
         with self.get_connection() as conn:
@@ -167,12 +243,132 @@ class DatabaseManager:
                     conn.commit()
                     logger.debug(f"Inserted batch {i//batch_size + 1}")
     
-    def query_dataframe(self, query, params= None) -> pd.DataFrame:
-        """Execute query and return as pandas DataFrame."""
+    def query_dataframe(self, query, params= None,
+                        dtype_map: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Execute query and return as pandas DataFrame.
+        
+        Columns named in ``dtype_map`` (QUERY_DTYPES by default) are cast to
+        the given dtype; pass ``{}`` to keep pandas' inferred dtypes.
+        """
         if isinstance(params, list):
             params = tuple(params)
+        if dtype_map is None:
+            dtype_map = QUERY_DTYPES
         with self.get_connection() as conn:
-            return pd.read_sql_query(sql=query, con=self.engine, params=params)
+            df = pd.read_sql_query(sql=query, con=self.engine, params=params)
+        
+        casts = {col: dtype for col, dtype in dtype_map.items() if col in df.columns}
+        return df.astype(casts, copy=False) if casts else df
+    
+    def query_arrow(self, query: str, params: tuple = None):
+        """Execute a SELECT through connectorx and return a pyarrow Table.
+        
+        Rows are decoded straight into Arrow columns without building
+        Python objects per cell. connectorx takes no bind parameters, so
+        ``params`` are escaped into the statement first. Stored procedure
+        calls are not supported.
+        """
+        if cx is None:
+            raise RuntimeError("connectorx is not installed")
+        if params is not None:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    query = cursor.mogrify(query, params)
+        return cx.read_sql(self._connectorx_url(), query, return_type='arrow')
+    
+    def query_dataframe_arrow(self, query: str, params: tuple = None,
+                              dtype_map: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Like query_dataframe, but materialized through Arrow when available.
+        
+        Columns are Arrow-backed (strings stay Arrow strings) apart from the
+        ``dtype_map`` casts. Falls back to query_dataframe when connectorx
+        is not installed.
+        """
+        if cx is None:
+            return self.query_dataframe(query, params, dtype_map)
+        if dtype_map is None:
+            dtype_map = QUERY_DTYPES
+        
+        df = self.query_arrow(query, params).to_pandas(
+            types_mapper=pd.ArrowDtype, self_destruct=True
+        )
+        casts = {col: dtype for col, dtype in dtype_map.items() if col in df.columns}
+        return df.astype(casts, copy=False) if casts else df
+    
+    def _connectorx_url(self) -> str:
+        """Connection URL for connectorx, built from the pool configuration."""
+        return (f"mysql://{quote_plus(self.config['user'])}:{quote_plus(self.config['password'])}"
+                f"@{self.config['host']}:{self.config['port']}/{self.config['database']}")
+    
+    def query_columnar(self, query: str, params: tuple = None,
+                       dtypes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Execute a query and return its result as one array per column.
+        
+        ``dtypes`` maps column names to a NumPy dtype or ``'category'``;
+        other columns are inferred (numbers -> int64/float64, anything else
+        -> object). ``pd.DataFrame(result)`` then gets one contiguous
+        buffer per column instead of going through row records.
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return self._fetch_columns(cursor, dtypes)
+    
+    @classmethod
+    def _fetch_columns(cls, cursor, dtypes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Read the cursor's current result set into per-column arrays."""
+        names = [col[0] for col in cursor.description or ()]
+        rows = cursor.fetchall()
+        dtypes = dtypes or {}
+        return {
+            name: cls._column_array([row[name] for row in rows], dtypes.get(name))
+            for name in names
+        }
+    
+    @staticmethod
+    def _column_array(values: List[Any], dtype: Any = None):
+        """Convert one column of values to an array of the given or inferred dtype."""
+        if isinstance(dtype, str) and dtype == 'category':
+            return pd.Categorical(values)
+        if dtype is not None:
+            return np.asarray(values, dtype=dtype)  # NULL -> NaN for float dtypes
+        
+        kinds = {type(v) for v in values if v is not None}
+        if kinds and kinds <= {int, float, Decimal}:
+            if kinds == {int} and len(values) == sum(1 for v in values if v is not None):
+                return np.asarray(values, dtype=np.int64)
+            return np.asarray(values, dtype=np.float64)
+        return np.asarray(values, dtype=object)
+    
+    def query_many(self, queries: List[str],
+                   params_list: Optional[List[Optional[tuple]]] = None,
+                   dtypes_list: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[pd.DataFrame]:
+        """Run several SELECTs in one round-trip and return a DataFrame per query.
+        
+        The statements are bound client-side and sent as a single
+        multi-statement batch, so small dashboard queries pay one network
+        round-trip between them instead of one each. Frames are built
+        column-wise as in query_columnar, with optional per-query dtypes.
+        """
+        if params_list is None:
+            params_list = [None] * len(queries)
+        if dtypes_list is None:
+            dtypes_list = [None] * len(queries)
+        
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                batch = ';\n'.join(
+                    cursor.mogrify(query.strip().rstrip(';'), params)
+                    for query, params in zip(queries, params_list)
+                )
+                cursor.execute(batch)
+                
+                frames = []
+                for dtypes in dtypes_list:
+                    frames.append(pd.DataFrame(self._fetch_columns(cursor, dtypes)))
+                    if not cursor.nextset():
+                        break
+                return frames
     
     async def insert_position(self, data: Dict) -> int:
         """Insert a single position record asynchronously."""
@@ -14,6 +14,25 @@ import geopandas as gpd
 from loguru import logger
 
 
+def affine_residuals(affine_matrix: np.ndarray, world_coords: np.ndarray,
+                     plant_coords: np.ndarray) -> np.ndarray:
+    """Per-point 2D error of a fitted affine transform.
+    
+    ``affine_matrix`` is in least-squares layout (``world_coords @ M``);
+    coordinate arrays are Nx3 homogeneous rows.
+    """
+    diff = (world_coords @ affine_matrix)[:, :2] - plant_coords[:, :2]
+    return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+
+def split_affine(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Split a 3x3 homogeneous affine matrix into its 2x2 linear part and offset.
+    
+    Applying ``A @ xy + t`` avoids padding every point with a ones column.
+    """
+    return matrix[:2, :2], matrix[:2, 2]
+
+
 class TransformManager:
     """Manages coordinate transformations and zone detection."""
     
@@ -21,6 +40,7 @@ class TransformManager:
         self.config = self._load_config()
         self.transformer = self._init_transformer()
         self.affine_matrix = self._load_affine()
+        self._affine_linear, self._affine_offset = split_affine(self.affine_matrix)
         self.zones = self._load_zones()
         self.cache = {}
     
@@ -46,6 +66,17 @@ class TransformManager:
             always_xy=True
         )
     
+    def transform_array(self, lon, lat) -> Tuple[np.ndarray, np.ndarray]:
+        """Project arrays of WGS84 lon/lat to UTM in a single PROJ call."""
+        return self.transformer.transform(
+            np.asarray(lon, dtype=np.float64),
+            np.asarray(lat, dtype=np.float64)
+        )
+    
+    def apply_affine(self, world_xy: np.ndarray) -> np.ndarray:
+        """Apply the affine transform to an Nx2 array of world coordinates."""
+        return np.asarray(world_xy, dtype=np.float64) @ self._affine_linear.T + self._affine_offset
+    
     def _load_affine(self) -> Optional[np.ndarray]:
         """Load affine transformation matrix."""
         affine_paths = [
@@ -97,8 +128,7 @@ class TransformManager:
         
         # Apply affine transformation if available
         if self.affine_matrix is not None:
-            coords = np.array([utm_x, utm_y, 1.0])
-            plant_coords = self.affine_matrix @ coords
+            plant_coords = self._affine_linear @ np.array([utm_x, utm_y]) + self._affine_offset
             plant_x, plant_y = plant_coords[0], plant_coords[1]
         else:
             plant_x, plant_y = utm_x, utm_y
@@ -149,13 +179,9 @@ class TransformManager:
         )
         
         # Validate transformation
-        errors = []
-        for wc, pc in zip(world_coords, plant_coords):
-            predicted = affine_matrix.T @ wc
-            error = np.linalg.norm(predicted[:2] - pc[:2])
-            errors.append(error)
+        errors = affine_residuals(affine_matrix, world_coords, plant_coords)
         
-        mean_error = np.mean(errors)
+        mean_error = errors.mean()
         logger.info(f"Calibration complete. Mean error: {mean_error:.3f} meters")
         
         if mean_error > 1.0:
@@ -167,4 +193,5 @@ class TransformManager:
         np.save(save_path, affine_matrix.T)
         
         self.affine_matrix = affine_matrix.T
+        self._affine_linear, self._affine_offset = split_affine(self.affine_matrix)
         return affine_matrix.T
\ No newline at end of file
@@ -3,6 +3,7 @@ Zone management for AGV RTLS system.
 """
 
 import json
+import sys
 from typing import Dict, List, Tuple, Optional, Any
 from datetime import datetime, timedelta
 import numpy as np
@@ -217,6 +218,15 @@ class ZoneManager:
         """Get all zones."""
         return self.zones
     
+    @staticmethod
+    def invalidate_caches():
+        """Drop zone definitions cached by other components after an edit."""
+        # Looked up rather than imported (src.analytics depends on src.core);
+        # if ZoneAnalytics was never loaded there is nothing cached
+        zone_analytics = sys.modules.get('src.analytics.zone_analytics')
+        if zone_analytics is not None:
+            zone_analytics.ZoneAnalytics.invalidate_zones()
+    
     def create_zone(self, zone_data: Dict) -> bool:
         """Create a new zone."""
         try:
@@ -241,6 +251,7 @@ class ZoneManager:
             
             # Reload zones
             self.load_zones()
+            self.invalidate_caches()
             
             logger.info(f"Created zone {zone_data['zone_id']}")
             return True
@@ -274,6 +285,7 @@ class ZoneManager:
             
             # Reload zones
             self.load_zones()
+            self.invalidate_caches()
             
             logger.info(f"Updated zone {zone_id}")
             return True
@@ -296,6 +308,7 @@ class ZoneManager:
                 del self.zones[zone_id]
             if zone_id in self.zone_polygons:
                 del self.zone_polygons[zone_id]
+            self.invalidate_caches()
             
             logger.info(f"Deleted zone {zone_id}")
             return True
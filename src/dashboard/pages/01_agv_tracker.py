@@ -290,7 +290,7 @@ def render_page():
                         st.write(f"Found {len(stops)} stops")
                         
                         # Display stops table
-                        stops_df = pd.DataFrame(stops)
+                        stops_df = pd.DataFrame.from_records(stops)
                         st.dataframe(stops_df, use_container_width=True)
                     else:
                         st.info("No stops detected in selected time range")
@@ -11,6 +11,7 @@ from threading import Lock
 import signal
 import sys
 
+import ormsgpack
 import paho.mqtt.client as mqtt
 from asyncio_mqtt import Client as AsyncMQTTClient
 from loguru import logger
@@ -54,6 +55,11 @@ class MQTTConsumer:
             'broker': os.getenv('MQTT_BROKER', 'localhost'),
             'port': int(os.getenv('MQTT_PORT', 1883)),
             'topic': os.getenv('MQTT_TOPIC', 'rtls/+/position'),
+            # Same records encoded as MessagePack
+            'msgpack_topic': os.getenv('MQTT_MSGPACK_TOPIC', 'rtls/+/position.msgpack'),
+            # Whole-fleet snapshots, one array of records per message
+            'fleet_topic': os.getenv('MQTT_FLEET_TOPIC', 'rtls/fleet/positions'),
+            'fleet_msgpack_topic': os.getenv('MQTT_FLEET_MSGPACK_TOPIC', 'rtls/fleet/positions.msgpack'),
             'qos': int(os.getenv('MQTT_QOS', 1)),
             'username': os.getenv('MQTT_USERNAME'),
             'password': os.getenv('MQTT_PASSWORD'),
@@ -77,8 +83,10 @@ class MQTTConsumer:
         """Callback for MQTT connection."""
         if rc == 0:
             logger.info(f"Connected to MQTT broker at {self.config['broker']}")
-            client.subscribe(self.config['topic'], qos=self.config['qos'])
-            logger.info(f"Subscribed to topic: {self.config['topic']}")
+            for topic in (self.config['topic'], self.config['msgpack_topic'],
+                          self.config['fleet_topic'], self.config['fleet_msgpack_topic']):
+                client.subscribe(topic, qos=self.config['qos'])
+                logger.info(f"Subscribed to topic: {topic}")
         else:
             logger.error(f"Failed to connect, return code: {rc}")
     
@@ -94,7 +102,12 @@ class MQTTConsumer:
                 logger.error(f"Reconnection failed: {e}")
     
     def on_message(self, client, userdata, msg):
-        """Process incoming MQTT message."""
+        """Process incoming MQTT message.
+        
+        A payload may hold a single position record or, for fleet snapshot
+        topics, an array of records. Topics ending in ``.msgpack`` carry
+        MessagePack, all others JSON.
+        """
         try:
             # Update stats
             with self.stats_lock:
@@ -102,10 +115,25 @@ class MQTTConsumer:
                 self.stats['last_message_time'] = time.time()
             
             # Parse message
-            data = json.loads(msg.payload.decode('utf-8'))
-            
+            if msg.topic.endswith('.msgpack'):
+                payload = ormsgpack.unpackb(msg.payload)
+            else:
+                payload = json.loads(msg.payload.decode('utf-8'))
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            with self.stats_lock:
+                self.stats['messages_failed'] += 1
+            return
+        
+        records = payload if isinstance(payload, list) else [payload]
+        for data in records:
+            self._process_record(data, msg.topic)
+    
+    def _process_record(self, data: Dict[str, Any], topic: str):
+        """Validate, enrich and buffer a single position record."""
+        try:
             # Extract AGV ID from topic or payload
-            topic_parts = msg.topic.split('/')
+            topic_parts = topic.split('/')
             if len(topic_parts) >= 2:
                 data['agv_id'] = data.get('agv_id', topic_parts[1])
             
@@ -185,6 +213,45 @@ class MQTTConsumer:
             # Re-add failed items to buffer
             for item in batch:
                 self.buffer.add(item, retry=True)
+            return
+        
+        # The positions are stored; a failure here must not re-queue them
+        try:
+            self._update_latest_positions(data_tuples)
+        except Exception as e:
+            logger.warning(f"Failed to update latest positions: {e}")
+    
+    def _update_latest_positions(self, data_tuples: List[tuple]):
+        """Upsert the newest row per AGV of a flushed batch into agv_latest_position."""
+        latest = {}
+        for row in data_tuples:
+            current = latest.get(row[1])
+            if current is None or row[0] >= current[0]:
+                latest[row[1]] = row
+        
+        # Columns are only overwritten by a newer sample; ts is assigned
+        # last because MySQL evaluates the assignments left to right
+        upsert_query = """
+            INSERT INTO agv_latest_position (
+                ts, agv_id, heading_deg, speed_mps,
+                plant_x, plant_y, zone_id, battery_percent, status
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                heading_deg = IF(VALUES(ts) >= ts, VALUES(heading_deg), heading_deg),
+                speed_mps = IF(VALUES(ts) >= ts, VALUES(speed_mps), speed_mps),
+                plant_x = IF(VALUES(ts) >= ts, VALUES(plant_x), plant_x),
+                plant_y = IF(VALUES(ts) >= ts, VALUES(plant_y), plant_y),
+                zone_id = IF(VALUES(ts) >= ts, VALUES(zone_id), zone_id),
+                battery_percent = IF(VALUES(ts) >= ts, VALUES(battery_percent), battery_percent),
+                status = IF(VALUES(ts) >= ts, VALUES(status), status),
+                ts = GREATEST(ts, VALUES(ts))
+        """
+        db_manager.execute_many(
+            upsert_query,
+            [(ts, agv_id, heading, speed, x, y, zone, battery, status)
+             for ts, agv_id, _lat, _lon, heading, speed, _quality, x, y, zone, battery, status
+             in latest.values()]
+        )
     
     def _parse_timestamp(self, ts_str: Any) -> datetime:
         """Parse timestamp from various formats."""
@@ -304,6 +371,9 @@ class MQTTConsumer:
         if not self.buffer.is_empty():
             self._flush_buffer()
         
+        # Write anomaly events still waiting for their batch
+        self.anomaly_detector.flush_events()
+        
         # Disconnect MQTT
         if self.client:
             self.client.disconnect()